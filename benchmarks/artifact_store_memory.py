@@ -0,0 +1,79 @@
+"""
+Compare the memory use and load latency of the file storage backends, with
+several worker processes each loading the filtered DF, as with several gunicorn
+workers.
+
+For each worker, reports the time to load the DF, and the increase in its resident
+set size (RSS) and unique set size (USS, the memory not shared with other
+processes) after loading it and reading every column. Memory-mapped pages are
+counted in RSS but are shared through the OS page cache, so do not add to USS.
+
+Usage: python benchmarks/artifact_store_memory.py [n_rows] [n_cols] [n_workers]
+"""
+import sys
+import time
+import tempfile
+import multiprocessing
+import numpy as np
+import pandas as pd
+import psutil
+from psych_dashboard.storage import backends
+
+
+def load_in_worker(storage_backend, directory):
+    backend = backends[storage_backend](directory)
+    process = psutil.Process()
+    before = process.memory_full_info()
+
+    ts = time.time()
+    dff = backend.get("filtered")
+    elapsed = time.time() - ts
+    # Touch every column, as a callback working through the data would
+    dff.sum()
+
+    after = process.memory_full_info()
+    return elapsed, after.rss - before.rss, after.uss - before.uss
+
+
+def main(n_rows=40000, n_cols=1000, n_workers=4):
+    rng = np.random.default_rng(0)
+    index = pd.MultiIndex.from_arrays(
+        [
+            [f"NDAR_INV{i // 2:08d}" for i in range(n_rows)],
+            ["baseline" if i % 2 == 0 else "followup" for i in range(n_rows)],
+        ],
+        names=["SUBJECTKEY", "EVENTNAME"],
+    )
+    df = pd.DataFrame(
+        rng.normal(size=(n_rows, n_cols)),
+        index=index,
+        columns=[f"var{i}" for i in range(n_cols)],
+    )
+    df[rng.random(size=df.shape) < 0.05] = np.nan
+    mib = 1024 ** 2
+    print(f"{n_rows} rows x {n_cols} columns ({df.memory_usage().sum() / mib:.0f} MiB)")
+
+    context = multiprocessing.get_context("spawn")
+    for storage_backend in ["feather", "arrow_mmap"]:
+        with tempfile.TemporaryDirectory() as directory:
+            backend = backends[storage_backend](directory)
+            backend.put("filtered", df)
+            size = backend.size("filtered")
+
+            with context.Pool(n_workers) as pool:
+                results = pool.starmap(
+                    load_in_worker, [(storage_backend, directory)] * n_workers
+                )
+
+        elapsed, rss, uss = np.array(results).T
+        print(
+            f"{storage_backend:>10}: file {size / mib:6.0f} MiB  "
+            f"load {elapsed.mean():6.2f} s  "
+            f"RSS/worker {rss.mean() / mib:6.0f} MiB  "
+            f"USS/worker {uss.mean() / mib:6.0f} MiB  "
+            f"total USS {uss.sum() / mib:6.0f} MiB"
+        )
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:4]])
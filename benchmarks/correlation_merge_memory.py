@@ -0,0 +1,46 @@
+"""
+Measure the time and peak memory of an incremental update of the heatmap
+correlations: the correlations of the first n_existing columns are already in the
+correlation cache, and the remaining columns are new.
+
+Usage: python benchmarks/correlation_merge_memory.py [n_rows] [n_cols] [n_existing]
+"""
+import os
+import sys
+import time
+import tempfile
+import tracemalloc
+import numpy as np
+import pandas as pd
+from psych_dashboard.correlation_cache import CorrelationCache
+from psych_dashboard.summary.summary_heatmap import recalculate_corr_etc
+
+
+def main(n_rows=2000, n_cols=3000, n_existing=2000):
+    rng = np.random.default_rng(0)
+    dff = pd.DataFrame(
+        rng.normal(size=(n_rows, n_cols)), columns=[f"v{i}" for i in range(n_cols)]
+    )
+    dff[dff > 2.5] = np.nan
+    columns = list(dff.columns)
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "cache.feather")
+        recalculate_corr_etc(columns[:n_existing], dff, CorrelationCache(path, 10 ** 8))
+        cache = CorrelationCache(path, 10 ** 8)
+
+        tracemalloc.start()
+        ts = time.time()
+        recalculate_corr_etc(columns, dff, cache)
+        elapsed = time.time() - ts
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    print(
+        f"{n_rows} rows, {n_existing} existing + {n_cols - n_existing} new columns: "
+        f"{elapsed:.2f} s, peak traced memory {peak / 2 ** 20:.0f} MiB"
+    )
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:4]])
@@ -0,0 +1,32 @@
+"""
+Measure the scaling of the tiled correlation calculation with the number of worker
+processes, on a synthetic dataset with some missing values.
+
+Usage: python benchmarks/correlation_scaling.py [n_rows] [n_cols]
+"""
+import sys
+import time
+import numpy as np
+from psych_dashboard.correlation import tiled_pairwise_pearson
+
+
+def main(n_rows=10000, n_cols=2000, block_size=250):
+    rng = np.random.default_rng(0)
+    data = rng.normal(size=(n_rows, n_cols))
+    data[rng.random(size=data.shape) < 0.05] = np.nan
+
+    print(f"{n_rows} rows x {n_cols} columns, tiles of {block_size} columns")
+    baseline = None
+    for n_workers in [1, 2, 4, 8, 16]:
+        ts = time.time()
+        tiled_pairwise_pearson(data, n_workers=n_workers, block_size=block_size)
+        elapsed = time.time() - ts
+        baseline = baseline or elapsed
+        print(
+            f"workers: {n_workers:2d}  time: {elapsed:7.2f} s  "
+            f"speedup: {baseline / elapsed:5.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:3]])
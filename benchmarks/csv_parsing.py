@@ -0,0 +1,62 @@
+"""
+Time parsing a synthetic wide CSV file, as uploaded, with the pandas and the arrow
+parse engines, and check that both give the same dtypes.
+
+The table has a SUBJECTKEY and EVENTNAME column, then n_cols columns that are in turn
+floats with missing values, integers, integers with missing values and short
+strings.
+
+Usage: python benchmarks/csv_parsing.py [n_rows] [n_cols]
+"""
+import os
+import sys
+import time
+import numpy as np
+import pandas as pd
+from psych_dashboard.parsing import read_data_file
+
+
+def make_csv(n_rows, n_cols):
+    rng = np.random.default_rng(0)
+    columns = {
+        "SUBJECTKEY": [f"NDAR_INV{i // 2:08d}" for i in range(n_rows)],
+        "EVENTNAME": ["baseline" if i % 2 == 0 else "followup" for i in range(n_rows)],
+    }
+    for i in range(n_cols):
+        kind = i % 4
+        if kind == 0:
+            values = rng.normal(size=n_rows).round(4)
+            values[rng.random(n_rows) < 0.1] = np.nan
+        elif kind == 1:
+            values = rng.integers(0, 100, n_rows)
+        elif kind == 2:
+            values = rng.integers(0, 100, n_rows).astype(float)
+            values[rng.random(n_rows) < 0.1] = np.nan
+        else:
+            values = rng.choice(["yes", "no", "unknown"], n_rows)
+        columns[f"var{i}"] = values
+    return pd.DataFrame(columns).to_csv(index=False).encode()
+
+
+def main(n_rows=20000, n_cols=1000):
+    decoded = make_csv(n_rows, n_cols)
+    mib = 1024 ** 2
+    print(
+        f"{n_rows} rows x {n_cols} columns, {len(decoded) / mib:.0f} MiB of CSV, "
+        f"{os.cpu_count()} CPUs"
+    )
+
+    dtypes = {}
+    for engine in ["pandas", "arrow"]:
+        ts = time.time()
+        df = read_data_file(decoded, "data.csv", engine)
+        elapsed = time.time() - ts
+        dtypes[engine] = df.dtypes
+        print(f"{engine:>6}: {elapsed:6.2f} s  {len(decoded) / mib / elapsed:6.0f} MiB/s")
+        del df
+
+    print(f"Same dtypes: {dtypes['pandas'].equals(dtypes['arrow'])}")
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:3]])
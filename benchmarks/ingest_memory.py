@@ -0,0 +1,67 @@
+"""
+Compare the peak memory of ingesting a data file through an upload, as
+parse_input_data_file does (the base64 contents sent by dcc.Upload, decoded to bytes
+and then parsed), with reading the file directly from disk, as for files on the
+server.
+
+Each ingestion runs in a process of its own, which reports the increase in its peak
+resident set size over that after importing, against the memory of the final DF. The
+upload figures leave out the copies made by the web server in receiving the JSON
+request, so the true peak of an upload is higher.
+
+Usage: python benchmarks/ingest_memory.py [n_rows] [n_cols]
+"""
+import sys
+import base64
+import resource
+import tempfile
+import multiprocessing
+import numpy as np
+import pandas as pd
+import psutil
+from psych_dashboard.parsing import read_data_file
+
+
+def ingest(mode, path, engine):
+    process = psutil.Process()
+    baseline = process.memory_info().rss
+    if mode == "upload":
+        with open(path, "rb") as f:
+            contents = "data:text/csv;base64," + base64.b64encode(f.read()).decode()
+        content_type, content_string = contents.split(",")
+        decoded = base64.b64decode(content_string)
+        df = read_data_file(decoded, path, engine)
+    else:
+        df = read_data_file(path, path, engine)
+    # ru_maxrss is in KiB on Linux
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    return peak - baseline, df.memory_usage(index=True, deep=True).sum()
+
+
+def main(n_rows=20000, n_cols=1000):
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame(
+        rng.normal(size=(n_rows, n_cols)).round(4),
+        columns=[f"var{i}" for i in range(n_cols)],
+    )
+    df.insert(0, "SUBJECTKEY", [f"NDAR_INV{i:08d}" for i in range(n_rows)])
+    df.insert(1, "EVENTNAME", "baseline")
+    mib = 1024 ** 2
+
+    context = multiprocessing.get_context("spawn")
+    with tempfile.NamedTemporaryFile(suffix=".csv") as f:
+        df.to_csv(f.name, index=False)
+        size = f.seek(0, 2)
+        print(f"{n_rows} rows x {n_cols} columns, {size / mib:.0f} MiB of CSV")
+        for engine in ["arrow", "pandas"]:
+            for mode in ["upload", "server"]:
+                with context.Pool(1) as pool:
+                    peak, df_bytes = pool.apply(ingest, (mode, f.name, engine))
+                print(
+                    f"{engine:>6} {mode:>6}: peak {peak / mib:6.0f} MiB  "
+                    f"DF {df_bytes / mib:6.0f} MiB  ratio {peak / df_bytes:5.2f}"
+                )
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:3]])
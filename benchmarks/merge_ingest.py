@@ -0,0 +1,110 @@
+"""
+Compare ways of ingesting several instrument tables of a synthetic longitudinal
+release, joined on SUBJECTKEY and EVENTNAME into a single DF:
+- "concat": each table parsed in turn, indexed with set_index, and the tables joined
+  with pd.concat(axis=1) and sorted
+- "read_data_files": merge.read_data_files, with 1 worker and with workers (the
+  files parsed in parallel, and joined on the codes of the index)
+
+Each ingestion runs in a process of its own, which reports its time and the increase
+in its peak resident set size over that after importing, against the memory of the
+final DF.
+
+Each of the n_files tables has a row for each of n_waves waves of most of n_subjects
+subjects (each table leaves out a different tenth), n_cols float columns and the
+interview age, and is written as tab-delimited text, as the ABCD instruments are.
+
+Usage: python benchmarks/merge_ingest.py [n_files] [n_subjects] [n_waves] [n_cols]
+  [workers]
+"""
+import os
+import sys
+import time
+import resource
+import tempfile
+import multiprocessing
+import numpy as np
+import pandas as pd
+import psutil
+from psych_dashboard.merge import read_data_files
+from psych_dashboard.parsing import read_data_file
+
+indices = ["SUBJECTKEY", "EVENTNAME"]
+
+
+def concat(paths):
+    frames = []
+    for path in paths:
+        df = read_data_file(path, path)
+        df["SUBJECTKEY"] = df["SUBJECTKEY"].str.replace(
+            "NDARINV", "NDAR_INV", regex=False
+        )
+        frames.append(df.set_index(indices, verify_integrity=True))
+    return pd.concat(frames, axis=1).sort_index()
+
+
+def ingest(method, paths, workers):
+    process = psutil.Process()
+    baseline = process.memory_info().rss
+    ts = time.time()
+    if method == "concat":
+        df = concat(paths)
+    else:
+        df = read_data_files(paths, paths, indices, workers=workers)[0]
+    seconds = time.time() - ts
+    # ru_maxrss is in KiB on Linux
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    return seconds, peak - baseline, df.memory_usage(deep=True).sum(), len(df)
+
+
+def write_instrument(path, i, n_subjects, n_waves, n_cols):
+    rng = np.random.default_rng(i)
+    subjects = [
+        f"NDAR_INV{s:08d}" if s % 2 else f"NDARINV{s:08d}"
+        for s in range(n_subjects)
+        if s % 10 != i % 10
+    ]
+    waves = ["baseline_year_1_arm_1"] + [
+        f"{year}_year_follow_up_y_arm_1" for year in range(1, n_waves)
+    ]
+    df = pd.DataFrame(
+        rng.normal(size=(len(subjects) * n_waves, n_cols)).round(4),
+        columns=[f"instrument{i}_var{j}" for j in range(n_cols)],
+    )
+    df.insert(0, "SUBJECTKEY", np.repeat(subjects, n_waves))
+    df.insert(1, "EVENTNAME", np.tile(waves, len(subjects)))
+    df.insert(2, "INTERVIEW_AGE", rng.integers(108, 190, len(df)))
+    df.sample(frac=1, random_state=i).to_csv(path, sep="\t", index=False)
+
+
+def main(n_files=20, n_subjects=10000, n_waves=2, n_cols=50, workers=None):
+    workers = workers or os.cpu_count()
+    mib = 1024 ** 2
+    context = multiprocessing.get_context("spawn")
+    with tempfile.TemporaryDirectory() as directory:
+        paths = [os.path.join(directory, f"abcd_{i:03d}.txt") for i in range(n_files)]
+        for i, path in enumerate(paths):
+            write_instrument(path, i, n_subjects, n_waves, n_cols)
+        size = sum(os.path.getsize(path) for path in paths)
+        print(
+            f"{n_files} files of up to {n_subjects * n_waves} rows x {n_cols + 3} "
+            f"columns, {size / mib:.0f} MiB of text"
+        )
+        for method, method_workers in [
+            ("concat", 1),
+            ("read_data_files", 1),
+            ("read_data_files", workers),
+        ]:
+            with context.Pool(1) as pool:
+                seconds, peak, df_bytes, n_rows = pool.apply(
+                    ingest, (method, paths, method_workers)
+                )
+            print(
+                f"{method:>15}, {method_workers} workers: {seconds:6.2f} s, "
+                f"peak {peak / mib:6.0f} MiB for a DF of {df_bytes / mib:.0f} MiB "
+                f"({n_rows} rows)"
+            )
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:6]])
@@ -0,0 +1,69 @@
+"""
+Time storing and loading the main DF with each storage backend: a full load, a load
+of a few columns, and a load of just the schema (head=0).
+
+The Redis backend is included if the environment variable REDIS_URL is set.
+
+Usage: python benchmarks/storage_backends.py [n_rows] [n_cols]
+"""
+import os
+import sys
+import time
+import tempfile
+import numpy as np
+import pandas as pd
+from psych_dashboard.storage import backends, RedisBackend
+
+
+def make_backend(name, directory):
+    if backends[name] is not RedisBackend:
+        return backends[name](directory)
+    import redis
+
+    return RedisBackend(redis.Redis.from_url(os.environ["REDIS_URL"]))
+
+
+def timed(f, *args, **kwargs):
+    ts = time.time()
+    f(*args, **kwargs)
+    return time.time() - ts
+
+
+def main(n_rows=40000, n_cols=1000):
+    rng = np.random.default_rng(0)
+    index = pd.MultiIndex.from_arrays(
+        [
+            [f"NDAR_INV{i // 2:08d}" for i in range(n_rows)],
+            ["baseline" if i % 2 == 0 else "followup" for i in range(n_rows)],
+        ],
+        names=["SUBJECTKEY", "EVENTNAME"],
+    )
+    df = pd.DataFrame(
+        rng.normal(size=(n_rows, n_cols)).round(2),
+        index=index,
+        columns=[f"var{i}" for i in range(n_cols)],
+    )
+    df[rng.random(size=df.shape) < 0.05] = np.nan
+    columns = list(df.columns[:5])
+
+    print(f"{n_rows} rows x {n_cols} columns")
+    names = [name for name in backends if name != "redis" or "REDIS_URL" in os.environ]
+    for name in names:
+        with tempfile.TemporaryDirectory() as directory:
+            backend = make_backend(name, directory)
+            put = timed(backend.put, "df", df)
+            get = timed(backend.get, "df")
+            get_columns = timed(backend.get, "df", columns=columns)
+            get_schema = timed(backend.get, "df", head=0)
+            size = backend.size("df")
+            backend.invalidate("df")
+
+        print(
+            f"{name:>10}: size {size / 1024 ** 2:6.0f} MiB  put {put:6.2f} s  "
+            f"get {get:6.2f} s  get 5 columns {get_columns:6.3f} s  "
+            f"get schema {get_schema:6.3f} s"
+        )
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:3]])
@@ -0,0 +1,89 @@
+"""
+Time building the SUBJECTKEY, EVENTNAME index of a synthetic longitudinal table, as
+update_df_loaded_div does, and check that all the ways give the same DF:
+- "apply": the subject keys standardised row by row with Series.apply, then
+  set_index(verify_integrity=True)
+- "object": set_subject_index, with the index columns parsed as strings
+- "categorical": set_subject_index, with the index columns parsed as categoricals,
+  as parse_data_file now parses them
+The parse time of the file with and without the categoricals is also shown.
+
+The table has n_subjects subjects, each with a row for each of n_waves EVENTNAME
+waves (in shuffled order), and n_cols float columns. Half the subject keys lack the
+underscore.
+
+Usage: python benchmarks/subject_index.py [n_subjects] [n_waves] [n_cols]
+"""
+import sys
+import time
+import numpy as np
+import pandas as pd
+from psych_dashboard.parsing import read_data_file
+from psych_dashboard.subject_index import set_subject_index
+
+indices = ["SUBJECTKEY", "EVENTNAME"]
+
+
+def standardise_subjectkey(subjectkey):
+    if subjectkey[4] == "_":
+        return subjectkey
+
+    return subjectkey[0:4] + "_" + subjectkey[4:]
+
+
+def apply_and_set_index(df):
+    df["SUBJECTKEY"] = df["SUBJECTKEY"].apply(standardise_subjectkey)
+    df.set_index(indices, inplace=True, verify_integrity=True, drop=True)
+
+
+def make_csv(n_subjects, n_waves, n_cols):
+    rng = np.random.default_rng(0)
+    subjects = [
+        f"NDAR_INV{i:08d}" if i % 2 else f"NDARINV{i:08d}" for i in range(n_subjects)
+    ]
+    waves = ["baseline_year_1_arm_1"] + [
+        f"{year}_year_follow_up_y_arm_1" for year in range(1, n_waves)
+    ]
+    df = pd.DataFrame(
+        rng.normal(size=(n_subjects * n_waves, n_cols)).round(4),
+        columns=[f"var{i}" for i in range(n_cols)],
+    )
+    df.insert(0, "SUBJECTKEY", np.repeat(subjects, n_waves))
+    df.insert(1, "EVENTNAME", np.tile(waves, n_subjects))
+    # Shuffle the rows, as the waves are often concatenated
+    df = df.sample(frac=1, random_state=0)
+    return df.to_csv(index=False).encode()
+
+
+def main(n_subjects=40000, n_waves=4, n_cols=20):
+    decoded = make_csv(n_subjects, n_waves, n_cols)
+    print(
+        f"{n_subjects * n_waves} rows ({n_subjects} subjects x {n_waves} waves), "
+        f"{n_cols} columns"
+    )
+
+    parsed = {}
+    for kind, categories in [("object", ()), ("categorical", indices)]:
+        ts = time.time()
+        parsed[kind] = read_data_file(decoded, "data.csv", categories=categories)
+        print(f"parse, {kind:>11} index columns: {time.time() - ts:6.3f} s")
+
+    results = {}
+    for name, kind, build in [
+        ("apply", "object", apply_and_set_index),
+        ("object", "object", lambda df: set_subject_index(df, indices)),
+        ("categorical", "categorical", lambda df: set_subject_index(df, indices)),
+    ]:
+        df = parsed[kind].copy()
+        ts = time.time()
+        build(df)
+        print(f"index, {name:>11}: {time.time() - ts:6.3f} s")
+        results[name] = df
+
+    for name in ["object", "categorical"]:
+        pd.testing.assert_frame_equal(results["apply"], results[name])
+    print("Same DF: True")
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:4]])
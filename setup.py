@@ -11,10 +11,11 @@ setup(name="psych_dashboard",
                         'numpy>=1.16.0',
                         'scipy>=1.2.0',
                         'feather-format>=0.4.0',
+                        'pyarrow>=5.0.0',
                         'dash-bootstrap-components>=0.10.0',
                         'selenium>=3.0.0',
                         'reportlab>=3.5.50',
-                        'flask-caching>=1.9.0',
+                        'redis>=3.5.0',
                         ],
       entry_points={
          'console_scripts': ['run-dashboard=psych_dashboard.index:main'],
@@ -3,6 +3,7 @@ import logging
 import dash
 import dash_bootstrap_components as dbc
 import dash_core_components as dcc
+from psych_dashboard.storage import ipc_compression
 
 app = dash.Dash(
     __name__,
@@ -13,24 +14,110 @@ server = app.server
 
 logging.basicConfig(level=logging.INFO)
 
-use_redis = False
+# Backend used to store the artifacts shared between the callbacks (see storage.py):
+# "feather" (compressed feather files), "arrow_zstd" (zstd-compressed Arrow IPC
+# files), "arrow_mmap" or "redis". "arrow_mmap" writes uncompressed Arrow IPC files
+# and memory-maps them when loading, so numeric columns are used directly from the OS
+# page cache, which is shared by all the worker processes, rather than being copied
+# into each process.
+storage_backend = os.environ.get("STORAGE_BACKEND", "feather")
 
-if use_redis:
-    from flask_caching import Cache
+if storage_backend == "redis":
+    import redis
 
-    CACHE_CONFIG = {
-        "CACHE_TYPE": "redis",
-        "CACHE_REDIS_URL": os.environ.get("REDIS_URL", "redis://localhost:6379"),
-    }
-    cache = Cache()
-    cache.init_app(app.server, config=CACHE_CONFIG)
+    redis_client = redis.Redis.from_url(
+        os.environ.get("REDIS_URL", "redis://localhost:6379")
+    )
     logging.info("Using Redis for data caching")
 else:
-    cache = None
-    logging.info("Using Feather for data caching")
+    redis_client = None
+    logging.info(f"Using {storage_backend} files for data caching")
+
+# Compression of the artifacts stored in Redis ("lz4", "zstd" or "none"), checked
+# here so that an unsupported one fails at startup, and the approximate size of each
+# of the groups of columns stored under separate keys
+redis_compression = ipc_compression(os.environ.get("REDIS_COMPRESSION", "lz4"))
+redis_chunk_bytes = 64 * 1024 ** 2
+
+# The artifacts of each session (browser page) are stored separately: with the file
+# backends, in a directory per session under storage_directory, and in Redis under a
+# key prefix per session. Sessions unused for session_ttl_seconds are deleted, as are
+# the least recently used sessions once the files of all the sessions exceed
+# storage_quota_bytes. The files are checked at most every
+# storage_gc_interval_seconds; in Redis, the keys simply expire.
+storage_directory = os.environ.get("STORAGE_DIRECTORY", "sessions")
+session_ttl_seconds = int(os.environ.get("SESSION_TTL_SECONDS", 24 * 3600))
+storage_quota_bytes = int(os.environ.get("STORAGE_QUOTA_BYTES", 10 * 1024 ** 3))
+storage_gc_interval_seconds = 60
 
 indices = ["SUBJECTKEY", "EVENTNAME"]
 
+# Directory of data files on the server which can be loaded from the browser, without
+# uploading them (None to allow none)
+data_directory = os.environ.get("DATA_DIRECTORY")
+
+# Large data files are uploaded in chunks of upload_chunk_bytes, each sent in a
+# request of its own, and written straight to a spool file in a directory per session
+# under upload_directory. Unfinished uploads can be resumed, and are deleted as the
+# stored artifacts are, after session_ttl_seconds or beyond storage_quota_bytes.
+upload_directory = os.environ.get("UPLOAD_DIRECTORY", "uploads")
+upload_chunk_bytes = 8 * 1024 ** 2
+
+# Parser of uploaded CSV/TSV files: "arrow" (the pyarrow CSV reader, which parses
+# blocks of csv_block_size bytes on several threads) or "pandas" (pd.read_csv)
+parse_engine = os.environ.get("PARSE_ENGINE", "arrow")
+csv_block_size = 16 * 1024 ** 2
+
+# Number of data files parsed at once when several are loaded together, to be joined
+# on the index columns into a single data file
+ingest_workers = int(os.environ.get("INGEST_WORKERS", os.cpu_count() or 1))
+
+# Parsed data files are cached under a hash of their contents (see
+# load_feather.parse_cache_key), so that loading the same file again, e.g. after
+# reloading the page, skips parsing it. With the file backends, each cached file is a
+# directory under parse_cache_directory, the least recently used of which are deleted
+# beyond parse_cache_max_bytes, and the sessions' artifacts are hard links to its
+# files. In Redis, the cached files expire after session_ttl_seconds.
+parse_cache_directory = os.environ.get("PARSE_CACHE_DIRECTORY", "parse_cache")
+parse_cache_max_bytes = int(os.environ.get("PARSE_CACHE_MAX_BYTES", 5 * 1024 ** 3))
+
+# Whether to convert the columns of the loaded data to more compact dtypes (see
+# dtypes.compact_dtypes), e.g. float64 to float32 or nullable integers, and strings
+# with few distinct values to categoricals. Floats are only converted to float32 if
+# their relative error is within compact_float_tolerance, and strings if their number
+# of distinct values is within compact_max_category_fraction of the number of values.
+compact_dtypes_on_load = os.environ.get("COMPACT_DTYPES", "0") == "1"
+compact_float_tolerance = 0.0
+compact_max_category_fraction = 0.5
+
+# Number of worker processes used to calculate the correlation matrix, and the number
+# of columns in each tile of the matrix given to a worker. With 1 worker, or fewer
+# columns than one tile, the calculation runs in the main process.
+correlation_workers = int(os.environ.get("CORRELATION_WORKERS", 1))
+correlation_block_size = 500
+
+# Precision used to store the condensed correlation statistics ("float32" or
+# "float64")
+condensed_stats_dtype = "float32"
+
+# File holding the correlations calculated so far, keyed by the contents of each
+# column. This is kept across restarts, and limited to the given number of pairs of
+# columns (about 40 bytes each) by discarding the least recently used pairs.
+correlation_cache_path = os.environ.get(
+    "CORRELATION_CACHE_PATH", "correlation_cache.feather"
+)
+correlation_cache_max_pairs = 5_000_000
+
+# Largest number of rows/columns of the summary heatmap sent to the browser at full
+# resolution. Above this, the heatmap is shown binned into at most heatmap_bins blocks
+# along each axis, and full resolution tiles are fetched when zooming in.
+heatmap_max_columns = 500
+heatmap_bins = 250
+
+# Memory budget, in bytes, for the artifacts kept in each process after being loaded,
+# so that repeated loads of an unchanged file do not read it again
+load_cache_max_bytes = int(os.environ.get("LOAD_CACHE_MAX_BYTES", 1024 ** 3))
+
 standard_margin_left = "10px"
 div_style = {"margin-left": standard_margin_left}
 
@@ -0,0 +1,131 @@
+// Chunked upload of large data files (see chunked_upload.py). The file chosen with
+// the #chunked-upload-button button is sent to /upload/<session id> in slices of
+// data-chunk-bytes, one request each, so neither the browser nor the server holds
+// the whole file in memory. After a failed request, the upload resumes from the
+// bytes the server has received; choosing the same file again after giving up also
+// resumes it. The progress is reported to the layout by the clientside callback
+// below, which is polled by a dcc.Interval.
+(function () {
+    var maxRetries = 5;
+
+    // The upload in progress, or last finished, by session id
+    var uploads = {};
+
+    function sleep(ms) {
+        return new Promise(function (resolve) { setTimeout(resolve, ms); });
+    }
+
+    async function received(response) {
+        return (await response.json()).received;
+    }
+
+    async function upload(container, file) {
+        var sessionId = container.dataset.session;
+        var chunkBytes = parseInt(container.dataset.chunkBytes, 10);
+        var url = "/upload/" + sessionId + "?filename=" +
+            encodeURIComponent(file.name) + "&size=" + file.size;
+        var state = {
+            filename: file.name,
+            size: file.size,
+            lastModified: file.lastModified / 1000,
+            received: 0,
+            done: false,
+            error: null,
+        };
+        uploads[sessionId] = state;
+
+        var retries = 0;
+        try {
+            state.received = await received(await fetch(url));
+            // An empty file is sent as one empty chunk
+            var started = state.received > 0;
+            while (state.received < file.size || !started) {
+                var end = Math.min(state.received + chunkBytes, file.size);
+                var response = null;
+                try {
+                    response = await fetch(url + "&offset=" + state.received, {
+                        method: "PUT",
+                        headers: {"Content-Type": "application/octet-stream"},
+                        body: file.slice(state.received, end),
+                    });
+                } catch (e) {
+                    // Network error: retry below
+                }
+                if (response !== null && (response.ok || response.status === 409)) {
+                    state.received = await received(response);
+                    started = true;
+                    retries = 0;
+                } else if (response !== null && response.status < 500) {
+                    throw new Error(await response.text());
+                } else {
+                    retries += 1;
+                    if (retries > maxRetries) {
+                        throw new Error("the server could not be reached");
+                    }
+                    await sleep(1000 * Math.pow(2, retries));
+                    state.received = await received(await fetch(url));
+                }
+            }
+            state.done = true;
+        } catch (e) {
+            state.error = e.message;
+        }
+    }
+
+    // The button is rendered by Dash, which has no file input component, so the
+    // file is chosen with a file input of our own, outside the layout
+    document.addEventListener("click", function (event) {
+        if (event.target.id !== "chunked-upload-button") {
+            return;
+        }
+        var input = document.createElement("input");
+        input.type = "file";
+        input.accept = document.getElementById("chunked-upload").dataset.accept;
+        input.addEventListener("change", function () {
+            if (input.files.length) {
+                upload(document.getElementById("chunked-upload"), input.files[0]);
+            }
+        });
+        input.click();
+    });
+
+    // The last state reported to the layout, by session id
+    var reported = {};
+
+    window.dash_clientside = Object.assign({}, window.dash_clientside, {
+        chunked_upload: {
+            // Outputs the progress bar's value and max, the progress message, and,
+            // once the upload is done, the file's name, size and modification time
+            progress: function (n_intervals, sessionId) {
+                var noUpdate = window.dash_clientside.no_update;
+                var state = uploads[sessionId];
+                if (state === undefined) {
+                    return [noUpdate, noUpdate, noUpdate, noUpdate];
+                }
+                var key = [state.filename, state.received, state.done, state.error];
+                if (JSON.stringify(key) === reported[sessionId]) {
+                    return [noUpdate, noUpdate, noUpdate, noUpdate];
+                }
+                reported[sessionId] = JSON.stringify(key);
+
+                var mib = 1024 * 1024;
+                var message = state.filename + ": " +
+                    (state.received / mib).toFixed(1) + " of " +
+                    (state.size / mib).toFixed(1) + " MiB received";
+                if (state.error !== null) {
+                    message += " (upload failed: " + state.error +
+                        "; choose the file again to resume)";
+                }
+                var finished = noUpdate;
+                if (state.done) {
+                    finished = {
+                        filename: state.filename,
+                        size: state.size,
+                        last_modified: state.lastModified,
+                    };
+                }
+                return [state.received, Math.max(state.size, 1), message, finished];
+            },
+        },
+    });
+})();
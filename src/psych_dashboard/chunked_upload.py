@@ -0,0 +1,172 @@
+import os
+import json
+import shutil
+import logging
+from flask import request, jsonify, abort
+from psych_dashboard.app import (
+    server,
+    upload_directory,
+    session_ttl_seconds,
+    storage_quota_bytes,
+)
+from psych_dashboard.load_feather import session_id_pattern
+from psych_dashboard.parsing import data_file_extensions
+from psych_dashboard.storage import collect_sessions
+
+logging.getLogger(__name__)
+
+# The body of each chunk is copied to the spool file in blocks of this many bytes, so
+# the memory used by an upload does not depend on the size of the file or the chunks
+copy_block_bytes = 1024 ** 2
+
+
+def spool_paths(session_id):
+    """
+    The directory holding the upload of a session, and in it the spool file the
+    chunks are written to and the JSON file of the file's name and size.
+
+    :raises ValueError: if the session id is invalid
+    """
+    if not isinstance(session_id, str) or not session_id_pattern.fullmatch(session_id):
+        raise ValueError(f"Invalid session id {session_id!r}")
+    directory = os.path.join(upload_directory, session_id)
+    return directory, os.path.join(directory, "upload"), os.path.join(
+        directory, "upload.json"
+    )
+
+
+def upload_status(session_id):
+    """
+    The upload of a session.
+
+    :return: dict of the "filename" and "size" of the file being uploaded, and the
+      number of bytes "received", or None if there is no upload
+    """
+    _, spool_path, meta_path = spool_paths(session_id)
+    try:
+        with open(meta_path) as f:
+            status = json.load(f)
+        status["received"] = os.path.getsize(spool_path)
+    except FileNotFoundError:
+        return None
+    return status
+
+
+def start_upload(session_id, filename, size):
+    """
+    Start a new upload for a session, replacing any earlier one, with an empty spool
+    file. Expired uploads of other sessions are deleted.
+    """
+    directory, spool_path, meta_path = spool_paths(session_id)
+    collect_sessions(
+        upload_directory, session_ttl_seconds, storage_quota_bytes, keep=[session_id]
+    )
+    os.makedirs(directory, exist_ok=True)
+    open(spool_path, "wb").close()
+    with open(meta_path, "w") as f:
+        json.dump({"filename": filename, "size": size}, f)
+
+
+def receive_chunk(session_id, filename, size, offset, stream):
+    """
+    Append a chunk of a file to the spool file of a session's upload. A chunk at
+    offset 0 starts a new upload. The chunk is copied as it is read, so a chunk cut
+    short by a dropped connection still counts up to the last byte received, and the
+    upload resumes from there.
+
+    :param filename: name of the file
+    :param size: size of the whole file in bytes
+    :param offset: position of the chunk in the file, which must be the number of
+      bytes already received
+    :param stream: file-like object to read the chunk from
+    :return: number of bytes of the file received
+    :raises ValueError: if the chunk does not follow on from those received, or
+      extends past the end of the file
+    """
+    if offset == 0:
+        start_upload(session_id, filename, size)
+    status = upload_status(session_id)
+    if (
+        status is None
+        or (status["filename"], status["size"]) != (filename, size)
+        or status["received"] != offset
+    ):
+        raise ValueError(f"Chunk at {offset} does not follow on from those received")
+
+    directory, spool_path, _ = spool_paths(session_id)
+    received = offset
+    with open(spool_path, "ab") as f:
+        while True:
+            block = stream.read(copy_block_bytes)
+            if not block:
+                break
+            if received + len(block) > size:
+                # Keep the bytes up to the end of the file, which are all received
+                f.write(block[: size - received])
+                raise ValueError(f"Chunk extends past the end of {filename}")
+            f.write(block)
+            received += len(block)
+    # Mark the session's upload as used, for collect_sessions
+    os.utime(directory)
+    return received
+
+
+def completed_upload(session_id):
+    """
+    The spool file and name of the file uploaded by a session.
+
+    :raises FileNotFoundError: if the upload is not complete
+    """
+    status = upload_status(session_id)
+    if status is None or status["received"] != status["size"]:
+        raise FileNotFoundError(f"No completed upload for session {session_id}")
+    return spool_paths(session_id)[1], status["filename"]
+
+
+def discard_upload(session_id):
+    shutil.rmtree(spool_paths(session_id)[0], ignore_errors=True)
+
+
+def upload_args():
+    """
+    The file name and size given in the query string of an upload request.
+    """
+    filename = os.path.basename(request.args.get("filename", ""))
+    if filename.rsplit(".", 1)[-1] not in data_file_extensions:
+        abort(415, f"Data files must be one of {data_file_extensions}")
+    size = request.args.get("size", type=int)
+    if size is None or size < 0:
+        abort(400, "The size of the file is required")
+    if size > storage_quota_bytes:
+        abort(413, "The file is larger than the storage quota")
+    return filename, size
+
+
+@server.route("/upload/<session_id>", methods=["GET", "PUT"])
+def upload_route(session_id):
+    """
+    Chunked upload of a data file. GET returns the number of bytes of the file named
+    in the query string already received, to resume an interrupted upload from. PUT
+    appends a chunk at the offset in the query string; a chunk that does not follow
+    on from those received gets a 409 response giving where to continue from.
+    """
+    if not session_id_pattern.fullmatch(session_id):
+        abort(404)
+    filename, size = upload_args()
+
+    def received_so_far():
+        status = upload_status(session_id)
+        if status is None or (status["filename"], status["size"]) != (filename, size):
+            return 0
+        return status["received"]
+
+    if request.method == "GET":
+        return jsonify(received=received_so_far())
+
+    offset = request.args.get("offset", type=int)
+    try:
+        received = receive_chunk(session_id, filename, size, offset, request.stream)
+    except ValueError as e:
+        logging.info(f"Upload for {session_id}: {e}")
+        return jsonify(received=received_so_far()), 409
+    return jsonify(received=received)
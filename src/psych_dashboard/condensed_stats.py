@@ -0,0 +1,181 @@
+import json
+import logging
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+logging.getLogger(__name__)
+
+
+def condensed_index(n, i, j):
+    """
+    Position within a condensed (upper triangle, row-major) vector of the element
+    (i, j) of a symmetric n x n matrix. i and j may be arrays, and must not be equal.
+    """
+    i, j = np.minimum(i, j), np.maximum(i, j)
+    return n * i - i * (i + 1) // 2 + (j - i - 1)
+
+
+class CondensedStats:
+    """
+    Pairwise statistics (Pearson correlation coefficient and -log10 p-value) for a set
+    of columns. As both are symmetric, each pair is stored just once, as a condensed
+    vector of the upper triangle of the matrix in the order of columns, i.e. in the
+    same order as np.triu_indices(len(columns), 1).
+
+    The p-values are held as -log10(p), which keeps the precision of very small
+    p-values when stored as float32.
+    """
+
+    def __init__(self, columns, corr, logs):
+        self.columns = pd.Index(columns)
+        self.corr = np.asarray(corr)
+        self.logs = np.asarray(logs)
+
+    @classmethod
+    def from_square(cls, columns, corr, pval, dtype="float32"):
+        """
+        Create from square correlation and p-value matrices (arrays or DFs) whose rows
+        and columns are both in the order of columns. Only the upper triangle is used.
+        """
+        first, second = np.triu_indices(len(columns), 1)
+        pval = np.asarray(pval, dtype=np.float64)[first, second]
+        with np.errstate(divide="ignore"):
+            logs = -np.log10(pval)
+        return cls(
+            columns,
+            np.asarray(corr, dtype=np.float64)[first, second].astype(dtype),
+            logs.astype(dtype),
+        )
+
+    @classmethod
+    def empty(cls):
+        return cls([], np.empty(0, dtype=np.float32), np.empty(0, dtype=np.float32))
+
+    def __len__(self):
+        return len(self.columns)
+
+    @property
+    def n_pairs(self):
+        return len(self.corr)
+
+    @property
+    def pval(self):
+        return np.power(10.0, -self.logs.astype(np.float64))
+
+    def pairs(self):
+        """
+        Row and column positions of each element of the condensed vectors.
+        """
+        return np.triu_indices(len(self.columns), 1)
+
+    def square(self, name, diagonal=np.nan, lower=True):
+        """
+        Expand one of the statistics ('corr', 'pval' or 'logs') to a square NumPy
+        array.
+
+        :param name: name of the statistic
+        :param diagonal: value to place on the diagonal
+        :param lower: if False, the lower triangle is left as nan rather than being
+          filled by symmetry.
+        """
+        n = len(self.columns)
+        values = getattr(self, name).astype(np.float64)
+        square = np.full((n, n), np.nan)
+        first, second = self.pairs()
+        square[first, second] = values
+        if lower:
+            square[second, first] = values
+        np.fill_diagonal(square, diagonal)
+        return square
+
+    def blocks(self, names, rows, columns):
+        """
+        Some of the statistics ('corr', 'pval' or 'logs') for the pairs of the given
+        rows and columns of the square matrix, as 2D NumPy arrays, taken straight from
+        the condensed vectors without expanding the whole matrix.
+
+        :param names: names of the statistics
+        :param rows: positions of the columns of the rows of the block
+        :param columns: positions of the columns of the columns of the block
+        :return: list of an array of len(rows) x len(columns) for each statistic, nan
+          where a row and column are the same
+        """
+        first, second = np.broadcast_arrays(
+            np.asarray(rows)[:, None], np.asarray(columns)[None, :]
+        )
+        same = first == second
+        k = condensed_index(len(self.columns), first, second)
+        k[same] = 0
+        blocks = []
+        for name in names:
+            values = getattr(self, "logs" if name == "pval" else name)[k]
+            values = values.astype(np.float64)
+            if name == "pval":
+                values = np.power(10.0, -values)
+            values[same] = np.nan
+            blocks.append(values)
+        return blocks
+
+    def subset(self, columns):
+        """
+        Select the statistics for a subset of the columns, in the given order.
+        """
+        positions = self.columns.get_indexer(columns)
+        if (positions < 0).any():
+            raise KeyError(list(pd.Index(columns)[positions < 0]))
+        first, second = np.triu_indices(len(positions), 1)
+        k = condensed_index(len(self.columns), positions[first], positions[second])
+        return CondensedStats(columns, self.corr[k], self.logs[k])
+
+    def flattened_logs(self):
+        """
+        The -log10 p-values as a Series, with a MultiIndex of the names of the first
+        and second variable of each pair.
+        """
+        first, second = self.pairs()
+        return pd.Series(
+            data=self.logs.astype(np.float64),
+            index=pd.MultiIndex.from_arrays(
+                [self.columns[first], self.columns[second]], names=["first", "second"]
+            ),
+            name="value",
+        )
+
+    def logs_against(self, variable):
+        """
+        The -log10 p-values of variable against each other column, as a Series indexed
+        by the other column names. Empty if variable is not one of the columns.
+        """
+        if variable not in self.columns:
+            return pd.Series(dtype=np.float64, name=variable)
+        n = len(self.columns)
+        i = self.columns.get_loc(variable)
+        others = np.delete(np.arange(n), i)
+        k = condensed_index(n, i, others)
+        return pd.Series(
+            data=self.logs[k].astype(np.float64),
+            index=self.columns[others],
+            name=variable,
+        ).dropna()
+
+    def to_table(self):
+        """
+        Convert to an Arrow table, with the column names in the schema metadata.
+        """
+        table = pa.table({"corr": self.corr, "logs": self.logs})
+        return table.replace_schema_metadata(
+            {"columns": json.dumps(self.columns.tolist())}
+        )
+
+    @classmethod
+    def from_table(cls, table):
+        metadata = table.schema.metadata or {}
+        columns = json.loads(metadata.get(b"columns", b"[]"))
+        if table.num_rows == 0:
+            return cls(columns, np.empty(0, np.float32), np.empty(0, np.float32))
+        return cls(
+            columns,
+            table.column("corr").to_numpy(),
+            table.column("logs").to_numpy(),
+        )
@@ -0,0 +1,326 @@
+import logging
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import numpy as np
+import scipy.special as special
+import scipy.stats as stats
+
+logging.getLogger(__name__)
+
+
+def _to_float_array(x):
+    """
+    Convert a DataFrame, Series or array to a 2D float64 NumPy array, with missing
+    values represented as np.nan.
+    """
+    if hasattr(x, "to_numpy"):
+        # Nullable integer columns hold pd.NA, which needs converting to nan
+        x = x.to_numpy(dtype=np.float64, na_value=np.nan)
+    x = np.asarray(x, dtype=np.float64)
+    if x.ndim == 1:
+        x = x[:, np.newaxis]
+    return x
+
+
+def pearson_pvalues(corr, n):
+    """
+    Calculate the two-sided p-values for Pearson correlation coefficients, in the same
+    way as stats.pearsonr, i.e. from the exact distribution of r under the null
+    hypothesis (a beta distribution on [-1, 1] with both shape parameters n/2 - 1).
+
+    :param corr: array of correlation coefficients
+    :param n: array (or scalar) of the number of observations behind each coefficient
+    :return: array of p-values, the same shape as corr. Entries with fewer than 2
+      observations are nan.
+    """
+    corr = np.asarray(corr, dtype=np.float64)
+    n = np.broadcast_to(np.asarray(n, dtype=np.float64), corr.shape)
+    ab = n / 2 - 1
+    with np.errstate(invalid="ignore", divide="ignore"):
+        pval = 2 * special.betainc(ab, ab, 0.5 * (1 - np.abs(corr)))
+    # With only two observations the correlation is always +/-1, and pearsonr
+    # reports a p-value of 1.
+    pval = np.where((n == 2) & ~np.isnan(corr), 1.0, pval)
+    pval[n < 2] = np.nan
+    return pval
+
+
+def student_t_pvalues(corr, n):
+    """
+    Calculate the two-sided p-values for Pearson correlation coefficients via the
+    Student's t statistic t = r * sqrt((n - 2) / (1 - r^2)), which has n - 2 degrees of
+    freedom under the null hypothesis. This is equivalent to pearson_pvalues, and is
+    cheaper when n is the same for every coefficient.
+
+    :param corr: array of correlation coefficients
+    :param n: the number of observations behind every coefficient
+    :return: array of p-values, the same shape as corr
+    """
+    corr = np.asarray(corr, dtype=np.float64)
+    if n < 2:
+        return np.full(corr.shape, np.nan)
+    if n == 2:
+        return np.where(np.isnan(corr), np.nan, 1.0)
+    dof = n - 2
+    with np.errstate(invalid="ignore", divide="ignore"):
+        t = np.abs(corr) * np.sqrt(dof / ((1.0 - corr) * (1.0 + corr)))
+    return 2 * stats.t.sf(t, dof)
+
+
+def complete_pearson(x, y=None):
+    """
+    Calculate the Pearson correlation coefficient of every column of x against every
+    column of y, where none of the columns contain missing values. All the
+    coefficients are calculated with a single matrix product of the standardised
+    data, as in np.corrcoef.
+
+    :param x: 2D float array with no missing values
+    :param y: 2D float array with no missing values and the same number of rows as x.
+      If None, x is correlated against itself.
+    :return: tuple of (corr, n, pval) arrays, as for pairwise_pearson
+    """
+    n_rows = x.shape[0]
+
+    def standardise(a):
+        a = a - a.mean(axis=0)
+        norm = np.sqrt((a ** 2).sum(axis=0))
+        with np.errstate(invalid="ignore", divide="ignore"):
+            # Constant columns become nan, so their correlations are nan
+            return a / np.where(norm > 0, norm, np.nan)
+
+    x_std = standardise(x)
+    y_std = x_std if y is None else standardise(y)
+
+    corr = x_std.T @ y_std
+    np.clip(corr, -1.0, 1.0, out=corr)
+    if y is None:
+        # Avoid rounding errors on the diagonal
+        np.fill_diagonal(corr, np.where(np.isnan(np.diag(corr)), np.nan, 1.0))
+
+    n = np.full(corr.shape, n_rows, dtype=np.int64)
+    return corr, n, student_t_pvalues(corr, n_rows)
+
+
+def masked_pearson(x, y=None):
+    """
+    Calculate the Pearson correlation coefficient of every column of x against every
+    column of y, using pairwise-complete observations, i.e. for each pair of columns
+    only the rows where neither value is missing are used. All the pairs are
+    calculated at once via matrix products of the missing-value indicator matrices
+    and the masked sums.
+
+    :param x: 2D float array (rows are observations, columns are variables)
+    :param y: 2D float array with the same number of rows as x. If None, x is
+      correlated against itself.
+    :return: tuple of (corr, n, pval) arrays, as for pairwise_pearson
+    """
+    y = x if y is None else y
+
+    # Centre each column by its own mean before forming the sums. The correlation is
+    # invariant to the shift, and it greatly reduces the cancellation error in the
+    # sums of squares below.
+    with warnings.catch_warnings():
+        # Columns that are entirely missing have a nan mean, which is harmless here
+        warnings.simplefilter("ignore", category=RuntimeWarning)
+        x = x - np.nanmean(x, axis=0) if x.size else x
+        y = y - np.nanmean(y, axis=0) if y.size else y
+
+    # Indicator matrices of present values, and the data with missing values zeroed
+    # so that they drop out of the sums.
+    x_present = (~np.isnan(x)).astype(np.float64)
+    y_present = (~np.isnan(y)).astype(np.float64)
+    x0 = np.where(x_present > 0, x, 0.0)
+    y0 = np.where(y_present > 0, y, 0.0)
+
+    n = x_present.T @ y_present
+    sum_x = x0.T @ y_present
+    sum_y = x_present.T @ y0
+    sum_xx = (x0 ** 2).T @ y_present
+    sum_yy = x_present.T @ (y0 ** 2)
+    sum_xy = x0.T @ y0
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        cov = sum_xy - sum_x * sum_y / n
+        var_x = sum_xx - sum_x ** 2 / n
+        var_y = sum_yy - sum_y ** 2 / n
+        corr = cov / np.sqrt(var_x * var_y)
+
+    # Constant columns (within the pairwise-complete rows) have no defined
+    # correlation, as with pearsonr.
+    corr[~(var_x > 0) | ~(var_y > 0)] = np.nan
+    corr[n < 2] = np.nan
+    np.clip(corr, -1.0, 1.0, out=corr)
+
+    pval = pearson_pvalues(corr, n)
+
+    return corr, n.astype(np.int64), pval
+
+
+def pairwise_pearson(x, y=None):
+    """
+    Calculate the Pearson correlation coefficient of every column of x against every
+    column of y, using pairwise-complete observations. This gives the same result as
+    calling stats.pearsonr on each pair of columns after masking out the rows where
+    either value is missing.
+
+    The columns without any missing values are handled together by the cheaper
+    complete_pearson, so only the pairs involving a column with gaps use the
+    masked calculation.
+
+    :param x: 2D array-like (rows are observations, columns are variables)
+    :param y: 2D array-like with the same number of rows as x. If None, x is
+      correlated against itself.
+    :return: tuple of (corr, n, pval) arrays, each of shape
+      [x.shape[1], y.shape[1]], holding the correlation coefficients, the number of
+      pairwise-complete observations and the two-sided p-values respectively.
+    """
+    x = _to_float_array(x)
+    self_corr = y is None
+    y = x if self_corr else _to_float_array(y)
+
+    x_complete = ~np.isnan(x).any(axis=0)
+    y_complete = x_complete if self_corr else ~np.isnan(y).any(axis=0)
+
+    # Shortcut the common cases where all, or none, of the columns are complete
+    if x_complete.all() and y_complete.all():
+        return complete_pearson(x, None if self_corr else y)
+    if not x_complete.any() or not y_complete.any():
+        return masked_pearson(x, None if self_corr else y)
+
+    shape = (x.shape[1], y.shape[1])
+    corr = np.full(shape, np.nan)
+    n = np.zeros(shape, dtype=np.int64)
+    pval = np.full(shape, np.nan)
+
+    def fill(rows, cols, result):
+        block = np.ix_(rows, cols)
+        corr[block], n[block], pval[block] = result
+
+    x_gaps = np.flatnonzero(~x_complete)
+    y_gaps = np.flatnonzero(~y_complete)
+    x_full = np.flatnonzero(x_complete)
+    y_full = np.flatnonzero(y_complete)
+
+    # Complete vs complete
+    fill(
+        x_full,
+        y_full,
+        complete_pearson(x[:, x_full], None if self_corr else y[:, y_full]),
+    )
+    # Everything vs the columns of y with gaps
+    fill(
+        np.arange(x.shape[1]),
+        y_gaps,
+        masked_pearson(x, y[:, y_gaps]),
+    )
+    # The columns of x with gaps vs the complete columns of y
+    if self_corr:
+        # Use the symmetry rather than recalculating
+        for a in (corr, n, pval):
+            a[np.ix_(x_gaps, y_full)] = a[np.ix_(y_full, x_gaps)].T
+    else:
+        fill(x_gaps, y_full, masked_pearson(x[:, x_gaps], y[:, y_full]))
+
+    return corr, n, pval
+
+
+# Arrays attached to shared memory in each worker process of the pool used by
+# tiled_pairwise_pearson, keyed by "x" and "y".
+_worker_arrays = dict()
+_worker_shm = list()
+
+
+def _attach_worker_arrays(specs):
+    """
+    Pool initializer: attach each worker to the shared memory blocks holding the
+    input data, rather than sending a copy of the data to every worker.
+    """
+    for key, (shm_name, shape) in specs.items():
+        shm = shared_memory.SharedMemory(name=shm_name)
+        _worker_shm.append(shm)
+        _worker_arrays[key] = np.ndarray(shape, dtype=np.float64, buffer=shm.buf)
+
+
+def _calculate_tile(x_slice, y_slice):
+    x = _worker_arrays["x"][:, x_slice]
+    y = _worker_arrays["y"][:, y_slice] if "y" in _worker_arrays else None
+    if y is None and x_slice != y_slice:
+        y = _worker_arrays["x"][:, y_slice]
+    return x_slice, y_slice, pairwise_pearson(x, y)
+
+
+def _to_shared_memory(a):
+    shm = shared_memory.SharedMemory(create=True, size=max(a.nbytes, 1))
+    np.ndarray(a.shape, dtype=np.float64, buffer=shm.buf)[:] = a
+    return shm
+
+
+def tiled_pairwise_pearson(x, y=None, n_workers=1, block_size=500):
+    """
+    Calculate the same result as pairwise_pearson, but split the variable x variable
+    matrix into square tiles of block_size columns, and calculate the tiles in a pool
+    of n_workers processes. The data is placed in shared memory once, and the workers
+    read their columns from there. When y is None only the tiles on and above the
+    diagonal are calculated, and the rest are filled by symmetry.
+
+    Note that NumPy may already use multiple threads for the matrix products within
+    each tile, so the best number of workers depends upon the BLAS library in use.
+
+    :param x: 2D array-like (rows are observations, columns are variables)
+    :param y: 2D array-like with the same number of rows as x, or None
+    :param n_workers: number of worker processes. If 1, no pool is used.
+    :param block_size: number of columns in each tile
+    :return: tuple of (corr, n, pval) arrays, as for pairwise_pearson
+    """
+    x = _to_float_array(x)
+    self_corr = y is None
+    y_arr = x if self_corr else _to_float_array(y)
+
+    if n_workers <= 1 or max(x.shape[1], y_arr.shape[1]) <= block_size:
+        return pairwise_pearson(x, y)
+
+    def slices(n_cols):
+        return [
+            slice(i, min(i + block_size, n_cols)) for i in range(0, n_cols, block_size)
+        ]
+
+    x_slices = slices(x.shape[1])
+    y_slices = slices(y_arr.shape[1])
+    if self_corr:
+        tiles = [(xs, ys) for i, xs in enumerate(x_slices) for ys in y_slices[i:]]
+    else:
+        tiles = [(xs, ys) for xs in x_slices for ys in y_slices]
+
+    shape = (x.shape[1], y_arr.shape[1])
+    corr = np.full(shape, np.nan)
+    n = np.zeros(shape, dtype=np.int64)
+    pval = np.full(shape, np.nan)
+
+    shared = {"x": _to_shared_memory(x)}
+    if not self_corr:
+        shared["y"] = _to_shared_memory(y_arr)
+    specs = {
+        key: (shm.name, a.shape)
+        for (key, shm), a in zip(shared.items(), [x, y_arr])
+    }
+    try:
+        with ProcessPoolExecutor(
+            max_workers=n_workers,
+            initializer=_attach_worker_arrays,
+            initargs=(specs,),
+        ) as executor:
+            futures = [executor.submit(_calculate_tile, xs, ys) for xs, ys in tiles]
+            for future in futures:
+                xs, ys, result = future.result()
+                for a, block in zip((corr, n, pval), result):
+                    a[xs, ys] = block
+                    if self_corr and xs != ys:
+                        a[ys, xs] = block.T
+    finally:
+        for shm in shared.values():
+            shm.close()
+            shm.unlink()
+
+    logging.debug(f"tiled_pairwise_pearson used {len(tiles)} tiles")
+    return corr, n, pval
@@ -0,0 +1,161 @@
+import os
+import time
+import uuid
+import hashlib
+import logging
+import numpy as np
+import pandas as pd
+
+logging.getLogger(__name__)
+
+
+def fingerprint_columns(dff):
+    """
+    Calculate a content fingerprint for each column of dff, from the hash of its
+    values combined with the hash of the row index. Columns with the same values on
+    the same rows have the same fingerprint, whatever their name or the file they
+    came from. The index is hashed once, rather than once per column.
+
+    :param dff: DataFrame
+    :return: int64 array with one fingerprint per column
+    """
+    index_hashes = pd.util.hash_pandas_object(dff.index, index=False)
+    index_digest = hashlib.blake2b(index_hashes.to_numpy().tobytes()).digest()
+    fingerprints = np.empty(len(dff.columns), dtype=np.int64)
+    for i, col in enumerate(dff.columns):
+        row_hashes = pd.util.hash_pandas_object(dff.iloc[:, i], index=False)
+        digest = hashlib.blake2b(index_digest, digest_size=8)
+        digest.update(row_hashes.to_numpy().tobytes())
+        fingerprints[i] = np.frombuffer(digest.digest(), dtype=np.int64)[0]
+    return fingerprints
+
+
+class CorrelationCache:
+    """
+    Persistent cache of the correlation coefficient and p-value of pairs of columns,
+    keyed by the fingerprints of the two columns (see fingerprint_columns). This lets
+    correlations be reused across uploads and restarts for any columns whose data is
+    unchanged, while a column whose data changes gets a new fingerprint and so is
+    recalculated.
+
+    The cache holds at most max_pairs pairs; beyond that, the least recently used
+    pairs are evicted when saving.
+    """
+
+    columns = ["first", "second", "corr", "pval", "last_used"]
+
+    def __init__(self, path, max_pairs):
+        self.path = path
+        self.max_pairs = max_pairs
+        self.modified = False
+        if os.path.exists(path):
+            try:
+                table = pd.read_feather(path)
+            except Exception as e:
+                logging.error(f"Could not read correlation cache {path}: {e}")
+                table = pd.DataFrame(columns=self.columns)
+        else:
+            table = pd.DataFrame(columns=self.columns)
+        self.table = table.astype(
+            {
+                "first": np.int64,
+                "second": np.int64,
+                "corr": np.float64,
+                "pval": np.float64,
+                "last_used": np.float64,
+            }
+        ).set_index(["first", "second"])
+
+    def __len__(self):
+        return len(self.table)
+
+    @staticmethod
+    def _pair_keys(fingerprints, rows, cols):
+        # Each pair is stored once, with the smaller fingerprint first
+        a, b = fingerprints[rows], fingerprints[cols]
+        return pd.MultiIndex.from_arrays(
+            [np.minimum(a, b), np.maximum(a, b)], names=["first", "second"]
+        )
+
+    def lookup(self, fingerprints):
+        """
+        Look up every pair of the given column fingerprints.
+
+        :param fingerprints: int64 array of column fingerprints
+        :return: tuple of (corr, pval, found) square arrays. Pairs not in the cache
+          are nan in corr and pval, and False in found. The diagonal is always found.
+        """
+        n = len(fingerprints)
+        corr = np.full((n, n), np.nan)
+        pval = np.full((n, n), np.nan)
+        found = np.eye(n, dtype=bool)
+        np.fill_diagonal(corr, 1.0)
+        np.fill_diagonal(pval, 0.0)
+
+        rows, cols = np.triu_indices(n, 1)
+        if len(self.table) == 0 or len(rows) == 0:
+            return corr, pval, found
+
+        positions = self.table.index.get_indexer(
+            self._pair_keys(fingerprints, rows, cols)
+        )
+        hit = positions >= 0
+        rows, cols, positions = rows[hit], cols[hit], positions[hit]
+
+        for square, name in [(corr, "corr"), (pval, "pval")]:
+            values = self.table[name].to_numpy()[positions]
+            square[rows, cols] = values
+            square[cols, rows] = values
+        found[rows, cols] = True
+        found[cols, rows] = True
+
+        # Record the use of these pairs for the LRU eviction. This alone does not
+        # cause the cache to be rewritten; it is saved along with the next new pairs.
+        if len(positions) > 0:
+            self.table.iloc[positions, self.table.columns.get_loc("last_used")] = (
+                time.time()
+            )
+
+        logging.debug(f"correlation cache: {hit.sum()} of {len(hit)} pairs found")
+        return corr, pval, found
+
+    def update(self, fingerprints, corr, pval, mask):
+        """
+        Add the pairs of the square arrays corr and pval for which mask is True.
+        """
+        rows, cols = np.nonzero(np.triu(mask, 1))
+        if len(rows) == 0:
+            return
+        new = pd.DataFrame(
+            {
+                "corr": corr[rows, cols],
+                "pval": pval[rows, cols],
+                "last_used": time.time(),
+            },
+            index=self._pair_keys(fingerprints, rows, cols),
+        )
+        table = pd.concat([self.table, new])
+        self.table = table[~table.index.duplicated(keep="last")]
+        self.modified = True
+
+    def save(self):
+        """
+        Evict the least recently used pairs beyond max_pairs, and write the cache to
+        disk if any pairs have been added.
+        """
+        if not self.modified:
+            return
+        if len(self.table) > self.max_pairs:
+            logging.info(
+                f"Evicting {len(self.table) - self.max_pairs} pairs from the "
+                f"correlation cache"
+            )
+            self.table = self.table.sort_values("last_used").iloc[-self.max_pairs :]
+
+        # Write to a temporary file first so that the cache is never left half written.
+        # The cache is shared by all sessions, so each writer uses its own temporary
+        # file; the last to finish replaces the others' updates.
+        temporary_path = f"{self.path}.{uuid.uuid4().hex}.tmp"
+        self.table.reset_index().to_feather(temporary_path)
+        os.replace(temporary_path, self.path)
+        self.modified = False
@@ -0,0 +1,123 @@
+import logging
+import numpy as np
+import pandas as pd
+
+logging.getLogger(__name__)
+
+# Integer dtypes to try when compacting, smallest first, and their nullable versions
+_int_dtypes = [np.int8, np.int16, np.int32, np.int64]
+_nullable_int_dtypes = {
+    np.int8: pd.Int8Dtype(),
+    np.int16: pd.Int16Dtype(),
+    np.int32: pd.Int32Dtype(),
+    np.int64: pd.Int64Dtype(),
+}
+
+
+def is_numeric_column(dtype):
+    """
+    Whether a column of this dtype can be used in the correlations, i.e. it holds
+    numbers: any width of float or integer, including the nullable integer dtypes
+    (such as "Int16") produced by compact_dtypes, but not booleans.
+    """
+    return pd.api.types.is_numeric_dtype(dtype) and not pd.api.types.is_bool_dtype(
+        dtype
+    )
+
+
+def _smallest_int_dtype(values):
+    """
+    The smallest integer dtype that holds all of the given integers (as floats or
+    ints, without nans).
+    """
+    if len(values) == 0:
+        return _int_dtypes[0]
+    low, high = values.min(), values.max()
+    for dtype in _int_dtypes:
+        info = np.iinfo(dtype)
+        if info.min <= low and high <= info.max:
+            return dtype
+    return None
+
+
+def _compact_float(col, float_tolerance):
+    values = col.to_numpy()
+    present = values[~np.isnan(values)]
+    # Integers stored as floats, as read_csv makes of integer columns with missing
+    # values, become (nullable) integers
+    if (
+        len(present) > 0
+        and np.isfinite(present).all()
+        and (present == np.round(present)).all()
+    ):
+        dtype = _smallest_int_dtype(present)
+        if dtype is not None:
+            if len(present) == len(values):
+                return col.astype(dtype)
+            return col.astype(_nullable_int_dtypes[dtype])
+
+    compact = values.astype(np.float32)
+    with np.errstate(over="ignore", invalid="ignore"):
+        if np.array_equal(compact, values, equal_nan=True):
+            return col.astype(np.float32)
+        if float_tolerance > 0:
+            error = np.abs(compact.astype(np.float64) - values)
+            relative = error[np.isfinite(values)] / np.maximum(
+                np.abs(values[np.isfinite(values)]), np.finfo(np.float32).tiny
+            )
+            if len(relative) == 0 or relative.max() <= float_tolerance:
+                return col.astype(np.float32)
+    return col
+
+
+def _compact_object(col, max_category_fraction):
+    values = col.dropna()
+    if len(values) == 0 or not values.map(type).eq(str).all():
+        return col
+    if values.nunique() > max_category_fraction * len(values):
+        return col
+    return col.astype("category")
+
+
+def compact_dtypes(df, float_tolerance=0.0, max_category_fraction=0.5):
+    """
+    Convert the columns of df to more compact dtypes where this keeps their values:
+
+    - float64 columns holding only integers (and missing values) become the smallest
+      integer dtype that holds them, nullable (e.g. "Int16") if any are missing
+    - other float64 columns become float32 if the values are unchanged, or change by
+      no more than float_tolerance relative to their size
+    - int64 columns become the smallest integer dtype that holds them
+    - string columns with few distinct values become categoricals
+
+    The index is left as it is. Memory use before and after is logged.
+
+    :param df: DF to compact
+    :param float_tolerance: largest relative error allowed when converting floats to
+      float32. 0 only allows conversions which are exact.
+    :param max_category_fraction: largest number of distinct values, as a fraction of
+      the non-missing values, for a string column to become a categorical
+    :return: the compacted DF
+    """
+    before = df.memory_usage(index=True, deep=True).sum()
+    columns = []
+    for i in range(len(df.columns)):
+        series = df.iloc[:, i]
+        if series.dtype == np.float64:
+            series = _compact_float(series, float_tolerance)
+        elif series.dtype == np.int64:
+            dtype = _smallest_int_dtype(series.to_numpy())
+            series = series.astype(dtype)
+        elif series.dtype == object:
+            series = _compact_object(series, max_category_fraction)
+        columns.append(series)
+    compacted = pd.concat(columns, axis=1) if columns else df.copy()
+
+    after = compacted.memory_usage(index=True, deep=True).sum()
+    changed = (compacted.dtypes != df.dtypes).sum()
+    mib = 1024 ** 2
+    logging.info(
+        f"Compacted {changed} of {len(df.columns)} columns: "
+        f"{before / mib:.1f} MiB -> {after / mib:.1f} MiB"
+    )
+    return compacted
@@ -14,16 +14,20 @@ logging.getLogger(__name__)
         for component in all_components["bar"]
     ],
     [Input("df-loaded-div", "children")],
-    [State({"type": "div-bar-x", "index": MATCH}, "style")]
+    [
+        State("session-id", "data"),
+        State({"type": "div-bar-x", "index": MATCH}, "style"),
+    ]
     + [
         State({"type": "bar-" + component["id"], "index": MATCH}, prop)
         for component in all_components["bar"]
         for prop in component
     ],
 )
-def update_bar_components(df_loaded, style_dict, *args):
+def update_bar_components(df_loaded, session_id, style_dict, *args):
     logging.info(f"update_bar_components")
-    dff = load("filtered")
+    # Only the column names are needed
+    dff = load("filtered", session_id, head=0)
     dd_options = [{"label": col, "value": col} for col in dff.columns]
     return update_graph_components("bar", all_components["bar"], dd_options, args)
 
@@ -36,13 +40,15 @@ def update_bar_components(df_loaded, style_dict, *args):
             for component in all_components["bar"]
         )
     ],
+    [State("session-id", "data")],
 )
 def make_bar_figure(*args):
+    *args, session_id = args
     logging.info(f"make_bar_figure")
     keys = [component["id"] for component in all_components["bar"]]
 
     args_dict = dict(zip(keys, args))
-    dff = load("filtered")
+    dff = load("filtered", session_id, columns=[args_dict["x"], args_dict["split_by"]])
 
     # Return empty scatter if not enough options are selected, or the data is empty.
     if dff.columns.size == 0 or args_dict["x"] is None:
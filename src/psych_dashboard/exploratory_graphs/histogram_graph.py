@@ -14,16 +14,20 @@ logging.getLogger(__name__)
         for component in all_components["histogram"]
     ],
     [Input("df-loaded-div", "children")],
-    [State({"type": "div-histogram-base_variable", "index": MATCH}, "style")]
+    [
+        State("session-id", "data"),
+        State({"type": "div-histogram-base_variable", "index": MATCH}, "style"),
+    ]
     + [
         State({"type": "histogram-" + component["id"], "index": MATCH}, prop)
         for component in all_components["histogram"]
         for prop in component
     ],
 )
-def update_histogram_components(df_loaded, style_dict, *args):
+def update_histogram_components(df_loaded, session_id, style_dict, *args):
     logging.info(f"update_histogram_components")
-    dff = load("filtered")
+    # Only the column names are needed
+    dff = load("filtered", session_id, head=0)
     dd_options = [{"label": col, "value": col} for col in dff.columns]
     return update_graph_components(
         "histogram", all_components["histogram"], dd_options, args
@@ -38,13 +42,15 @@ def update_histogram_components(df_loaded, style_dict, *args):
             for component in all_components["histogram"]
         )
     ],
+    [State("session-id", "data")],
 )
 def make_histogram_figure(*args):
+    *args, session_id = args
     logging.info(f"make_histogram_figure")
     keys = [component["id"] for component in all_components["histogram"]]
 
     args_dict = dict(zip(keys, args))
-    dff = load("filtered")
+    dff = load("filtered", session_id, columns=[args_dict["base_variable"]])
 
     # Return empty scatter if not enough options are selected, or the data is empty.
     if dff.columns.size == 0 or args_dict["base_variable"] is None:
@@ -1,39 +1,41 @@
 import logging
 import numpy as np
+import pandas as pd
 from dash.dependencies import Input, Output, State, MATCH
 from dash.exceptions import PreventUpdate
 import plotly.graph_objects as go
 from psych_dashboard.app import app, all_components
+from psych_dashboard.dtypes import is_numeric_column
 from psych_dashboard.load_feather import load
 from psych_dashboard.exploratory_graph_groups import update_graph_components
 
 logging.getLogger(__name__)
 
-# TODO: currently only allows int64 and float64
-valid_manhattan_dtypes = [np.int64, np.float64]
-
-
 @app.callback(
     [
         Output({"type": "div-manhattan-" + component["id"], "index": MATCH}, "children")
         for component in all_components["manhattan"]
     ],
     [Input("df-loaded-div", "children")],
-    [State({"type": "div-manhattan-base_variable", "index": MATCH}, "style")]
+    [
+        State("session-id", "data"),
+        State({"type": "div-manhattan-base_variable", "index": MATCH}, "style"),
+    ]
     + [
         State({"type": "manhattan-" + component["id"], "index": MATCH}, prop)
         for component in all_components["manhattan"]
         for prop in component
     ],
 )
-def update_manhattan_components(df_loaded, style_dict, *args):
+def update_manhattan_components(df_loaded, session_id, style_dict, *args):
     logging.info("update_manhattan_components")
-    dff = load("df")
+    # Only the column names and dtypes are needed
+    dff = load("df", session_id, head=0)
     # Only allow user to select columns that have data type that is valid for correlation
     dd_options = [
         {"label": col, "value": col}
         for col in dff.columns
-        if dff[col].dtype in valid_manhattan_dtypes
+        if is_numeric_column(dff[col].dtype)
     ]
     return update_graph_components(
         "manhattan", all_components["manhattan"], dd_options, args
@@ -42,7 +44,7 @@ def update_manhattan_components(df_loaded, style_dict, *args):
 
 def calculate_transformed_corrected_pval(ref_pval, logs):
     # Divide reference p-value by number of variable pairs to get corrected p-value
-    corrected_ref_pval = ref_pval / (logs.notna().sum().sum())
+    corrected_ref_pval = ref_pval / np.count_nonzero(pd.notna(logs))
     # Transform corrected p-value by -log10
     transformed_corrected_ref_pval = -np.log10(corrected_ref_pval)
     return transformed_corrected_ref_pval
@@ -56,8 +58,10 @@ def calculate_transformed_corrected_pval(ref_pval, logs):
             for component in all_components["manhattan"]
         )
     ],
+    [State("session-id", "data")],
 )
 def make_manhattan_figure(*args):
+    *args, session_id = args
     args_string = [*args]
     logging.info(f"make_manhattan_figure {args_string}")
     # Generate the list of argument names based on the input order
@@ -73,17 +77,9 @@ def make_manhattan_figure(*args):
         logging.debug(f"raise PreventUpdate")
         raise PreventUpdate
 
-    # Load logs of all p-values
-    logs = load("logs")
-
-    # Select the column and row associated to this variable, and combine the two. Half of the values will be nans,
-    # so we keep all the non-nans.
-    take_non_nan = lambda s1, s2: s1 if not np.isnan(s1) else s2
-    selected_logs = (
-        logs.loc[:, args_dict["base_variable"]]
-        .combine(logs.loc[args_dict["base_variable"], :], take_non_nan)
-        .dropna()
-    )
+    # Load logs of all p-values, and select those of pairs including this variable
+    stats = load("stats", session_id)
+    selected_logs = stats.logs_against(args_dict["base_variable"])
 
     transformed_corrected_ref_pval = calculate_transformed_corrected_pval(
         float(args_dict["pvalue"]), selected_logs
@@ -23,16 +23,20 @@ logging.getLogger(__name__)
         for component in all_components["scatter"]
     ],
     [Input("df-loaded-div", "children")],
-    [State({"type": "div-scatter-x", "index": MATCH}, "style")]
+    [
+        State("session-id", "data"),
+        State({"type": "div-scatter-x", "index": MATCH}, "style"),
+    ]
     + [
         State({"type": "scatter-" + component["id"], "index": MATCH}, prop)
         for component in all_components["scatter"]
         for prop in component
     ],
 )
-def update_scatter_components(df_loaded, style_dict, *args):
+def update_scatter_components(df_loaded, session_id, style_dict, *args):
     logging.info(f"update_scatter_components")
-    dff = load("filtered")
+    # Only the column names are needed
+    dff = load("filtered", session_id, head=0)
     dd_options = [{"label": col, "value": col} for col in dff.columns]
     return update_graph_components(
         "scatter", all_components["scatter"], dd_options, args
@@ -81,15 +85,24 @@ max_marker_size = 10
             for component in all_components["scatter"]
         )
     ],
+    [State("session-id", "data")],
 )
 def make_scatter_figure(*args):
+    *args, session_id = args
     logging.info(f"make_scatter_figure")
     # Generate the list of argument names based on the input order
     keys = [component["id"] for component in all_components["scatter"]]
 
     # Convert inputs to a dict called 'args_dict'
     args_dict = dict(zip(keys, args))
-    dff = load("filtered")
+    dff = load(
+        "filtered",
+        session_id,
+        columns=[
+            args_dict[key]
+            for key in ["x", "y", "color", "size", "facet_row", "facet_col"]
+        ],
+    )
 
     facet_row_cats = (
         list(dff[args_dict["facet_row"]].unique())
@@ -144,7 +157,9 @@ def make_scatter_figure(*args):
         dff.dropna(inplace=True, subset=[args_dict["color"]])
         color_to_use = pd.DataFrame(dff[args_dict["color"]])
 
-        if args_dict["color"] in dff.select_dtypes(include="object").columns:
+        if args_dict["color"] in dff.select_dtypes(
+            include=["object", "category"]
+        ).columns:
             dff["color_to_use"] = map_color(dff[args_dict["color"]])
         else:
             color_to_use.set_index(dff.index, inplace=True)
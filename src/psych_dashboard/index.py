@@ -1,15 +1,25 @@
-import io
+import os
+import json
 import base64
+import argparse
 import datetime
 import logging
 import dash_core_components as dcc
 import dash_html_components as html
 import dash_bootstrap_components as dbc
-from dash.dependencies import Input, Output, State
+from dash.dependencies import Input, Output, State, ClientsideFunction
 import plotly.graph_objects as go
 import pandas as pd
 from psych_dashboard import preview_table, exploratory_graph_groups, export
-from psych_dashboard.load_feather import store, load
+from psych_dashboard.load_feather import (
+    store,
+    load,
+    new_session_id,
+    collect_garbage,
+    parse_cache_key,
+    load_cached_parse,
+    store_cached_parse,
+)
 from psych_dashboard.exploratory_graphs import (
     scatter_graph,
     bar_graph,
@@ -23,7 +33,37 @@ from psych_dashboard.summary import (
     summary_manhattan,
     summary_table,
 )
-from psych_dashboard.app import app, indices, standard_margin_left, div_style
+from psych_dashboard.dtypes import compact_dtypes
+from psych_dashboard.subject_index import set_subject_index
+from psych_dashboard.merge import read_data_files, skip_unindexed_files
+from psych_dashboard.parsing import (
+    data_file_extensions,
+    fingerprint,
+    read_data_file,
+    read_data_file_header,
+    read_filter_file,
+)
+from psych_dashboard.server_files import (
+    list_data_files,
+    list_data_directories,
+    resolve_data_file,
+    resolve_data_files,
+)
+from psych_dashboard.chunked_upload import completed_upload, discard_upload
+from psych_dashboard.app import (
+    app,
+    indices,
+    standard_margin_left,
+    div_style,
+    compact_dtypes_on_load,
+    compact_float_tolerance,
+    compact_max_category_fraction,
+    parse_engine,
+    csv_block_size,
+    ingest_workers,
+    data_directory,
+    upload_chunk_bytes,
+)
 
 logging.getLogger(__name__)
 
@@ -32,6 +72,10 @@ TABLE_WIDTH = "95%"
 HEADER_IMAGE = "/assets/UoN_Primary_Logo_RGB.png"
 # external_stylesheets = ['https://codepen.io/chriddyp/pen/bWLwgP.css']
 
+# Files on the server given on the command line, selected when each page is loaded: a
+# list of data files or directories of them, and a filter file
+server_paths = {"data": None, "filter": None}
+
 
 def create_header(title):
     return html.Div(
@@ -76,268 +120,377 @@ def create_header(title):
     )
 
 
-app.layout = html.Div(
-    children=[
-        html.Img(src=HEADER_IMAGE, height=100),
-        create_header("ABCD data exploration dashboard"),
-        html.H1(children="File selection", style=div_style),
-        html.Label(
-            children="Data File Selection (initial data read will happen immediately)",
-            style=div_style,
-        ),
-        dcc.Upload(
-            id="data-file-upload",
-            children=html.Div(["Drag and Drop or ", html.A("Select Files")]),
-            style={
-                "height": "60px",
-                "lineHeight": "60px",
-                "borderWidth": "1px",
-                "borderStyle": "dashed",
-                "borderRadius": "5px",
-                "textAlign": "center",
-                "margin": "10px",
-            },
-        ),
-        html.Div(
-            id="output-data-file-upload", children=["No file loaded"], style=div_style
-        ),
-        html.Label(
-            children="Column Filter File Selection (initial data read will happen"
-                     " immediately)",
-            style=div_style,
-        ),
-        dcc.Upload(
-            id="filter-file-upload",
-            children=html.Div(["Drag and Drop or ", html.A("Select Files")]),
-            style={
-                "height": "60px",
-                "lineHeight": "60px",
-                "borderWidth": "1px",
-                "borderStyle": "dashed",
-                "borderRadius": "5px",
-                "textAlign": "center",
-                "margin": "10px",
-            },
-        ),
-        html.Div(
-            id="output-filter-file-upload", children=["No file loaded"], style=div_style
-        ),
-        html.Button("Analyse", id="load-files-button", style=div_style),
-        html.Button("Export to PDF", id="export-pdf-button", style=div_style),
-        html.Div(children=[""], id="export-div", style=div_style),
-        html.Div(
-            [
-                html.H1(
-                    "Summary",
-                    style={
-                        "display": "inline-block",
-                        "margin-left": standard_margin_left,
-                    },
-                ),
-                dbc.Button(
-                    "-",
-                    id="collapse-summary-button",
-                    style={
-                        "display": "inline-block",
-                        "margin-left": "10px",
-                        "width": "40px",
-                    },
-                ),
-            ],
-        ),
-        dbc.Collapse(
-            id="summary-collapse",
-            children=[
-                html.H2(children="Table Preview", style=div_style),
-                dcc.Loading(
-                    id="loading-table-preview",
-                    children=[
-                        html.Div(
-                            id="table_preview",
-                            style={
-                                "width": TABLE_WIDTH,
-                                "margin-left": "10px",
-                                "margin-right": "10px",
-                            },
-                        )
-                    ],
-                ),
-                html.H3(children="Table Summary and Filter", style=div_style),
-                html.Div(
-                    "\nFilter out all columns missing at least X percentage of rows:",
-                    style=div_style,
-                ),
-                dcc.Input(
-                    id="missing-values-input",
-                    type="number",
-                    min=0,
-                    max=100,
-                    debounce=True,
-                    value=None,
-                    style=div_style,
-                ),
-                dcc.Loading(
-                    id="loading-table-summary",
-                    children=[
-                        html.Div(
-                            id="other_summary",
-                            style={
-                                "width": GLOBAL_WIDTH,
-                                "margin-left": "10px",
-                                "margin-right": "10px",
-                            },
-                        ),
-                        html.Div(
-                            id="table_summary",
-                            style={
-                                "width": TABLE_WIDTH,
-                                "margin-left": "10px",
-                                "margin-right": "10px",
-                            },
-                        ),
-                    ],
-                ),
-                html.H2(children="Correlation Heatmap (Pearson's)", style=div_style),
-                html.Div(
-                    id="heatmap-div",
-                    style=div_style,
-                    children=[
-                        dcc.Input(
-                            id="heatmap-clustering-input",
-                            type="number",
-                            min=1,
-                            debounce=True,
-                            value=2,
-                        ),
-                        # TODO label the cluster input selection
-                        html.Div(
-                            [
-                                "Select (numerical) variables to display:",
-                                dcc.Dropdown(
-                                    id="heatmap-dropdown",
-                                    options=([]),
-                                    multi=True,
-                                    # style={'height': '100px', 'overflowY': 'auto'}
-                                ),
-                            ]
-                        ),
-                    ],
-                ),
-                dcc.Loading(
-                    id="loading-heatmap",
-                    children=[dcc.Graph(id="heatmap", figure=go.Figure())],
-                ),
-                html.H2("Manhattan Plot", style=div_style),
-                dcc.Loading(
-                    id="loading-manhattan-figure",
-                    children=[
-                        html.Div(
-                            [
-                                dcc.Checklist(
-                                    id="manhattan-active-check",
-                                    options=[
-                                        {
-                                            "label": " Plot Manhattan",
-                                            "value": "manhattan-active",
-                                        }
-                                    ],
-                                    value=[],
-                                    style={"display": "inline-block"},
-                                ),
-                            ]
-                        ),
-                        html.Div(
-                            [
-                                "p-value:  ",
-                                dcc.Input(
-                                    id="manhattan-pval-input",
-                                    type="number",
-                                    value=0.05,
-                                    step=0.0001,
-                                    debounce=True,
-                                    style={"display": "inline-block"},
-                                ),
-                            ],
-                            style=div_style,
+def server_file_options(paths, directories=False):
+    """
+    Options of the dropdowns selecting files on the server: the files in
+    data_directory, its subdirectories holding data files if directories, and paths.
+    """
+    options = [
+        {"label": name, "value": name} for name in list_data_files(data_directory)
+    ]
+    if directories:
+        options[:0] = [
+            {"label": name + os.sep, "value": name}
+            for name in list_data_directories(data_directory)
+        ]
+    options[:0] = [{"label": path, "value": path} for path in paths]
+    return options
+
+
+def serve_layout():
+    """
+    The layout, created afresh for each page load so that each page gets a session id
+    of its own, which namespaces the artifacts that its callbacks store.
+    """
+    session_id = new_session_id()
+    return html.Div(
+        children=[
+            html.Img(src=HEADER_IMAGE, height=100),
+            create_header("ABCD data exploration dashboard"),
+            html.H1(children="File selection", style=div_style),
+            html.Label(
+                children="Data File Selection (initial data read will happen"
+                " immediately)",
+                style=div_style,
+            ),
+            dcc.Upload(
+                id="data-file-upload",
+                children=html.Div(["Drag and Drop or ", html.A("Select Files")]),
+                # Several files are joined on the index columns into one
+                multiple=True,
+                style={
+                    "height": "60px",
+                    "lineHeight": "60px",
+                    "borderWidth": "1px",
+                    "borderStyle": "dashed",
+                    "borderRadius": "5px",
+                    "textAlign": "center",
+                    "margin": "10px",
+                },
+            ),
+            html.Div(
+                id="output-data-file-upload",
+                children=["No file loaded"],
+                style=div_style,
+            ),
+            # Large files are uploaded in chunks by assets/chunked_upload.js, with a
+            # progress bar updated by the chunked_upload.progress clientside callback
+            html.Div(
+                id="chunked-upload",
+                children=[
+                    html.Label("Or upload a large data file in chunks"),
+                    html.Br(),
+                    html.Button("Select File", id="chunked-upload-button"),
+                    html.Progress(
+                        id="chunked-upload-progress",
+                        value=0,
+                        max=1,
+                        style={"width": "50%", "margin-left": "10px"},
+                    ),
+                    html.Div(id="chunked-upload-message", children=[""]),
+                    html.Div(id="output-chunked-upload", children=[""]),
+                    dcc.Interval(id="chunked-upload-interval", interval=500),
+                    # Name, size and modification time of the uploaded file
+                    dcc.Store(id="chunked-upload-store"),
+                ],
+                style={"margin": "10px"},
+                **{
+                    "data-session": session_id,
+                    "data-chunk-bytes": upload_chunk_bytes,
+                    "data-accept": ",".join(f".{ext}" for ext in data_file_extensions),
+                },
+            ),
+            html.Label(
+                children="Column Filter File Selection (initial data read will happen"
+                         " immediately)",
+                style=div_style,
+            ),
+            dcc.Upload(
+                id="filter-file-upload",
+                children=html.Div(["Drag and Drop or ", html.A("Select Files")]),
+                style={
+                    "height": "60px",
+                    "lineHeight": "60px",
+                    "borderWidth": "1px",
+                    "borderStyle": "dashed",
+                    "borderRadius": "5px",
+                    "textAlign": "center",
+                    "margin": "10px",
+                },
+            ),
+            html.Div(
+                id="output-filter-file-upload",
+                children=["No file loaded"],
+                style=div_style,
+            ),
+            # Files on the server are read directly, without being uploaded
+            html.Div(
+                [
+                    html.Label(
+                        children="Or select files on the server",
+                        style=div_style,
+                    ),
+                    dcc.Dropdown(
+                        id="data-path-dropdown",
+                        options=server_file_options(
+                            server_paths["data"] or [], directories=True
                         ),
-                        html.Div(
-                            [
-                                dcc.Checklist(
-                                    id="manhattan-logscale-check",
-                                    options=[
-                                        {"label": "  logscale y-axis", "value": "LOG"}
-                                    ],
-                                    value=[],
-                                    style={"display": "inline-block"},
-                                ),
-                            ],
-                            style=div_style,
+                        value=server_paths["data"],
+                        placeholder="Data files, or directories of them",
+                        multi=True,
+                    ),
+                    html.Div(id="output-data-path", children=[""], style=div_style),
+                    dcc.Dropdown(
+                        id="filter-path-dropdown",
+                        options=server_file_options(
+                            [server_paths["filter"]] if server_paths["filter"] else []
                         ),
-                        dcc.Graph(id="manhattan-figure", figure=go.Figure()),
-                    ],
-                ),
-                html.H2(children="Per-variable Histograms and KDEs", style=div_style),
-                dcc.Checklist(
-                    "kde-checkbox",
-                    options=[{"label": " Run KDE analysis", "value": "kde-active"}],
-                    value=[],
-                    style=div_style,
-                ),
-                dcc.Loading(
-                    id="loading-kde-figure",
-                    children=[dcc.Graph(id="kde-figure", figure=go.Figure())],
-                ),
-            ],
-            is_open=True,
-        ),
-        # Hidden divs for holding the booleans identifying whether a DF is loaded in
-        # each case
-        html.Div(id="df-loaded-div", style={"display": "none"}, children=[]),
-        html.Div(id="df-filtered-loaded-div", style={"display": "none"}, children=[]),
-        html.Div(id="corr-loaded-div", style={"display": "none"}, children=[]),
-        html.Div(id="pval-loaded-div", style={"display": "none"}, children=[]),
-        html.Div(
-            [
-                html.H1(
-                    "Exploratory graphs",
-                    style={
-                        "display": "inline-block",
-                        "margin-top": "10px",
-                        "margin-bottom": "10px",
-                        "margin-left": standard_margin_left,
-                    },
-                ),
-                dbc.Button(
-                    "-",
-                    id="collapse-explore-button",
-                    style={
-                        "display": "inline-block",
-                        "margin-left": "10px",
-                        "width": "40px",
-                    },
-                ),
-            ],
-        ),
-        dbc.Collapse(
-            id="explore-collapse",
-            children=[
-                # Container to hold all the exploratory graphs
-                html.Div(id="graph-group-container", children=[]),
-                # Button at the page bottom to add a new graph
-                html.Button(
-                    "New Graph",
-                    id="add-graph-button",
-                    style={
-                        "margin-top": "10px",
-                        "margin-left": standard_margin_left,
-                        "margin-bottom": "40px",
-                    },
-                ),
-            ],
-            is_open=True,
-        ),
-    ]
-)
+                        value=server_paths["filter"],
+                        placeholder="Column filter file",
+                    ),
+                    html.Div(
+                        id="output-filter-path", children=[""], style=div_style
+                    ),
+                ],
+                style={"margin": "10px"}
+                if data_directory is not None or any(server_paths.values())
+                else {"display": "none"},
+            ),
+            html.Button("Analyse", id="load-files-button", style=div_style),
+            html.Button("Export to PDF", id="export-pdf-button", style=div_style),
+            html.Div(children=[""], id="export-div", style=div_style),
+            html.Div(
+                [
+                    html.H1(
+                        "Summary",
+                        style={
+                            "display": "inline-block",
+                            "margin-left": standard_margin_left,
+                        },
+                    ),
+                    dbc.Button(
+                        "-",
+                        id="collapse-summary-button",
+                        style={
+                            "display": "inline-block",
+                            "margin-left": "10px",
+                            "width": "40px",
+                        },
+                    ),
+                ],
+            ),
+            dbc.Collapse(
+                id="summary-collapse",
+                children=[
+                    html.H2(children="Table Preview", style=div_style),
+                    dcc.Loading(
+                        id="loading-table-preview",
+                        children=[
+                            html.Div(
+                                id="table_preview",
+                                style={
+                                    "width": TABLE_WIDTH,
+                                    "margin-left": "10px",
+                                    "margin-right": "10px",
+                                },
+                            )
+                        ],
+                    ),
+                    html.H3(children="Table Summary and Filter", style=div_style),
+                    html.Div(
+                        "\nFilter out all columns missing at least X percentage of"
+                        " rows:",
+                        style=div_style,
+                    ),
+                    dcc.Input(
+                        id="missing-values-input",
+                        type="number",
+                        min=0,
+                        max=100,
+                        debounce=True,
+                        value=None,
+                        style=div_style,
+                    ),
+                    dcc.Loading(
+                        id="loading-table-summary",
+                        children=[
+                            html.Div(
+                                id="other_summary",
+                                style={
+                                    "width": GLOBAL_WIDTH,
+                                    "margin-left": "10px",
+                                    "margin-right": "10px",
+                                },
+                            ),
+                            html.Div(
+                                id="table_summary",
+                                style={
+                                    "width": TABLE_WIDTH,
+                                    "margin-left": "10px",
+                                    "margin-right": "10px",
+                                },
+                            ),
+                        ],
+                    ),
+                    html.H2(
+                        children="Correlation Heatmap (Pearson's)", style=div_style
+                    ),
+                    html.Div(
+                        id="heatmap-div",
+                        style=div_style,
+                        children=[
+                            dcc.Input(
+                                id="heatmap-clustering-input",
+                                type="number",
+                                min=1,
+                                debounce=True,
+                                value=2,
+                            ),
+                            # TODO label the cluster input selection
+                            html.Div(
+                                [
+                                    "Select (numerical) variables to display:",
+                                    dcc.Dropdown(
+                                        id="heatmap-dropdown",
+                                        options=([]),
+                                        multi=True,
+                                        # style={'height': '100px', 'overflowY': 'auto'}
+                                    ),
+                                ]
+                            ),
+                        ],
+                    ),
+                    dcc.Loading(
+                        id="loading-heatmap",
+                        children=[dcc.Graph(id="heatmap", figure=go.Figure())],
+                    ),
+                    html.H2("Manhattan Plot", style=div_style),
+                    dcc.Loading(
+                        id="loading-manhattan-figure",
+                        children=[
+                            html.Div(
+                                [
+                                    dcc.Checklist(
+                                        id="manhattan-active-check",
+                                        options=[
+                                            {
+                                                "label": " Plot Manhattan",
+                                                "value": "manhattan-active",
+                                            }
+                                        ],
+                                        value=[],
+                                        style={"display": "inline-block"},
+                                    ),
+                                ]
+                            ),
+                            html.Div(
+                                [
+                                    "p-value:  ",
+                                    dcc.Input(
+                                        id="manhattan-pval-input",
+                                        type="number",
+                                        value=0.05,
+                                        step=0.0001,
+                                        debounce=True,
+                                        style={"display": "inline-block"},
+                                    ),
+                                ],
+                                style=div_style,
+                            ),
+                            html.Div(
+                                [
+                                    dcc.Checklist(
+                                        id="manhattan-logscale-check",
+                                        options=[
+                                            {
+                                                "label": "  logscale y-axis",
+                                                "value": "LOG",
+                                            }
+                                        ],
+                                        value=[],
+                                        style={"display": "inline-block"},
+                                    ),
+                                ],
+                                style=div_style,
+                            ),
+                            dcc.Graph(id="manhattan-figure", figure=go.Figure()),
+                        ],
+                    ),
+                    html.H2(
+                        children="Per-variable Histograms and KDEs", style=div_style
+                    ),
+                    dcc.Checklist(
+                        "kde-checkbox",
+                        options=[{"label": " Run KDE analysis", "value": "kde-active"}],
+                        value=[],
+                        style=div_style,
+                    ),
+                    dcc.Loading(
+                        id="loading-kde-figure",
+                        children=[dcc.Graph(id="kde-figure", figure=go.Figure())],
+                    ),
+                ],
+                is_open=True,
+            ),
+            # Id of the session of this page, passed to load and store
+            dcc.Store(id="session-id", data=session_id),
+            # Hidden divs for holding the booleans identifying whether a DF is loaded in
+            # each case
+            html.Div(id="df-loaded-div", style={"display": "none"}, children=[]),
+            html.Div(
+                id="df-filtered-loaded-div", style={"display": "none"}, children=[]
+            ),
+            # Version tokens of the heatmap statistics and clusters, which change each
+            # time those stages are recalculated
+            dcc.Store(id="heatmap-stats-version"),
+            dcc.Store(id="heatmap-cluster-version"),
+            # Region of the heatmap currently shown, used to fetch tiles on zooming
+            dcc.Store(id="heatmap-view"),
+            html.Div(
+                [
+                    html.H1(
+                        "Exploratory graphs",
+                        style={
+                            "display": "inline-block",
+                            "margin-top": "10px",
+                            "margin-bottom": "10px",
+                            "margin-left": standard_margin_left,
+                        },
+                    ),
+                    dbc.Button(
+                        "-",
+                        id="collapse-explore-button",
+                        style={
+                            "display": "inline-block",
+                            "margin-left": "10px",
+                            "width": "40px",
+                        },
+                    ),
+                ],
+            ),
+            dbc.Collapse(
+                id="explore-collapse",
+                children=[
+                    # Container to hold all the exploratory graphs
+                    html.Div(id="graph-group-container", children=[]),
+                    # Button at the page bottom to add a new graph
+                    html.Button(
+                        "New Graph",
+                        id="add-graph-button",
+                        style={
+                            "margin-top": "10px",
+                            "margin-left": standard_margin_left,
+                            "margin-bottom": "40px",
+                        },
+                    ),
+                ],
+                is_open=True,
+            ),
+        ]
+    )
+
+
+app.layout = serve_layout
 
 
 @app.callback(
@@ -372,50 +525,54 @@ def toggle_collapse_explore(n, is_open):
     return is_open, "-"
 
 
-def standardise_subjectkey(subjectkey):
-    if subjectkey[4] == "_":
-        return subjectkey
-
-    return subjectkey[0:4] + "_" + subjectkey[4:]
-
-
 @app.callback(
     [Output("output-data-file-upload", "children")],
     [Input("data-file-upload", "contents")],
-    [State("data-file-upload", "filename"), State("data-file-upload", "last_modified")],
+    [
+        State("data-file-upload", "filename"),
+        State("data-file-upload", "last_modified"),
+        State("filter-file-upload", "filename"),
+        State("session-id", "data"),
+    ],
     prevent_initial_call=True,
 )
 # This function is triggered by the data file upload, and parses the contents of the
-# triggering file, then saves them to the appropriate children
-def parse_input_data_file(contents, filename, date):
+# triggering files, joining them if there are several, then saves them to the
+# appropriate children
+def parse_input_data_file(contents, filenames, dates, filter_file_value, session_id):
     logging.info(f"parse data")
 
-    if contents is not None:
-        content_type, content_string = contents.split(",")
-        decoded = base64.b64decode(content_string)
+    if contents:
+
+        def decoder(file_contents):
+            def decode():
+                content_type, content_string = file_contents.split(",")
+                return base64.b64decode(content_string)
+
+            return decode
+
+        # If a filter file is already loaded, parse just the columns it lists
+        columns = None
+        if filter_file_value is not None:
+            columns = list(load("columns", session_id).get("names", [])) or None
 
         try:
-            if filename.endswith("csv"):
-                # Assume that the user uploaded a CSV file
-                df = pd.read_csv(io.StringIO(decoded.decode("utf-8")))
-            elif filename.endswith("txt"):
-                # Assume that the user uploaded a whitespace-delimited CSV file
-                df = pd.read_csv(
-                    io.StringIO(decoded.decode("utf-8")), delim_whitespace=True
-                )
-            elif filename.endswith("xlsx"):
-                # Assume that the user uploaded an excel file
-                df = pd.read_excel(io.BytesIO(decoded))
-            else:
-                raise NotImplementedError
+            # The contents are hashed as they are, base64-encoded, so that a file
+            # already in the parse cache is not even decoded
+            projected = parse_data_files(
+                [decoder(file_contents) for file_contents in contents],
+                filenames,
+                columns,
+                session_id,
+                [fingerprint(file_contents.encode()) for file_contents in contents],
+            )
         except Exception as e:
             logging.error(f"{e}")
             return [html.Div(["There was an error processing this file."])]
 
-        store("parsed", df)
-
+        date = max(dates)
         return [
-            f"{filename} loaded, last modified "
+            f"{', '.join(filenames)} loaded{projected}, last modified "
             f"{datetime.datetime.fromtimestamp(date).strftime('%Y-%m-%d %H:%M:%S')}"
         ]
 
@@ -428,12 +585,13 @@ def parse_input_data_file(contents, filename, date):
     [
         State("filter-file-upload", "filename"),
         State("filter-file-upload", "last_modified"),
+        State("session-id", "data"),
     ],
     prevent_initial_call=True,
 )
 # This function is triggered by either upload, and parses the contents of the
 # triggering file, then saves them to the appropriate children
-def parse_input_filter_file(contents, filename, date):
+def parse_input_filter_file(contents, filename, date, session_id):
     logging.info(f"parse filter")
 
     if contents is not None:
@@ -441,17 +599,12 @@ def parse_input_filter_file(contents, filename, date):
         decoded = base64.b64decode(content_string).decode()
 
         try:
-            variables_of_interest = [str(item) for item in decoded.splitlines()]
-            # Add index names if they are not present
-            variables_of_interest.extend(
-                index for index in indices if index not in variables_of_interest
-            )
-
+            variables_of_interest = read_filter_file(decoded, indices)
         except Exception as e:
             logging.error(f"{e}")
             return html.Div(["There was an error processing this file."])
         df = pd.DataFrame(variables_of_interest, columns=["names"])
-        store("columns", df)
+        store("columns", df, session_id)
 
         return [
             f"{filename} loaded, last modified "
@@ -461,43 +614,307 @@ def parse_input_filter_file(contents, filename, date):
     return ["No file loaded"]
 
 
+def parse_data_file(source, filename, columns, session_id, digest=None):
+    """
+    Parse a data file, uploaded or on the server, and store it as "parsed", with the
+    names of all its columns as "header". A file already parsed the same way, by any
+    session, is not parsed again, but its artifacts are taken from the parse cache.
+
+    :param source: bytes of the uploaded file, or path of the file on the server, or
+      a function returning either, which is only called if the file is parsed
+    :param filename: name of the file, whose extension gives its format: CSV, TSV,
+      tab or whitespace delimited text, or excel
+    :param columns: names of the columns to parse, or None for all
+    :param session_id: id of the session to store in
+    :param digest: hash identifying the contents of the file (see
+      parsing.fingerprint), or None to hash source
+    :return: description of the columns parsed, for the status message
+    """
+    if digest is None:
+        if callable(source):
+            source = source()
+        digest = fingerprint(source)
+
+    names = ["parsed", "header"]
+    key = parse_cache_key(digest, filename, parse_engine, columns)
+    if not load_cached_parse(key, names, session_id):
+        if callable(source):
+            source = source()
+        # The index columns are parsed as categoricals, from which
+        # update_df_loaded_div builds the index without hashing them again
+        df = read_data_file(
+            source, filename, parse_engine, csv_block_size, columns, indices
+        )
+        header = (
+            list(df.columns)
+            if columns is None
+            else read_data_file_header(source, filename)
+        )
+        store("parsed", df, session_id)
+        store("header", pd.DataFrame(header, columns=["names"]), session_id)
+        store_cached_parse(key, names, session_id)
+
+    return describe_parsed_columns(columns, session_id)
+
+
+def describe_parsed_columns(columns, session_id):
+    """
+    Description of the columns of the stored "parsed" DF, for the status message of
+    the data file.
+
+    :param columns: names of the columns parsed, or None for all
+    """
+    if columns is None:
+        return ""
+    n_parsed = len(load("parsed", session_id, head=0).columns)
+    n_header = len(load("header", session_id))
+    return f" ({n_parsed} of {n_header} columns, as listed in the filter file)"
+
+
+def parse_data_files(sources, filenames, columns, session_id, digests=None):
+    """
+    Parse several data files, such as the instruments of an ABCD release, and join them
+    on the index columns (see merge.read_data_files), storing them as parse_data_file
+    stores a single file. The files are parsed ingest_workers at a time, and the
+    joined files are cached as a single file is, under the hashes of all their
+    contents, in order.
+
+    :param sources: see parse_data_file, for each file
+    :param filenames: names of the files
+    :param columns: names of the columns to parse, or None for all
+    :param session_id: id of the session to store in
+    :param digests: hashes of the contents of the files, or None to hash sources
+    :return: description of the columns parsed and the time taken to parse each
+      file, for the status message
+    """
+    if len(sources) == 1:
+        digest = None if digests is None else digests[0]
+        return parse_data_file(sources[0], filenames[0], columns, session_id, digest)
+    if digests is None:
+        sources = [source() if callable(source) else source for source in sources]
+        digests = [fingerprint(source) for source in sources]
+
+    # The order of the files decides the order of the columns, and which file's
+    # values are kept of a column in several files
+    digest = fingerprint(
+        json.dumps(
+            [[d, os.path.splitext(name)[1]] for d, name in zip(digests, filenames)]
+        ).encode()
+    )
+    names = ["parsed", "header"]
+    key = parse_cache_key(digest, "", parse_engine, columns)
+    timings = ", from the parse cache"
+    if not load_cached_parse(key, names, session_id):
+        df, header, seconds = read_data_files(
+            sources,
+            filenames,
+            indices,
+            parse_engine,
+            csv_block_size,
+            columns,
+            ingest_workers,
+        )
+        store("parsed", df, session_id)
+        store("header", pd.DataFrame(header, columns=["names"]), session_id)
+        store_cached_parse(key, names, session_id)
+        timings = "; ".join(
+            f"{os.path.basename(name)} {t:.1f} s" for name, t in zip(filenames, seconds)
+        )
+        timings = f", parsed in {timings}"
+
+    return (
+        f" and joined on {', '.join(indices)}{timings}"
+        f"{describe_parsed_columns(columns, session_id)}"
+    )
+
+
+@app.callback(
+    [Output("output-data-path", "children")],
+    [Input("data-path-dropdown", "value")],
+    [
+        State("filter-file-upload", "filename"),
+        State("filter-path-dropdown", "value"),
+        State("session-id", "data"),
+    ],
+)
+# This function is triggered by selecting data files on the server, including those
+# given on the command line as the page loads, and parses them straight from disk,
+# joining them if there are several
+def parse_server_data_file(paths, filter_file_value, filter_path, session_id):
+    logging.info(f"parse server data {paths}")
+    if not paths:
+        return [""]
+
+    try:
+        real_paths, listed = resolve_data_files(
+            paths, data_directory, server_paths["data"] or []
+        )
+        # Files in the directories chosen without the index columns are left out
+        real_paths, skipped = skip_unindexed_files(real_paths, listed, indices)
+        if not real_paths:
+            raise ValueError(f"No data files in {paths}")
+
+        # If a filter file is selected, parse just the columns it lists
+        columns = None
+        if filter_path is not None:
+            real_filter_path = resolve_data_file(
+                filter_path, data_directory, [server_paths["filter"]]
+            )
+            with open(real_filter_path) as f:
+                columns = read_filter_file(f.read(), indices)
+        elif filter_file_value is not None:
+            columns = list(load("columns", session_id).get("names", [])) or None
+
+        projected = parse_data_files(real_paths, real_paths, columns, session_id)
+    except Exception as e:
+        logging.error(f"{e}")
+        return [html.Div(["There was an error processing this file."])]
+
+    if skipped:
+        projected += (
+            f"; skipped {', '.join(os.path.basename(path) for path in skipped)}"
+            f" (no {', '.join(indices)} columns)"
+        )
+    return [f"{', '.join(paths)} loaded{projected}"]
+
+
+@app.callback(
+    [Output("output-filter-path", "children")],
+    [Input("filter-path-dropdown", "value")],
+    [State("session-id", "data")],
+)
+# This function is triggered by selecting a column filter file on the server
+def parse_server_filter_file(path, session_id):
+    logging.info(f"parse server filter {path}")
+    if path is None:
+        return [""]
+
+    try:
+        real_path = resolve_data_file(path, data_directory, [server_paths["filter"]])
+        with open(real_path) as f:
+            variables_of_interest = read_filter_file(f.read(), indices)
+    except Exception as e:
+        logging.error(f"{e}")
+        return [html.Div(["There was an error processing this file."])]
+    store("columns", pd.DataFrame(variables_of_interest, columns=["names"]), session_id)
+
+    return [f"{path} loaded"]
+
+
+app.clientside_callback(
+    ClientsideFunction(namespace="chunked_upload", function_name="progress"),
+    [
+        Output("chunked-upload-progress", "value"),
+        Output("chunked-upload-progress", "max"),
+        Output("chunked-upload-message", "children"),
+        Output("chunked-upload-store", "data"),
+    ],
+    [Input("chunked-upload-interval", "n_intervals")],
+    [State("session-id", "data")],
+)
+
+
+@app.callback(
+    [Output("output-chunked-upload", "children")],
+    [Input("chunked-upload-store", "data")],
+    [
+        State("filter-file-upload", "filename"),
+        State("filter-path-dropdown", "value"),
+        State("session-id", "data"),
+    ],
+    prevent_initial_call=True,
+)
+# This function is triggered when a chunked upload is complete, and parses the spool
+# file the chunks were written to, which is then deleted
+def parse_chunked_upload(upload, filter_file_value, filter_path, session_id):
+    logging.info(f"parse chunked upload {upload}")
+    if upload is None:
+        return [""]
+
+    # If a filter file is already loaded, parse just the columns it lists
+    columns = None
+    if filter_file_value is not None or filter_path is not None:
+        columns = list(load("columns", session_id).get("names", [])) or None
+
+    try:
+        spool_path, filename = completed_upload(session_id)
+        projected = parse_data_file(spool_path, filename, columns, session_id)
+    except Exception as e:
+        logging.error(f"{e}")
+        return [html.Div(["There was an error processing this file."])]
+    finally:
+        discard_upload(session_id)
+
+    date = upload["last_modified"]
+    return [
+        f"{filename} loaded{projected}, last modified "
+        f"{datetime.datetime.fromtimestamp(date).strftime('%Y-%m-%d %H:%M:%S')}"
+    ]
+
+
 @app.callback(
     [Output("df-loaded-div", "children")],
     [Input("load-files-button", "n_clicks")],
-    [State("data-file-upload", "filename"), State("filter-file-upload", "filename")],
+    [
+        State("data-file-upload", "filename"),
+        State("filter-file-upload", "filename"),
+        State("data-path-dropdown", "value"),
+        State("filter-path-dropdown", "value"),
+        State("chunked-upload-store", "data"),
+        State("session-id", "data"),
+    ],
     prevent_initial_call=True,
 )
 # This function is triggered by the button, and takes the parsed values of the 1 or 2
-# upload components, and outputs the resulting df to the div.
-def update_df_loaded_div(n_clicks, data_file_value, filter_file_value):
+# upload components (or files on the server, or a chunked upload), and outputs the
+# resulting df to the div.
+def update_df_loaded_div(
+    n_clicks,
+    data_file_value,
+    filter_file_value,
+    data_path,
+    filter_path,
+    chunked_upload,
+    session_id,
+):
     logging.info(f"update_df_loaded_div")
     # Read in main DataFrame
-    if data_file_value is None:
+    if data_file_value is None and not data_path and chunked_upload is None:
         return [False]
-    df = load("parsed")
 
     # Read in column DataFrame, or just use all the columns in the DataFrame
-    if filter_file_value is not None:
-        variables_of_interest = list(load("columns")["names"])
-
-        # Verify that the variables of interest exist in the dataframe
-        missing_vars = [var for var in variables_of_interest if var not in df.columns]
+    if filter_file_value is not None or filter_path is not None:
+        variables_of_interest = list(load("columns", session_id)["names"])
+
+        # Verify that the variables of interest exist in the dataframe, from just its
+        # column names
+        parsed_columns = set(load("parsed", session_id, head=0).columns)
+        missing_vars = [
+            var for var in variables_of_interest if var not in parsed_columns
+        ]
 
         if missing_vars:
+            header = set(load("header", session_id).get("names", []))
+            unparsed_vars = [var for var in missing_vars if var in header]
+            if unparsed_vars:
+                raise ValueError(
+                    str(unparsed_vars)
+                    + " is in the filter file but was not parsed, as the data file"
+                    " was loaded with an earlier filter file. Load the data file"
+                    " again."
+                )
             raise ValueError(
                 str(missing_vars)
                 + " is in the filter file but not found in the data file."
             )
 
-        # Keep only the columns listed in the filter file
-        df = df[variables_of_interest]
+        # Load only the columns listed in the filter file
+        df = load("parsed", session_id, columns=variables_of_interest)
+    else:
+        df = load("parsed", session_id)
 
     df = df.drop(columns="index", errors="ignore")
 
-    # Reformat SUBJECTKEY if it doesn't have the underscore
-    # TODO: remove this when unnecessary
-    df["SUBJECTKEY"] = df["SUBJECTKEY"].apply(standardise_subjectkey)
-
     # Set certain columns to have more specific types.
     # if 'SEX' in df.columns:
     #     df['SEX'] = df['SEX'].astype('category')
@@ -506,30 +923,47 @@ def update_df_loaded_div(n_clicks, data_file_value, filter_file_value):
     #     if column in df.columns:
     #         df[column] = df[column].astype('string')
 
-    # Set SUBJECTKEY, EVENTNAME as MultiIndex
-    df.set_index(indices, inplace=True, verify_integrity=True, drop=True)
+    # Set SUBJECTKEY, EVENTNAME as MultiIndex, reformatting SUBJECTKEY if it doesn't
+    # have the underscore
+    # TODO: remove the reformatting when unnecessary
+    set_subject_index(df, indices)
+
+    if compact_dtypes_on_load:
+        df = compact_dtypes(
+            df, compact_float_tolerance, compact_max_category_fraction
+        )
 
     # Store the combined DF, and set df-loaded-div to [True]
-    store("df", df)
+    store("df", df, session_id)
 
     return [True]
 
 
 def main():
-    # Create empty feather files to simplify the handling of them if they don't exist
-    # or contain old data.
-    for name in [
-        "cluster",
-        "parsed",
-        "columns",
-        "df",
-        "filtered",
-        "corr",
-        "pval",
-        "logs",
-        "flattened_logs",
-    ]:
-        store(name, None)
+    parser = argparse.ArgumentParser(description="Run the dashboard")
+    parser.add_argument(
+        "--data",
+        nargs="+",
+        help="data files on the server, or directories of them, read directly from"
+        " disk when each page loads, and joined on the index columns if several",
+    )
+    parser.add_argument(
+        "--filter", help="column filter file on the server, used with --data"
+    )
+    args = parser.parse_args()
+    for path in args.data or []:
+        if not os.path.isfile(path) and not os.path.isdir(path):
+            parser.error(f"{path} is not a file or directory")
+    if args.data is not None:
+        server_paths["data"] = [os.path.realpath(path) for path in args.data]
+    if args.filter is not None:
+        if not os.path.isfile(args.filter):
+            parser.error(f"{args.filter} is not a file")
+        server_paths["filter"] = os.path.realpath(args.filter)
+
+    # Each page stores its artifacts in a new session, so the artifacts of earlier
+    # runs are never seen; delete those that have expired.
+    collect_garbage()
     app.run_server(debug=True)
 
 
@@ -1,178 +1,327 @@
+import os
+import re
+import json
+import math
+import time
+import hashlib
+import uuid
 import logging
-import pandas as pd
-import numpy as np
-from psych_dashboard.app import indices, cache, use_redis
+import threading
+from collections import OrderedDict
+from psych_dashboard.app import (
+    redis_client,
+    redis_compression,
+    redis_chunk_bytes,
+    load_cache_max_bytes,
+    storage_backend,
+    storage_directory,
+    session_ttl_seconds,
+    storage_quota_bytes,
+    storage_gc_interval_seconds,
+    parse_cache_directory,
+    parse_cache_max_bytes,
+)
+from psych_dashboard.condensed_stats import CondensedStats
+from psych_dashboard.storage import (
+    backends,
+    RedisBackend,
+    feather_filenames_dict,
+    empty_artifact,
+    project,
+    collect_sessions,
+)
 
 logging.getLogger(__name__)
 
+# Session used when none is given, such as when running outside the dashboard
+default_session = "default"
 
-def load_cluster_feather():
-    """
-    Utility function for reading the cluster DF from feather file, and setting the
-    index.
-    """
-    dff = pd.read_feather("cluster.feather")
+# Session ids are used in file paths, so only the ids made by new_session_id are
+# accepted
+session_id_pattern = re.compile(r"[0-9a-f]{32}")
 
-    if len(dff) > 0:
-        dff.set_index("index", inplace=True)
-    return dff
 
+def new_session_id():
+    return uuid.uuid4().hex
 
-def load_parsed_feather():
+
+def make_backend(name, session_id=default_session):
+    """
+    Create the storage backend named in the storage_backend setting, for the
+    artifacts of the given session.
     """
-    Utility function for reading raw DF from feather file - the MultiIndex has not been
-    set, and this contains all the columns, not just the filtered subset. This is called
-    just once, and converted to the main DF.
+    try:
+        backend_class = backends[name]
+    except KeyError:
+        raise ValueError(
+            f"Unknown storage backend {name}, expected one of {list(backends)}"
+        )
+    if backend_class is RedisBackend:
+        return RedisBackend(
+            redis_client,
+            redis_compression,
+            redis_chunk_bytes,
+            prefix=f"psych_dashboard:{session_id}:",
+            ttl=session_ttl_seconds,
+        )
+    return backend_class(os.path.join(storage_directory, session_id))
+
+
+# Backend of each session used by this process
+session_backends = {}
+
+
+def get_backend(session_id=None):
     """
-    dff = pd.read_feather("df_parsed.feather")
+    The storage backend of a session.
 
-    return dff
+    :param session_id: id of the session, or None for the default session
+    """
+    if session_id is None:
+        session_id = default_session
+    elif not isinstance(session_id, str) or not session_id_pattern.fullmatch(
+        session_id
+    ):
+        raise ValueError(f"Invalid session id {session_id!r}")
+    if session_id not in session_backends:
+        session_backends[session_id] = make_backend(storage_backend, session_id)
+    return session_backends[session_id]
 
 
-def load_columns_feather():
-    """
-    Utility function for reading the column-names DF from feather file, and setting the
-    index.
-    """
-    dff = pd.read_feather("df_columns.feather")
+last_collected = 0.0
 
-    if len(dff) > 0:
-        dff.set_index("index", inplace=True)
-    return dff
 
+def collect_garbage(keep=()):
+    """
+    Delete the expired sessions, and the least recently used ones beyond the storage
+    quota, at most once every storage_gc_interval_seconds. Redis expires the keys of
+    the sessions itself.
 
-def load_feather():
+    :param keep: ids of the sessions not to delete
     """
-    Utility function for the common task of reading DF from feather file, and setting
-    the MultiIndex. This is called every time the main DF needs to be accessed.
+    global last_collected
+    if storage_backend == "redis":
+        return
+    now = time.time()
+    if now - last_collected < storage_gc_interval_seconds:
+        return
+    last_collected = now
+    for session_id in collect_sessions(
+        storage_directory, session_ttl_seconds, storage_quota_bytes, keep
+    ):
+        session_backends.pop(session_id, None)
+        with loaded_cache_lock:
+            for key in [key for key in loaded_cache if key[0] == session_id]:
+                discard_loaded(key)
+
+
+# Artifacts already loaded by this process, least recently used first, keyed by
+# (session id, name). Each entry is (signature, object, size in bytes); the signature
+# changes whenever the artifact is stored again, by this or any other process, so a
+# stale entry is never returned.
+loaded_cache = OrderedDict()
+# Total size in bytes of the artifacts in loaded_cache
+loaded_cache_bytes = 0
+# Guards loaded_cache and loaded_cache_bytes, as the callbacks run in several threads
+# of the server at once
+loaded_cache_lock = threading.Lock()
+
+
+def discard_loaded(key):
     """
-    dff = pd.read_feather("df.feather")
-
-    if len(dff) > 0:
-        dff.set_index(indices, inplace=True)
-    return dff
+    Remove an artifact from loaded_cache, if it is there. The caller must hold
+    loaded_cache_lock.
+    """
+    global loaded_cache_bytes
+    entry = loaded_cache.pop(key, None)
+    if entry is not None:
+        loaded_cache_bytes -= entry[2]
 
 
-def load_filtered_feather():
+def clear_loaded_cache():
     """
-    Utility function for the common task of reading DF from feather file, and setting
-    the MultiIndex. This is called every time the main DF, filtered by missing values,
-    needs to be accessed.
+    Remove all the artifacts from loaded_cache.
     """
-    dff = pd.read_feather("df_filtered.feather")
+    global loaded_cache_bytes
+    with loaded_cache_lock:
+        loaded_cache.clear()
+        loaded_cache_bytes = 0
 
-    if len(dff) > 0:
-        dff.set_index(indices, inplace=True)
-    return dff
 
-
-def load_corr():
+def cache_view(obj):
     """
-    Utility function for the common task of reading correlation DF from feather file,
-    and setting the index.
+    A view of a cached artifact, sharing its data. Structural changes to the view,
+    such as dff.insert, adding or dropping columns, set_index or
+    dropna(inplace=True), replace the view's own list of columns and so do not
+    affect the cached artifact. The arrays of CondensedStats are made read-only.
     """
-    dff = pd.read_feather("corr.feather")
-
-    if len(dff) > 0:
-        dff.set_index("index", inplace=True)
-    return dff
-
-
-def load(name):
-    if use_redis:
-        logging.debug(f"get cache {name}")
-        try:
-            df = cache.get(name)
-            if df is None:
-                return pd.DataFrame()
-            return df
-        except KeyError:
-            return pd.DataFrame()
-    else:
-        # use feather
-        if name == "cluster":
-            return load_cluster_feather()
-        if name == "parsed":
-            return load_parsed_feather()
-        if name == "columns":
-            return load_columns_feather()
-        if name == "df":
-            return load_feather()
-        if name == "filtered":
-            return load_filtered_feather()
-        if name == "corr":
-            return load_corr()
-        if name == "pval":
-            return load_pval()
-        if name == "logs":
-            return load_logs()
-        if name == "flattened_logs":
-            return load_flattened_logs()
-        raise KeyError(name)
+    if isinstance(obj, CondensedStats):
+        return CondensedStats(obj.columns, obj.corr, obj.logs)
+    return obj.copy(deep=False)
 
 
-def store(name, df):
-    if use_redis:
-        logging.debug(f"set cache {name}")
-        cache.set(name, df)
+def cache_loaded(key, signature, obj):
+    """
+    Keep obj in loaded_cache, evicting the least recently used artifacts to stay
+    within load_cache_max_bytes.
+    """
+    global loaded_cache_bytes
+    if isinstance(obj, CondensedStats):
+        obj.corr.flags.writeable = False
+        obj.logs.flags.writeable = False
+        nbytes = obj.corr.nbytes + obj.logs.nbytes
     else:
-        # use feather
-        if df is None:
-            df = pd.DataFrame()
+        nbytes = int(obj.memory_usage(index=True, deep=True).sum())
 
-        # Map from file nickname to filename
-        feather_filenames_dict = {
-            "cluster": "cluster.feather",
-            "parsed": "df_parsed.feather",
-            "columns": "df_columns.feather",
-            "df": "df.feather",
-            "filtered": "df_filtered.feather",
-            "corr": "corr.feather",
-            "pval": "pval.feather",
-            "logs": "logs.feather",
-            "flattened_logs": "flattened_logs.feather"
-        }
+    with loaded_cache_lock:
+        discard_loaded(key)
+        if nbytes > load_cache_max_bytes:
+            logging.debug(f"{key} is too large to cache ({nbytes} bytes)")
+            return
 
-        try:
-            df.reset_index().to_feather(feather_filenames_dict[name])
-        except KeyError:
-            raise KeyError(name)
+        loaded_cache[key] = (signature, obj, nbytes)
+        loaded_cache_bytes += nbytes
+        while loaded_cache_bytes > load_cache_max_bytes:
+            evicted, entry = loaded_cache.popitem(last=False)
+            loaded_cache_bytes -= entry[2]
+            logging.debug(f"Evicted {evicted} from the load cache")
 
 
-def load_pval():
+def load(name, session_id=None, columns=None, head=None):
     """
-    Utility function for the common task of reading p-value DF from feather file, and
-    setting the index.
+    Load an artifact.
+
+    :param name: nickname of the artifact, as in feather_filenames_dict
+    :param session_id: id of the session whose artifact to load (see get_backend)
+    :param columns: for DF artifacts, list of the columns to load, or None for all.
+      Columns not in the artifact are skipped, and the index is always loaded.
+    :param head: for DF artifacts, number of rows to load, or None for all. With
+      head=0, just the column names and dtypes are loaded.
     """
-    dff = pd.read_feather("pval.feather")
-
-    if len(dff) > 0:
-        dff.set_index("index", inplace=True)
-    return dff
-
-
-def load_logs():
+    if name not in feather_filenames_dict:
+        raise KeyError(name)
+    if name == "stats" and (columns is not None or head is not None):
+        raise ValueError("stats cannot be loaded by columns or rows")
+
+    backend = get_backend(session_id)
+    backend.touch()
+
+    # Reuse the copy already loaded if the artifact is unchanged
+    key = (session_id or default_session, name)
+    signature = backend.signature(name)
+    with loaded_cache_lock:
+        entry = loaded_cache.get(key)
+        cached = signature is not None and entry is not None and entry[0] == signature
+        if cached:
+            loaded_cache.move_to_end(key)
+    if cached:
+        obj = cache_view(entry[1])
+        return obj if name == "stats" else project(obj, columns, head)
+
+    # A partial load only reads what is needed, and is not cached
+    if columns is not None or head is not None:
+        return backend.get(name, columns, head)
+
+    obj = backend.get(name)
+    if signature is not None:
+        cache_loaded(key, signature, obj)
+    return cache_view(obj)
+
+
+def store(name, df, session_id=None):
     """
-    Utility function for the common task of reading manhattan logs DF from feather file,
-    and setting the index.
+    Store an artifact, replacing any previous version.
+
+    :param name: nickname of the artifact, as in feather_filenames_dict
+    :param df: the artifact, or None for an empty one
+    :param session_id: id of the session whose artifact to store (see get_backend)
     """
-    # The use of replace is required because the DF usually contains a column that is
-    # all-Nones, which remain as Nones instead of being converted to np.nan unless we
-    # do that explicitly here.
-    dff = pd.read_feather("logs.feather").replace([None], np.nan)
+    if name not in feather_filenames_dict:
+        raise KeyError(name)
+    backend = get_backend(session_id)
+    with loaded_cache_lock:
+        discard_loaded((session_id or default_session, name))
+    if df is None:
+        df = empty_artifact(name)
+    backend.put(name, df)
+    collect_garbage(keep=[session_id or default_session])
 
-    if len(dff) > 0:
-        dff.set_index("index", inplace=True)
-    return dff
 
+def parse_cache_key(digest, filename, engine, columns=None):
+    """
+    The key of a parsed data file in the parse cache, from the hash of the file's
+    contents and what else decides how it is parsed.
 
-def load_flattened_logs():
+    :param digest: hash of the contents of the file (see parsing.fingerprint)
+    :param filename: name of the file, whose extension gives its format
+    :param engine: parse engine
+    :param columns: names of the columns parsed, or None for all
     """
-    Utility function for the common task of reading flattened manhattan logs DF from
-    feather file, and setting the MultiIndex.
+    parameters = [
+        digest,
+        os.path.splitext(filename)[1],
+        engine,
+        None if columns is None else sorted(set(columns)),
+    ]
+    return hashlib.blake2b(
+        json.dumps(parameters).encode(), digest_size=16
+    ).hexdigest()
+
+
+def parse_cache_backend(key):
     """
-    dff = pd.read_feather("flattened_logs.feather")
-
-    if len(dff) > 0:
-        dff.set_index(["first", "second"], inplace=True)
-    return dff["value"]
+    The storage backend of the artifacts cached under a key of the parse cache.
+    """
+    backend_class = backends[storage_backend]
+    if backend_class is RedisBackend:
+        return RedisBackend(
+            redis_client,
+            redis_compression,
+            redis_chunk_bytes,
+            prefix=f"psych_dashboard:parse_cache:{key}:",
+            ttl=session_ttl_seconds,
+        )
+    return backend_class(os.path.join(parse_cache_directory, key))
+
+
+def load_cached_parse(key, names, session_id=None):
+    """
+    Store the artifacts cached under a key of the parse cache as those of a session.
+    With the file backends, the session's artifacts are links to the cached files, so
+    nothing is copied.
+
+    :param key: key in the parse cache (see parse_cache_key)
+    :param names: names of the artifacts
+    :param session_id: id of the session
+    :return: whether the artifacts were in the cache
+    """
+    cache = parse_cache_backend(key)
+    if not all(cache.exists(name) for name in names):
+        return False
+    backend = get_backend(session_id)
+    try:
+        for name in names:
+            with loaded_cache_lock:
+                discard_loaded((session_id or default_session, name))
+            backend.link(cache, name)
+    except FileNotFoundError:
+        # Evicted meanwhile
+        return False
+    cache.touch()
+    logging.info(f"Loaded {names} from the parse cache")
+    return True
+
+
+def store_cached_parse(key, names, session_id=None):
+    """
+    Add the artifacts of a session to the parse cache, deleting the least recently
+    used cached files beyond parse_cache_max_bytes.
+    """
+    cache = parse_cache_backend(key)
+    backend = get_backend(session_id)
+    for name in names:
+        cache.link(backend, name)
+    if storage_backend != "redis":
+        collect_sessions(
+            parse_cache_directory, math.inf, parse_cache_max_bytes, keep=[key]
+        )
@@ -0,0 +1,212 @@
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import numpy as np
+import pandas as pd
+from pandas.api.extensions import take
+from psych_dashboard.parsing import read_data_file, read_data_file_header
+from psych_dashboard.subject_index import set_subject_index, sort_uniques
+
+logging.getLogger(__name__)
+
+
+def read_indexed_file(source, filename, engine, block_size, columns, indices):
+    """
+    Parse one of several data files to be joined, with the index columns as its
+    index (see set_subject_index).
+
+    :return: tuple of the DF, and the names of all the columns in the file
+    """
+    df = read_data_file(source, filename, engine, block_size, columns, indices)
+    header = (
+        list(df.columns)
+        if columns is None
+        else read_data_file_header(source, filename)
+    )
+    missing = [name for name in indices if name not in df.columns]
+    if missing:
+        raise ValueError(f"{filename} has no {missing} column")
+    try:
+        set_subject_index(df, indices)
+    except ValueError as e:
+        raise ValueError(f"{filename}: {e}")
+    return df, header
+
+
+def missing_index_columns(source, filename, indices):
+    """
+    The index columns missing from a data file, found from its header alone, so that
+    files which are not data files can be picked out without parsing them.
+
+    :return: list of the names of the missing index columns
+    """
+    header = read_data_file_header(source, filename)
+    return [name for name in indices if name not in header]
+
+
+def skip_unindexed_files(paths, optional, indices):
+    """
+    Leave out the optional files that lack any of the index columns, such as a column
+    filter file, or the package_info and md5 files of an ABCD release, found in a
+    directory of data files. The other files are kept, so a file named explicitly
+    without the index columns still fails to be read (see read_indexed_file).
+
+    :param paths: paths of the files
+    :param optional: paths of the files which may be left out
+    :param indices: names of the index columns
+    :return: tuple of the list of the paths of the files kept, and of those left out
+    """
+    kept = []
+    skipped = []
+    for path in paths:
+        missing = missing_index_columns(path, path, indices) if path in optional else []
+        if missing:
+            logging.warning(f"Skipped {path}, which has no {missing} column")
+            skipped.append(path)
+        else:
+            kept.append(path)
+    return kept, skipped
+
+
+def index_codes(index):
+    """
+    The levels of an index, and the codes of each row into them.
+    """
+    if isinstance(index, pd.MultiIndex):
+        return list(index.levels), [np.asarray(codes) for codes in index.codes]
+    codes, uniques = pd.factorize(index)
+    return [uniques], [codes]
+
+
+def outer_join(frames, indices):
+    """
+    Join DFs on their index, keeping the rows of all of them, as
+    pd.concat(frames, axis=1, join="outer") does, with the rows sorted by the index.
+
+    The index is joined on the codes of its levels, without hashing its values. Each
+    column is then taken into the joined rows on its own, one DF at a time, and frames
+    is emptied as this goes, so each DF can be freed once its columns have been taken.
+    The joined DF is built from these columns without copying them again (it is not
+    consolidated), so the peak memory is about that of the joined DF and one of
+    frames, where pd.concat needs that of all of frames and two joined DFs (aligned
+    and consolidated).
+
+    Columns repeated in several DFs, such as the interview age in each ABCD
+    instrument, are kept once, at their first position, with the missing values
+    filled in from the later DFs.
+
+    :param frames: list of DFs indexed by indices (see set_subject_index), which is
+      emptied
+    :param indices: names of the index columns
+    :return: joined DF, with the index columns as categoricals at the front and a
+      RangeIndex, as the index columns are parsed (see read_data_file)
+    """
+    if not frames:
+        raise ValueError("No data files to join")
+    frame_codes = [index_codes(df.index) for df in frames]
+
+    # The union of the levels of each index column, sorted
+    levels = [
+        sort_uniques(pd.Index(np.concatenate([lv[i] for lv, _ in frame_codes])))[1]
+        for i in range(len(indices))
+    ]
+    # Number each combination of codes (with one more code for missing values)
+    shape = [len(level) + 1 for level in levels]
+    keys = []
+    for frame_levels, codes in frame_codes:
+        recoded = []
+        for level, frame_level, column_codes in zip(levels, frame_levels, codes):
+            # Missing values, with code -1, take the code after those of the level,
+            # so they are sorted last, as sort_index sorts them
+            positions = np.append(level.get_indexer(frame_level), len(level))
+            recoded.append(positions[column_codes])
+        keys.append(np.ravel_multi_index(recoded, shape))
+    del frame_codes
+    joined_keys = np.unique(np.concatenate(keys))
+    n_rows = len(joined_keys)
+
+    columns = {
+        name: pd.Categorical.from_codes(np.where(codes < len(level), codes, -1), level)
+        for name, level, codes in zip(
+            indices, levels, np.unravel_index(joined_keys, shape)
+        )
+    }
+    for df_keys in keys:
+        df = frames.pop(0)
+        # The DF's row for each joined row, or -1 if it has none
+        rows = np.full(n_rows, -1, dtype=np.intp)
+        rows[np.searchsorted(joined_keys, df_keys)] = np.arange(len(df))
+        aligned = np.array_equal(rows, np.arange(n_rows))
+        for name, values in df.items():
+            values = values.array
+            if not aligned:
+                values = take(values, rows, allow_fill=True)
+            if name in columns:
+                values = pd.Series(columns[name]).combine_first(pd.Series(values))
+                values = values.array
+            columns[name] = values
+        del df
+    return pd.DataFrame(columns, copy=False)
+
+
+def read_data_files(
+    sources,
+    filenames,
+    indices,
+    engine="arrow",
+    block_size=16 * 1024 ** 2,
+    columns=None,
+    workers=1,
+    progress=None,
+):
+    """
+    Parse several data files, such as the instruments of an ABCD release, in
+    parallel, and join them on their index columns with outer_join, as a single data
+    file.
+
+    :param sources: bytes or paths of the files (see read_data_file), or functions
+      returning either, each called as its file is parsed
+    :param filenames: names of the files
+    :param indices: names of the index columns, which each file must have
+    :param engine: see read_data_file
+    :param block_size: see read_data_file
+    :param columns: names of the columns to parse, or None for all
+    :param workers: number of files parsed at once
+    :param progress: function called with the name of each file as it is parsed, the
+      seconds it took, and the numbers of files parsed so far and in all
+    :return: tuple of the joined DF, the names of all the columns in the files, and a
+      list of the seconds taken to parse each file
+    :raises ValueError: if a file lacks an index column, or has repeated index keys
+    """
+    frames = [None] * len(sources)
+    headers = [None] * len(sources)
+    seconds = [None] * len(sources)
+
+    def read(i):
+        ts = time.time()
+        source = sources[i]() if callable(sources[i]) else sources[i]
+        frames[i], headers[i] = read_indexed_file(
+            source, filenames[i], engine, block_size, columns, indices
+        )
+        seconds[i] = time.time() - ts
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(read, i): i for i in range(len(sources))}
+        for n_done, future in enumerate(as_completed(futures), 1):
+            future.result()
+            i = futures[future]
+            logging.info(
+                f"Parsed {filenames[i]} in {seconds[i]:.2f} s "
+                f"({n_done} of {len(sources)} files)"
+            )
+            if progress is not None:
+                progress(filenames[i], seconds[i], n_done, len(sources))
+
+    ts = time.time()
+    joined = outer_join(frames, indices)
+    logging.info(
+        f"Joined {len(sources)} files to {joined.shape[0]} rows and "
+        f"{joined.shape[1]} columns in {time.time() - ts:.2f} s"
+    )
+    header = list(dict.fromkeys(name for names in headers for name in names))
+    return joined, header, seconds
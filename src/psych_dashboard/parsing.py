@@ -0,0 +1,257 @@
+import io
+import hashlib
+import logging
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as csv
+
+logging.getLogger(__name__)
+
+# The file types that can be read, by extension
+data_file_extensions = ["csv", "tsv", "txt", "xlsx"]
+
+# Each of the functions below reads the data from a source, which is either the bytes
+# of an uploaded file, or the path of a file on the server. A path is read
+# incrementally, so the whole file is never held in memory.
+
+
+def _pandas_source(source):
+    return io.BytesIO(source) if isinstance(source, bytes) else source
+
+
+def _arrow_source(source):
+    return pa.py_buffer(source) if isinstance(source, bytes) else source
+
+
+def _first_line(source):
+    if isinstance(source, bytes):
+        return source[: source.find(b"\n")]
+    with open(source, "rb") as f:
+        return f.readline()
+
+
+def fingerprint(source, block_bytes=1024 ** 2):
+    """
+    A hash of the contents of a file, identifying the file however it was loaded. A
+    path is hashed in blocks of block_bytes, as it is read.
+
+    :return: hex digest
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    if isinstance(source, bytes):
+        digest.update(source)
+        return digest.hexdigest()
+    with open(source, "rb") as f:
+        for block in iter(lambda: f.read(block_bytes), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def delimiter_of(filename, source):
+    """
+    The delimiter of a delimited text file: "," for .csv, tab for .tsv, and for .txt,
+    tab if the header line contains one, or None for whitespace-delimited.
+
+    :raises NotImplementedError: if the file is not a delimited text file
+    """
+    if filename.endswith("csv"):
+        return ","
+    if filename.endswith("tsv"):
+        return "\t"
+    if filename.endswith("txt"):
+        return "\t" if b"\t" in _first_line(source) else None
+    raise NotImplementedError(filename)
+
+
+def _usecols(columns):
+    """
+    The usecols argument of the pandas readers to parse just the given columns.
+    """
+    if columns is None:
+        return None
+    wanted = set(columns)
+    return lambda col: col in wanted
+
+
+def _category_dtypes(categories):
+    """
+    The dtype argument of the pandas readers to parse the given columns as
+    categoricals (of strings).
+    """
+    return {name: "category" for name in categories}
+
+
+def read_csv_pandas(source, delimiter, columns=None, categories=()):
+    """
+    Parse delimited text with pd.read_csv. A delimiter of None splits on runs of
+    whitespace.
+
+    :param columns: names of the columns to parse, or None for all. Names not in
+      the file are skipped.
+    :param categories: names of the columns to parse as categoricals
+    """
+    if delimiter is None:
+        return pd.read_csv(
+            _pandas_source(source),
+            delim_whitespace=True,
+            usecols=_usecols(columns),
+            dtype=_category_dtypes(categories),
+        )
+    return pd.read_csv(
+        _pandas_source(source),
+        sep=delimiter,
+        usecols=_usecols(columns),
+        dtype=_category_dtypes(categories),
+    )
+
+
+def read_csv_arrow(
+    source, delimiter, block_size=16 * 1024 ** 2, columns=None, categories=()
+):
+    """
+    Parse delimited text with the pyarrow CSV reader, which parses blocks of the file
+    in parallel, directly from the bytes or file. The columns get the same dtypes as
+    with pd.read_csv: integers with missing values are float64, empty columns
+    float64, and dates and times are left as strings.
+
+    :param source: bytes or path of the file
+    :param delimiter: single character delimiter
+    :param block_size: size in bytes of the blocks parsed by each thread, which must
+      hold at least one whole row
+    :param columns: names of the columns to parse, or None for all. Names not in
+      the file are skipped, and the other columns are only split out of each row,
+      not converted.
+    :param categories: names of the columns to parse as categoricals, which are
+      dictionary-encoded as they are parsed
+    """
+    read_options = csv.ReadOptions(use_threads=True, block_size=block_size)
+    parse_options = csv.ParseOptions(delimiter=delimiter)
+    convert_options = csv.ConvertOptions(
+        strings_can_be_null=True,
+        column_types={
+            name: pa.dictionary(pa.int32(), pa.string()) for name in categories
+        },
+    )
+    if columns is not None:
+        header = read_header(source, delimiter)
+        if len(set(header)) == len(header):
+            # Keep the order of the file, as pd.read_csv does with usecols
+            wanted = set(columns)
+            convert_options.include_columns = [col for col in header if col in wanted]
+    table = csv.read_csv(
+        _arrow_source(source), read_options, parse_options, convert_options
+    )
+
+    # pd.read_csv does not parse dates unless asked to, so read them again as text
+    temporal = [
+        field.name for field in table.schema if pa.types.is_temporal(field.type)
+    ]
+    if temporal:
+        as_text = csv.read_csv(
+            _arrow_source(source),
+            read_options,
+            parse_options,
+            csv.ConvertOptions(
+                strings_can_be_null=True,
+                include_columns=temporal,
+                column_types={name: pa.string() for name in temporal},
+            ),
+        )
+        for name in temporal:
+            i = table.schema.get_field_index(name)
+            table = table.set_column(i, name, as_text.column(name))
+
+    for i, field in enumerate(table.schema):
+        if pa.types.is_null(field.type):
+            table = table.set_column(
+                i, field.name, table.column(i).cast(pa.float64())
+            )
+
+    # Rename repeated column names as pd.read_csv does, e.g. "a", "a.1"
+    names = []
+    for name in table.column_names:
+        unique_name, n = name, 0
+        while unique_name in names:
+            n += 1
+            unique_name = f"{name}.{n}"
+        names.append(unique_name)
+    table = table.rename_columns(names)
+    if columns is not None:
+        # Names repeated in the header prevent projecting while parsing
+        wanted = set(columns)
+        table = table.select([col for col in names if col in wanted])
+
+    return table.to_pandas(split_blocks=True, self_destruct=True)
+
+
+def read_header(source, delimiter):
+    """
+    The column names of delimited text, as pd.read_csv names them.
+    """
+    if delimiter is None:
+        header = pd.read_csv(_pandas_source(source), delim_whitespace=True, nrows=0)
+    else:
+        header = pd.read_csv(_pandas_source(source), sep=delimiter, nrows=0)
+    return list(header.columns)
+
+
+def read_data_file_header(source, filename):
+    """
+    The column names of a data file (see read_data_file).
+    """
+    if filename.endswith("xlsx"):
+        return list(pd.read_excel(_pandas_source(source), nrows=0).columns)
+    return read_header(source, delimiter_of(filename, source))
+
+
+def read_filter_file(text, indices):
+    """
+    The column names listed in a column filter file, one per line, followed by any of
+    the index columns that are not listed.
+    """
+    variables_of_interest = [str(item) for item in text.splitlines()]
+    variables_of_interest.extend(
+        index for index in indices if index not in variables_of_interest
+    )
+    return variables_of_interest
+
+
+def read_data_file(
+    source,
+    filename,
+    engine="arrow",
+    block_size=16 * 1024 ** 2,
+    columns=None,
+    categories=(),
+):
+    """
+    Parse a data file to a DF.
+
+    :param source: bytes of an uploaded file, or path of a file on the server
+    :param filename: name of the file, whose extension gives its format: .csv, .tsv,
+      .txt (tab-delimited, or whitespace-delimited if the header has no tabs) or
+      .xlsx
+    :param engine: "arrow" to parse delimited text with the multithreaded pyarrow
+      reader, or "pandas" for pd.read_csv. Whitespace-delimited files are always read
+      with pandas, as pyarrow needs a single character delimiter.
+    :param block_size: see read_csv_arrow
+    :param columns: names of the columns to parse, or None for all. Names not in
+      the file are skipped, and the columns are in the order of the file.
+    :param categories: names of columns of strings to parse as categoricals, such as
+      the index columns, whose values are repeated. Names not in the file are
+      skipped.
+    :raises NotImplementedError: for other types of file
+    """
+    if filename.endswith("xlsx"):
+        return pd.read_excel(
+            _pandas_source(source),
+            usecols=_usecols(columns),
+            dtype=_category_dtypes(categories),
+        )
+
+    delimiter = delimiter_of(filename, source)
+    if engine == "arrow" and delimiter is not None:
+        return read_csv_arrow(source, delimiter, block_size, columns, categories)
+    if engine not in ["arrow", "pandas"]:
+        raise ValueError(f"Unknown parse engine {engine}")
+    return read_csv_pandas(source, delimiter, columns, categories)
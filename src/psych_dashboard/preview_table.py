@@ -1,7 +1,7 @@
 import logging
 import dash_table
 import dash_html_components as html
-from dash.dependencies import Input, Output
+from dash.dependencies import Input, Output, State
 from psych_dashboard.app import app, indices
 from psych_dashboard.load_feather import load
 
@@ -11,12 +11,13 @@ logging.getLogger(__name__)
 @app.callback(
     Output("table_preview", "children"),
     [Input("df-loaded-div", "children")],
+    [State("session-id", "data")],
     prevent_initial_call=True,
 )
-def update_preview_table(df_loaded):
+def update_preview_table(df_loaded, session_id):
     logging.info(f"update_preview_table")
 
-    dff = load("df")
+    dff = load("df", session_id, head=5)
 
     # Add the indices back in as columns so we can see them in the table preview
     if dff.size > 0:
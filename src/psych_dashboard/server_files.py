@@ -0,0 +1,106 @@
+import os
+import logging
+from psych_dashboard.parsing import data_file_extensions
+
+logging.getLogger(__name__)
+
+
+def list_data_files(directory):
+    """
+    The data files (with one of data_file_extensions) in directory and its
+    subdirectories.
+
+    :param directory: directory to list, or None for none
+    :return: sorted list of the paths of the files, relative to directory
+    """
+    if directory is None:
+        return []
+    paths = []
+    for root, dirs, files in os.walk(directory):
+        dirs[:] = [name for name in dirs if not name.startswith(".")]
+        for name in files:
+            if name.rsplit(".", 1)[-1] in data_file_extensions:
+                paths.append(os.path.relpath(os.path.join(root, name), directory))
+    return sorted(paths)
+
+
+def list_data_directories(directory):
+    """
+    The subdirectories of directory holding data files (see list_data_files), at any
+    depth.
+
+    :param directory: directory to list, or None for none
+    :return: sorted list of the paths of the subdirectories, relative to directory
+    """
+    names = {os.path.dirname(path) for path in list_data_files(directory)}
+    return sorted(name for name in names if name)
+
+
+def resolve_data_path(path, directory, allowed=(), is_directory=False):
+    """
+    Check that a path chosen in the browser is a file (or directory) that may be read:
+    one within directory (after following any symbolic links), or one of the allowed
+    paths.
+
+    :param path: path of the file, relative to directory or absolute
+    :param directory: directory whose files may be read, or None for none
+    :param allowed: other paths of files (or directories) which may be read
+    :param is_directory: whether the path is of a directory
+    :return: the real path of the file
+    :raises PermissionError: if the file may not be read
+    """
+    exists = os.path.isdir if is_directory else os.path.isfile
+    if directory is not None:
+        root = os.path.realpath(directory)
+        real_path = os.path.realpath(os.path.join(root, path))
+        if os.path.commonpath([root, real_path]) == root and exists(real_path):
+            return real_path
+    real_path = os.path.realpath(path)
+    if real_path in {os.path.realpath(p) for p in allowed if p is not None}:
+        if exists(real_path):
+            return real_path
+    raise PermissionError(f"{path} is not in the data directory")
+
+
+def resolve_data_file(path, directory, allowed=()):
+    """
+    Check that a path chosen in the browser is a file that may be read (see
+    resolve_data_path).
+
+    :return: the real path of the file
+    :raises PermissionError: if the file may not be read
+    """
+    return resolve_data_path(path, directory, allowed)
+
+
+def resolve_data_files(paths, directory, allowed=()):
+    """
+    Check that the paths chosen in the browser are files that may be read (see
+    resolve_data_file), where a path may also be a directory that may be read,
+    standing for the data files in it and its subdirectories (see list_data_files).
+    Files linked to from outside such a directory are left out.
+
+    :param paths: paths of the files or directories, relative to directory or
+      absolute
+    :param directory: directory whose files may be read, or None for none
+    :param allowed: other paths of files or directories which may be read
+    :return: tuple of the list of the real paths of the files, without repeats, and
+      the set of those found only by listing a directory, rather than named
+    :raises PermissionError: if a path may not be read
+    """
+    real_paths = []
+    named = set()
+    for path in paths:
+        try:
+            real_path = resolve_data_file(path, directory, allowed)
+        except PermissionError:
+            root = resolve_data_path(path, directory, allowed, is_directory=True)
+        else:
+            real_paths.append(real_path)
+            named.add(real_path)
+            continue
+        for name in list_data_files(root):
+            real_path = os.path.realpath(os.path.join(root, name))
+            if os.path.commonpath([root, real_path]) == root:
+                real_paths.append(real_path)
+    return list(dict.fromkeys(real_paths)), set(real_paths).difference(named)
@@ -0,0 +1,634 @@
+import os
+import json
+import time
+import base64
+import uuid
+import shutil
+import logging
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+from psych_dashboard.condensed_stats import CondensedStats
+
+logging.getLogger(__name__)
+
+# Map from file nickname to filename
+feather_filenames_dict = {
+    "cluster": "cluster.feather",
+    "linkage": "linkage.feather",
+    "parsed": "df_parsed.feather",
+    "header": "df_header.feather",
+    "columns": "df_columns.feather",
+    "df": "df.feather",
+    "filtered": "df_filtered.feather",
+    "stats": "stats.feather",
+}
+
+
+def ipc_compression(name):
+    """
+    The compression of Arrow IPC streams named by a setting, such as
+    REDIS_COMPRESSION.
+
+    :param name: "lz4", "zstd", or "none", "" or None for no compression
+    :return: name of the codec, or None
+    :raises ValueError: if the compression is not one of these, or pyarrow was built
+      without it
+    """
+    if name is None or name.lower() in ("", "none"):
+        return None
+    name = name.lower()
+    if name not in ("lz4", "zstd") or not pa.Codec.is_available(name):
+        raise ValueError(
+            f"Unsupported compression {name!r}, expected lz4, zstd or none"
+        )
+    return name
+
+
+def empty_artifact(name):
+    """
+    The value of an artifact that has not been stored.
+    """
+    return CondensedStats.empty() if name == "stats" else pd.DataFrame()
+
+
+def project(dff, columns=None, head=None):
+    """
+    Select the given columns (skipping any not in dff) and the first head rows of an
+    already loaded DF.
+    """
+    if columns is not None:
+        dff = dff[[col for col in dict.fromkeys(columns) if col in dff.columns]]
+    if head is not None:
+        dff = dff.head(head)
+    return dff
+
+
+def index_to_arrays(index):
+    """
+    Convert the index of a DF to Arrow arrays, to be stored alongside its columns. The
+    levels of a MultiIndex are stored dictionary-encoded, using the MultiIndex's own
+    codes and levels, so it can be rebuilt without hashing the values again.
+
+    :return: tuple of the list of arrays and the list of their column names. A
+      RangeIndex is not stored, so both lists are empty.
+    """
+    if isinstance(index, pd.RangeIndex):
+        return [], []
+    names = [
+        name if name is not None else f"__index_level_{i}__"
+        for i, name in enumerate(index.names)
+    ]
+    if not isinstance(index, pd.MultiIndex):
+        return [pa.Array.from_pandas(index)], names
+    arrays = [
+        pa.DictionaryArray.from_arrays(
+            pa.array(codes, type=pa.int32(), mask=codes < 0),
+            pa.Array.from_pandas(level),
+        )
+        for codes, level in zip(index.codes, index.levels)
+    ]
+    return arrays, names
+
+
+def arrays_to_index(arrays, names):
+    """
+    Rebuild the index stored by index_to_arrays, from its ChunkedArrays.
+    """
+    names = [None if name.startswith("__index_level_") else name for name in names]
+    arrays = [array.combine_chunks() for array in arrays]
+    if len(arrays) == 1 and not pa.types.is_dictionary(arrays[0].type):
+        return pd.Index(arrays[0].to_pandas(), name=names[0])
+    return pd.MultiIndex(
+        levels=[pd.Index(array.dictionary.to_pandas()) for array in arrays],
+        codes=[array.indices.fill_null(-1).to_numpy() for array in arrays],
+        names=names,
+        verify_integrity=False,
+    )
+
+
+def frame_to_table(df, nan_as_null=True):
+    """
+    Convert a DF to an Arrow table, with the index stored as columns listed in the
+    schema metadata.
+
+    :param df: DF to convert
+    :param nan_as_null: if False, float columns keep nan as a value rather than as a
+      null, so that they can be converted back to pandas without a copy.
+    """
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    if not nan_as_null:
+        for i, col in enumerate(df.columns):
+            if pd.api.types.is_float_dtype(df[col].dtype):
+                table = table.set_column(
+                    i, table.field(i), pa.array(df[col].to_numpy())
+                )
+
+    index_arrays, index_columns = index_to_arrays(df.index)
+    for i, (array, name) in enumerate(zip(index_arrays, index_columns)):
+        table = table.add_column(i, name, array)
+    metadata = dict(table.schema.metadata or {})
+    metadata[b"index_columns"] = json.dumps(index_columns)
+    return table.replace_schema_metadata(metadata)
+
+
+def table_to_frame(table):
+    """
+    Convert an Arrow table written by frame_to_table back to a DF, with its index.
+    """
+    metadata = table.schema.metadata or {}
+    index_columns = json.loads(metadata.get(b"index_columns", b"[]"))
+    dff = table.drop(index_columns).to_pandas(split_blocks=True)
+    if index_columns:
+        dff.index = arrays_to_index(
+            [table.column(name) for name in index_columns], index_columns
+        )
+    return dff
+
+
+class StorageBackend:
+    """
+    Interface of the stores of the artifacts shared between callbacks, such as the
+    main DF ("df") or the correlation statistics ("stats"); see feather_filenames_dict
+    for the names. The artifacts are DFs, apart from "stats", which is CondensedStats.
+    """
+
+    def get(self, name, columns=None, head=None):
+        """
+        Load an artifact, or an empty one if it has not been stored.
+
+        :param name: name of the artifact
+        :param columns: for DF artifacts, list of the columns to load, or None for
+          all. Columns not in the artifact are skipped, and the index is always
+          loaded.
+        :param head: for DF artifacts, number of rows to load, or None for all.
+        """
+        raise NotImplementedError
+
+    def put(self, name, obj):
+        """
+        Store an artifact, replacing any previous version.
+        """
+        raise NotImplementedError
+
+    def exists(self, name):
+        """
+        Whether the artifact has been stored.
+        """
+        raise NotImplementedError
+
+    def invalidate(self, name):
+        """
+        Remove an artifact, if stored.
+        """
+        raise NotImplementedError
+
+    def size(self, name):
+        """
+        Size of the stored artifact in bytes, or 0 if it has not been stored.
+        """
+        raise NotImplementedError
+
+    def signature(self, name):
+        """
+        A value that changes whenever the artifact is stored again, by this or any
+        other process, used to know when an artifact already loaded is still current.
+        None if this is not available, or the artifact has not been stored.
+        """
+        return None
+
+    def touch(self):
+        """
+        Record that the artifacts are in use, so that they are not garbage collected.
+        """
+
+    def link(self, source, name):
+        """
+        Store an artifact of another backend as this backend's, sharing its storage
+        where possible. The artifact must not be stored again by the other backend
+        meanwhile.
+
+        :raises FileNotFoundError: if the other backend has not stored the artifact
+        """
+        if not source.exists(name):
+            raise FileNotFoundError(name)
+        self.put(name, source.get(name))
+
+
+class ArrowFileBackend(StorageBackend):
+    """
+    Stores each artifact as an Arrow IPC file (of which feather version 2 is an
+    alias) in a directory.
+    """
+
+    # Compression of the files: "lz4", "zstd" or "uncompressed"
+    compression = "lz4"
+    # Whether to memory-map the files when loading
+    memory_map = False
+
+    def __init__(self, directory="."):
+        self.directory = directory
+
+    def path(self, name):
+        try:
+            return os.path.join(self.directory, feather_filenames_dict[name])
+        except KeyError:
+            raise KeyError(name)
+
+    def read_table(self, name, columns=None):
+        return feather.read_table(
+            self.path(name), columns=columns, memory_map=self.memory_map
+        )
+
+    def write_table(self, name, table):
+        """
+        Write an Arrow table. The file is written under a temporary name and then
+        renamed, so that processes which have the previous version memory-mapped keep
+        a valid copy, and readers never see a partly written file. The temporary name
+        is unique, so processes storing the same artifact at once do not interfere.
+        """
+        path = self.path(name)
+        os.makedirs(self.directory, exist_ok=True)
+        temporary_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        feather.write_feather(table, temporary_path, compression=self.compression)
+        os.replace(temporary_path, path)
+
+    def get(self, name, columns=None, head=None):
+        path = self.path(name)
+        if not os.path.exists(path):
+            return empty_artifact(name)
+        if name == "stats":
+            return CondensedStats.from_table(self.read_table(name))
+        if columns is None and head is None:
+            return table_to_frame(self.read_table(name))
+
+        reader = pa.ipc.open_file(pa.memory_map(path))
+        names = reader.schema.names
+        if columns is not None:
+            metadata = reader.schema.metadata or {}
+            index_columns = json.loads(metadata.get(b"index_columns", b"[]"))
+            wanted = index_columns + [col for col in columns if col is not None]
+            names = [col for col in dict.fromkeys(wanted) if col in names]
+
+        if head is None:
+            return table_to_frame(self.read_table(name, names))
+
+        # Read record batches only until there are enough rows
+        batches = []
+        n_rows = 0
+        for i in range(reader.num_record_batches):
+            if n_rows >= head:
+                break
+            batch = reader.get_batch(i)
+            batches.append(batch)
+            n_rows += batch.num_rows
+        table = pa.Table.from_batches(batches, schema=reader.schema)
+        return table_to_frame(table.select(names).slice(0, head))
+
+    def put(self, name, obj):
+        if name == "stats":
+            self.write_table(name, obj.to_table())
+        else:
+            self.write_table(name, frame_to_table(obj))
+
+    def exists(self, name):
+        return os.path.exists(self.path(name))
+
+    def invalidate(self, name):
+        try:
+            os.remove(self.path(name))
+        except FileNotFoundError:
+            pass
+
+    def size(self, name):
+        try:
+            return os.path.getsize(self.path(name))
+        except FileNotFoundError:
+            return 0
+
+    def signature(self, name):
+        # The inode changes as each file is replaced by a new one
+        try:
+            st = os.stat(self.path(name))
+        except FileNotFoundError:
+            return None
+        return st.st_mtime_ns, st.st_size, st.st_ino
+
+    def link(self, source, name):
+        # A hard link to a file in the same format, which is never changed in place
+        # but replaced by a new file as it is stored again, so the two backends can
+        # share it
+        if type(source) is not type(self):
+            return super().link(source, name)
+        path = self.path(name)
+        os.makedirs(self.directory, exist_ok=True)
+        temporary_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        try:
+            os.link(source.path(name), temporary_path)
+        except FileNotFoundError:
+            raise
+        except OSError:
+            # Such as on another file system
+            shutil.copyfile(source.path(name), temporary_path)
+        os.replace(temporary_path, path)
+
+    def touch(self):
+        # The modification time of the directory is its last use (see collect_sessions)
+        try:
+            os.utime(self.directory)
+        except FileNotFoundError:
+            pass
+
+
+class FeatherBackend(ArrowFileBackend):
+    """
+    Feather files, compressed with lz4 as is the feather default.
+    """
+
+
+class CompressedArrowBackend(ArrowFileBackend):
+    """
+    Arrow IPC files compressed with zstd, which are smaller than with lz4 but slower
+    to read and write.
+    """
+
+    compression = "zstd"
+
+
+class MemoryMappedArrowBackend(ArrowFileBackend):
+    """
+    Uncompressed Arrow IPC files, memory-mapped when loading. Numeric columns are used
+    directly from the OS page cache, which is shared by all the worker processes,
+    rather than being copied into each process.
+    """
+
+    compression = "uncompressed"
+    memory_map = True
+
+    def put(self, name, obj):
+        if name == "stats":
+            self.write_table(name, obj.to_table())
+        else:
+            # Keep nan as a value in float columns, so they load without a copy
+            self.write_table(name, frame_to_table(obj, nan_as_null=False))
+
+
+class RedisBackend(StorageBackend):
+    """
+    Stores the artifacts in Redis, serialized as Arrow IPC streams.
+
+    The columns of each artifact are split into groups of about chunk_bytes, each
+    stored under its own key, so that wide DFs stay well within the Redis value size
+    limit and a load of a few columns only fetches the groups containing them. The
+    index is stored in a group of its own, along with the schema metadata, and is
+    always fetched. A metadata key per artifact lists the groups and holds the schema
+    of the columns, so that a load of no rows only fetches the index, and a generation
+    id which changes each time the artifact is stored.
+    """
+
+    def __init__(
+        self,
+        client,
+        compression="lz4",
+        chunk_bytes=64 * 1024 ** 2,
+        prefix="psych_dashboard:",
+        ttl=None,
+    ):
+        """
+        :param client: redis.Redis client
+        :param compression: compression of the Arrow IPC streams: "lz4", "zstd" or
+          None (see ipc_compression)
+        :param chunk_bytes: approximate size of the uncompressed data of each group of
+          columns
+        :param prefix: prefix of all the keys, such as a session namespace
+        :param ttl: seconds after being stored that the keys of an artifact expire, or
+          None to keep them until replaced
+        """
+        self.client = client
+        self.compression = ipc_compression(compression)
+        self.chunk_bytes = chunk_bytes
+        self.prefix = prefix
+        self.ttl = ttl
+
+    def meta_key(self, name):
+        return f"{self.prefix}{name}:meta"
+
+    def chunk_key(self, name, generation, i):
+        return f"{self.prefix}{name}:{generation}:{i}"
+
+    def read_meta(self, name):
+        meta = self.client.get(self.meta_key(name))
+        return None if meta is None else json.loads(meta)
+
+    def group_columns(self, table, index_columns):
+        """
+        Split the columns of the table, other than the index, into groups of about
+        chunk_bytes each.
+        """
+        groups = [[]]
+        group_bytes = 0
+        for name in table.column_names:
+            if name in index_columns:
+                continue
+            nbytes = table.column(name).nbytes
+            if groups[-1] and group_bytes + nbytes > self.chunk_bytes:
+                groups.append([])
+                group_bytes = 0
+            groups[-1].append(name)
+            group_bytes += nbytes
+        return groups
+
+    def serialize(self, table):
+        sink = pa.BufferOutputStream()
+        options = pa.ipc.IpcWriteOptions(compression=self.compression)
+        with pa.ipc.new_stream(sink, table.schema, options=options) as writer:
+            writer.write_table(table)
+        return sink.getvalue().to_pybytes()
+
+    def get(self, name, columns=None, head=None):
+        logging.debug(f"get redis {name}")
+        # The chunks of an older generation are deleted once a new one is stored, so
+        # if the artifact is replaced while reading, read the new generation
+        for _ in range(3):
+            meta = self.read_meta(name)
+            if meta is None:
+                return empty_artifact(name)
+            groups = meta["groups"]
+            if head == 0 and "schema" in meta:
+                # The empty columns are made from the schema, so no group is needed
+                positions = []
+            elif columns is not None:
+                wanted = set(columns)
+                positions = [
+                    i for i, group in enumerate(groups) if wanted.intersection(group)
+                ]
+            else:
+                positions = list(range(len(groups)))
+            keys = [self.chunk_key(name, meta["generation"], "index")] + [
+                self.chunk_key(name, meta["generation"], i) for i in positions
+            ]
+            chunks = self.client.mget(keys)
+            if all(chunk is not None for chunk in chunks):
+                break
+        else:
+            raise RuntimeError(f"{name} changed repeatedly while being read")
+
+        # The index chunk also holds the schema metadata of the whole table
+        tables = [
+            pa.ipc.open_stream(pa.py_buffer(chunk)).read_all() for chunk in chunks
+        ]
+        metadata = tables[0].schema.metadata
+        fields = {}
+        for table in tables:
+            fields.update(zip(table.column_names, zip(table.schema, table.columns)))
+        if head == 0 and "schema" in meta:
+            fields = {
+                col: (field, column.slice(0, 0))
+                for col, (field, column) in fields.items()
+            }
+            schema = pa.ipc.read_schema(pa.py_buffer(base64.b64decode(meta["schema"])))
+            empty = schema.empty_table()
+            for field, column in zip(empty.schema, empty.columns):
+                fields.setdefault(field.name, (field, column))
+
+        # Put the columns back in their original (or the requested) order
+        names = meta["index_columns"] + [
+            col
+            for col in (
+                dict.fromkeys(columns)
+                if columns is not None
+                else [col for group in groups for col in group]
+            )
+            if col in fields and col not in meta["index_columns"]
+        ]
+        table = pa.Table.from_arrays(
+            [fields[col][1] for col in names],
+            schema=pa.schema([fields[col][0] for col in names], metadata=metadata),
+        )
+        if head is not None:
+            table = table.slice(0, head)
+        if name == "stats":
+            return CondensedStats.from_table(table)
+        return table_to_frame(table)
+
+    def put(self, name, obj):
+        logging.debug(f"set redis {name}")
+        table = obj.to_table() if name == "stats" else frame_to_table(obj)
+        metadata = table.schema.metadata or {}
+        index_columns = json.loads(metadata.get(b"index_columns", b"[]"))
+        groups = self.group_columns(table, index_columns)
+        generation = uuid.uuid4().hex
+
+        # Write the new chunks before switching the metadata to them, so readers
+        # always see a complete generation
+        chunks = {
+            self.chunk_key(name, generation, "index"): self.serialize(
+                table.select(index_columns).replace_schema_metadata(metadata)
+            )
+        }
+        for i, group in enumerate(groups):
+            chunks[self.chunk_key(name, generation, i)] = self.serialize(
+                table.select(group).replace_schema_metadata()
+            )
+        for key, chunk in chunks.items():
+            self.client.set(key, chunk, ex=self.ttl)
+
+        old_meta = self.read_meta(name)
+        meta = {
+            "generation": generation,
+            "index_columns": index_columns,
+            "groups": groups,
+            "schema": base64.b64encode(
+                table.schema.remove_metadata().serialize().to_pybytes()
+            ).decode(),
+        }
+        self.client.set(self.meta_key(name), json.dumps(meta), ex=self.ttl)
+        if old_meta is not None:
+            self.delete_chunks(name, old_meta)
+
+    def delete_chunks(self, name, meta):
+        keys = [self.chunk_key(name, meta["generation"], "index")] + [
+            self.chunk_key(name, meta["generation"], i)
+            for i in range(len(meta["groups"]))
+        ]
+        self.client.delete(*keys)
+
+    def exists(self, name):
+        return self.client.exists(self.meta_key(name)) > 0
+
+    def invalidate(self, name):
+        meta = self.read_meta(name)
+        if meta is not None:
+            self.client.delete(self.meta_key(name))
+            self.delete_chunks(name, meta)
+
+    def size(self, name):
+        meta = self.read_meta(name)
+        if meta is None:
+            return 0
+        keys = [self.chunk_key(name, meta["generation"], "index")] + [
+            self.chunk_key(name, meta["generation"], i)
+            for i in range(len(meta["groups"]))
+        ]
+        return sum(self.client.strlen(key) for key in keys) + self.client.strlen(
+            self.meta_key(name)
+        )
+
+    def signature(self, name):
+        meta = self.read_meta(name)
+        return None if meta is None else meta["generation"]
+
+
+def collect_sessions(root, ttl, quota, keep=()):
+    """
+    Garbage collect the session directories of the file backends, each holding the
+    artifacts of one session. The sessions not used (see StorageBackend.touch) for
+    more than ttl seconds are deleted, then the least recently used sessions until the
+    total size of those left is within quota.
+
+    :param root: directory holding the session directories
+    :param ttl: seconds after its last use that a session is deleted
+    :param quota: total size in bytes of all the sessions
+    :param keep: ids of sessions never to delete, such as the sessions in use
+    :return: list of the ids of the sessions deleted
+    """
+    sessions = []
+    try:
+        entries = list(os.scandir(root))
+    except FileNotFoundError:
+        return []
+    for entry in entries:
+        try:
+            if not entry.is_dir():
+                continue
+            size = sum(
+                f.stat().st_size for f in os.scandir(entry.path) if f.is_file()
+            )
+            sessions.append((entry.stat().st_mtime, entry.name, size))
+        except FileNotFoundError:
+            # Deleted by another process meanwhile
+            continue
+
+    now = time.time()
+    total = sum(size for _, _, size in sessions)
+    deleted = []
+    for last_used, session_id, size in sorted(sessions):
+        if now - last_used <= ttl and total <= quota:
+            break
+        if session_id in keep:
+            continue
+        shutil.rmtree(os.path.join(root, session_id), ignore_errors=True)
+        total -= size
+        deleted.append(session_id)
+    if deleted:
+        logging.info(f"Deleted {len(deleted)} sessions, {total} bytes remain")
+    return deleted
+
+
+# Map from the storage_backend setting to the backend class
+backends = {
+    "feather": FeatherBackend,
+    "arrow_zstd": CompressedArrowBackend,
+    "arrow_mmap": MemoryMappedArrowBackend,
+    "redis": RedisBackend,
+}
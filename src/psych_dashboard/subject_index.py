@@ -0,0 +1,127 @@
+import logging
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+logging.getLogger(__name__)
+
+
+def standardise_subjectkeys(keys):
+    """
+    Add the underscore after the "NDAR" prefix to the subject keys without one, e.g.
+    "NDARINV001" to "NDAR_INV001", with the vectorized string functions of pyarrow.
+    Keys of 4 characters or fewer are left as they are.
+
+    :param keys: Index of the subject keys
+    :return: Index of the standardised keys
+    """
+    strings = pa.array(keys, type=pa.string(), from_pandas=True)
+    missing_underscore = pc.and_(
+        pc.greater(pc.utf8_length(strings), 4),
+        pc.not_equal(pc.utf8_slice_codeunits(strings, 4, 5), "_"),
+    )
+    if not pc.any(missing_underscore).as_py():
+        return keys
+    standardised = pc.if_else(
+        missing_underscore,
+        pc.binary_join_element_wise(
+            pc.utf8_slice_codeunits(strings, 0, 4),
+            pc.utf8_slice_codeunits(strings, 4),
+            "_",
+        ),
+        strings,
+    )
+    return pd.Index(standardised.to_pandas(), name=keys.name)
+
+
+def factorize(values):
+    """
+    Encode the values of a column as codes into an Index of its distinct values, as
+    pd.factorize does. The codes of a categorical column are used as they are, without
+    hashing the values.
+
+    :return: tuple of the array of codes (-1 for missing values) and the Index
+    """
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        return values.cat.codes.to_numpy(dtype=np.intp), values.cat.categories
+    return pd.factorize(values)
+
+
+def sort_uniques(uniques):
+    """
+    Sort values, merging any repeated ones, as pd.factorize(uniques, sort=True) does,
+    with the pyarrow sort if they are strings.
+
+    :param uniques: Index of the values
+    :return: tuple of the array of the position of each value in the sorted distinct
+      values, and the Index of those
+    """
+    if uniques.inferred_type != "string":
+        return pd.factorize(uniques, sort=True)
+    encoded = pc.dictionary_encode(pa.array(uniques, type=pa.string()))
+    order = pc.sort_indices(encoded.dictionary).to_numpy()
+    positions = np.empty(len(order), dtype=np.intp)
+    positions[order] = np.arange(len(order))
+    return (
+        positions[encoded.indices.to_numpy()],
+        pd.Index(encoded.dictionary.take(order).to_pandas(), dtype=object),
+    )
+
+
+def set_subject_index(df, indices, subjectkey="SUBJECTKEY"):
+    """
+    Set columns of a DF as its (Multi)Index, in place and dropping the columns, as
+    df.set_index(indices, inplace=True, verify_integrity=True) does, first
+    standardising the subject keys (see standardise_subjectkeys).
+
+    Each column is factorized once, or not at all if it is categorical, as the index
+    columns are parsed (see parsing.read_data_file). The subject keys are standardised
+    and sorted once per subject, rather than once per row of a longitudinal table,
+    and the index is built directly from the codes, which also give the check for
+    duplicate keys, so the values are not hashed again.
+
+    :param df: DF holding the columns
+    :param indices: names of the columns
+    :param subjectkey: name of the column of subject keys, if among indices
+    :raises ValueError: if the index has duplicate keys
+    """
+    levels = []
+    codes = []
+    for name in indices:
+        column_codes, uniques = factorize(df[name])
+        if len(uniques):
+            if name == subjectkey:
+                uniques = standardise_subjectkeys(uniques)
+            # Merge the keys made the same by standardising, and sort the values, as
+            # set_index sorts the levels
+            merged_codes, uniques = sort_uniques(uniques)
+            column_codes = np.where(
+                column_codes >= 0, merged_codes.take(column_codes, mode="clip"), -1
+            )
+        levels.append(pd.Index(uniques, name=name))
+        codes.append(column_codes)
+
+    # Number each combination of codes (shifted for -1 for missing values), to find
+    # those repeated
+    combined = np.ravel_multi_index(
+        [column_codes + 1 for column_codes in codes],
+        [len(level) + 1 for level in levels],
+    )
+    duplicated = pd.Index(combined).duplicated()
+    if duplicated.any():
+        keys = [
+            tuple(level[c] if c >= 0 else np.nan for level, c in zip(levels, key))
+            for key in zip(*[column_codes[duplicated] for column_codes in codes])
+        ]
+        raise ValueError(f"Index has duplicate keys: {list(dict.fromkeys(keys))}")
+
+    if len(indices) == 1:
+        index = levels[0].take(codes[0], allow_fill=True, fill_value=np.nan)
+    else:
+        index = pd.MultiIndex(
+            levels=levels, codes=codes, names=indices, verify_integrity=False
+        )
+    for name in indices:
+        del df[name]
+    df.index = index
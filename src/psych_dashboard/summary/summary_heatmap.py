@@ -1,12 +1,27 @@
-import itertools
+import uuid
 import logging
+import warnings
 import numpy as np
 import pandas as pd
-import scipy.stats as stats
+import dash
 from dash.dependencies import Input, Output, State
+from dash.exceptions import PreventUpdate
 import plotly.graph_objects as go
-from sklearn.cluster import AgglomerativeClustering
-from psych_dashboard.app import app
+from scipy.cluster import hierarchy
+from psych_dashboard.app import (
+    app,
+    correlation_workers,
+    correlation_block_size,
+    condensed_stats_dtype,
+    correlation_cache_path,
+    correlation_cache_max_pairs,
+    heatmap_max_columns,
+    heatmap_bins,
+)
+from psych_dashboard.condensed_stats import CondensedStats
+from psych_dashboard.correlation_cache import CorrelationCache, fingerprint_columns
+from psych_dashboard.correlation import tiled_pairwise_pearson
+from psych_dashboard.dtypes import is_numeric_column
 from psych_dashboard.load_feather import store, load
 from psych_dashboard.timing import timing, start_timer, log_timing, print_timings
 
@@ -16,329 +31,414 @@ logging.getLogger(__name__)
 @app.callback(
     [Output("heatmap-dropdown", "options"), Output("heatmap-dropdown", "value")],
     [Input("df-filtered-loaded-div", "children")],
+    [State("session-id", "data")],
     prevent_initial_call=True,
 )
 @timing
-def update_heatmap_dropdown(df_loaded):
+def update_heatmap_dropdown(df_loaded, session_id):
     logging.info(f"update_heatmap_dropdown {df_loaded}")
-    dff = load("filtered")
+    # Only the column names and dtypes are needed
+    dff = load("filtered", session_id, head=0)
 
-    options = [
-        {"label": col, "value": col}
-        for col in dff.columns
-        if dff[col].dtype in [np.int64, np.float64]
-    ]
-    return options, [
-        col for col in dff.columns if dff[col].dtype in [np.int64, np.float64]
-    ]
+    numeric_columns = [col for col in dff.columns if is_numeric_column(dff[col].dtype)]
+    options = [{"label": col, "value": col} for col in numeric_columns]
+    return options, numeric_columns
 
 
-def flattened(df):
-    """
-    Convert a DF into a Series, where the MultiIndex of each element is a combination
-    of the index/col from the original DF
+def linkage_tree(corr):
     """
-    # The series contains only half of the matrix, so filter by the order of the two
-    # level labels.
-    s = pd.Series(
-        index=pd.MultiIndex.from_tuples(
-            filter(
-                lambda x: df.index.get_loc(x[0]) < df.index.get_loc(x[1]),
-                list(itertools.product(df.index, df.columns)),
-            ),
-            names=["first", "second"],
-        ),
-        name="value",
-    )
-
-    for (a, b) in s.index:
-        s[a, b] = df[b][a]
+    Calculate the hierarchical clustering tree of the rows of the correlation matrix,
+    using Ward linkage with euclidean distance. The tree can then be cut into any
+    number of clusters with cut_clusters, without repeating the clustering.
 
-    return s
+    :param corr: square correlation matrix without missing values
+    :return: linkage matrix, as from scipy.cluster.hierarchy.linkage
+    """
+    if len(corr) < 2:
+        return np.empty((0, 4))
+    return hierarchy.linkage(np.asarray(corr), method="ward", metric="euclidean")
 
 
-def reorder_df(df, order):
+def cut_clusters(tree, n_clusters, n_columns):
     """
-    Change the row and column order of df to that given in order
+    Cut the linkage tree to give the cluster number of each column.
+
+    :param tree: linkage matrix from linkage_tree
+    :param n_clusters: requested number of clusters, limited to n_columns
+    :param n_columns: number of columns clustered in the tree
+    :return: array of the cluster number of each column
     """
-    return df.reindex(order)[order]
+    try:
+        return hierarchy.cut_tree(tree, n_clusters=min(n_clusters, n_columns)).ravel()
+    except (ValueError, TypeError):
+        return np.zeros(n_columns, dtype=int)
 
 
-def recalculate_corr_etc(selected_columns, dff, corr_dff, pval_dff, logs_dff):
+def recalculate_corr_etc(selected_columns, dff, cache):
+    """
+    Calculate the correlation coefficients and p-values of every pair of the selected
+    columns, reusing those available from the correlation cache.
+
+    :param selected_columns: list of column names
+    :param dff: DataFrame containing the selected columns
+    :param cache: CorrelationCache, which is updated with the newly calculated pairs
+    :return: tuple of square (corr, pvalues) DFs. The rows and columns are in the
+      order of the cached columns followed by the newly calculated columns.
+    """
     start_timer("recalculate_corr_etc")
-    # Work out which columns/rows are needed anew, and which are already populated
-    # TODO: note that if we load in a new file with some of the same column names,
-    #  then this old correlation data may be used erroneously.
-    existing_cols = corr_dff.columns
-    overlap = list(set(selected_columns).intersection(set(existing_cols)))
-    logging.debug(f"these are needed and already available: {overlap}")
-    required_new = list(set(selected_columns).difference(set(existing_cols)))
-    logging.debug(f"these are needed and not already available: {required_new}")
-
-    ########
-    # Create initial existing vs existing DF
-    ########
-
-    # If there is overlap, then create brand new empty dataframes.
-    # Otherwise, update the existing dataframes.
-    if len(overlap) == 0:
-        logging.debug(f"create new")
-        corr = pd.DataFrame()
-        pvalues = pd.DataFrame()
-        logs = pd.DataFrame()
-
-    else:
-        # Copy across existing data rather than recalculating (so in this operation
-        # we drop the unneeded elements)
-        # Then create nan elements in corr, p-values and logs matrices for those values
-        # which will be calculated.
-        corr = corr_dff.loc[overlap, overlap]
-        pvalues = pval_dff.loc[overlap, overlap]
-        logs = logs_dff.loc[overlap, overlap]
+    # Look up the already calculated pairs in the correlation cache, which is keyed by
+    # the contents of each column, so pairs from a previous file or an earlier
+    # selection are only reused if the data of both columns is unchanged.
+    fingerprints = fingerprint_columns(dff[selected_columns])
+    cached_corr, cached_pval, found = cache.lookup(fingerprints)
+
+    # Work out which columns/rows are needed anew, and which are already populated.
+    # The existing columns must have all their pairs with each other in the cache, so
+    # drop the column with the most missing pairs until that holds.
+    complete = np.ones(len(selected_columns), dtype=bool)
+    missing = np.count_nonzero(~found, axis=0)
+    while complete.any() and missing[complete].max() > 0:
+        worst = np.flatnonzero(complete)[np.argmax(missing[complete])]
+        complete[worst] = False
+        missing -= ~found[:, worst]
+    existing_positions = np.flatnonzero(complete)
+    new_positions = np.flatnonzero(~complete)
+    order = np.concatenate([existing_positions, new_positions])
+    ordered_columns = [selected_columns[i] for i in order]
+    n_existing = len(existing_positions)
+    logging.debug(f"these are needed and already available: {n_existing}")
+    logging.debug(f"these are needed and not already available: {len(new_positions)}")
 
     log_timing("recalculate_corr_etc", "update_summary_heatmap-init-corr")
 
-    # Populate missing elements in correlation matrix and p-values matrix using
-    # stats.pearsonr
-    # Firstly, convert the dff columns needed to numpy (far faster
-    # than doing it each iteration)
+    # Preallocate the full matrices, ordered as existing columns followed by new
+    # columns, and fill each block in place:
+    #
+    #            existing   new
+    # existing [ cached   | calculated ]
+    # new      [ (transp) | calculated ]
     start_timer("inner")
+    corr = np.empty((len(order), len(order)))
+    pvalues = np.empty((len(order), len(order)))
 
-    np_overlap = dff[overlap].to_numpy()
-    np_req = dff[required_new].to_numpy()
+    existing = np.s_[:n_existing]
+    new = np.s_[n_existing:]
+    existing_block = np.ix_(existing_positions, existing_positions)
+    corr[existing, existing] = cached_corr[existing_block]
+    pvalues[existing, existing] = cached_pval[existing_block]
 
-    log_timing("inner", "update_summary_heatmap-numpy")  # This is negligible
+    del cached_corr, cached_pval
 
-    ########
-    # Create new vs existing NumPy arrays, fill with calculated data. Then convert to
-    # DFs, and append those to existing vs existing DF, to create all vs existing DFs
-    ########
-    new_against_existing_corr = np.full(
-        shape=[len(overlap), len(required_new)], fill_value=np.nan
-    )
-    new_against_existing_pval = np.full(
-        shape=[len(overlap), len(required_new)], fill_value=np.nan
-    )
-    new_against_existing_logs = np.full(
-        shape=[len(overlap), len(required_new)], fill_value=np.nan
-    )
-
-    log_timing("inner", "update_summary_heatmap-nae_init")
+    log_timing("inner", "update_summary_heatmap-eae_copy")
 
-    for v2 in range(len(required_new)):
-        for v1 in range(len(overlap)):
-            # Mask out any pairs that contain nans (this is done pairwise rather than
-            # using .dropna on the full dataframe)
-            mask = ~np.isnan(np_overlap[:, v1]) & ~np.isnan(np_req[:, v2])
-            c, p = stats.pearsonr(np_overlap[mask, v1], np_req[mask, v2])
-            new_against_existing_corr[v1, v2] = c
-            new_against_existing_pval[v1, v2] = p
-            new_against_existing_logs[v1, v2] = -np.log10(p)
+    if len(new_positions) > 0:
+        # Convert the dff columns needed to numpy
+        np_existing = dff[[selected_columns[i] for i in existing_positions]].to_numpy(
+            dtype=np.float64, na_value=np.nan
+        )
+        np_new = dff[[selected_columns[i] for i in new_positions]].to_numpy(
+            dtype=np.float64, na_value=np.nan
+        )
 
-    log_timing("inner", "update_summary_heatmap-nae_calc")
+        log_timing("inner", "update_summary_heatmap-numpy")  # This is negligible
 
-    new_against_existing_corr_df = pd.DataFrame(
-        data=new_against_existing_corr, columns=required_new, index=overlap
-    )
-    corr[required_new] = new_against_existing_corr_df
-    # logging.debug(f'corr {corr}')
-    new_against_existing_pval_df = pd.DataFrame(
-        data=new_against_existing_pval, columns=required_new, index=overlap
-    )
-    pvalues[required_new] = new_against_existing_pval_df
-    # As new_against_existing_logs doesn't need to be transposed (the transpose is
-    # nans instead), don't use an intermediate DF.
-    logs[required_new] = pd.DataFrame(
-        data=new_against_existing_logs, columns=required_new, index=overlap
-    )
+        # The pairwise engine masks out any pairs that contain nans (this is done
+        # pairwise rather than using .dropna on the full dataframe)
+        if n_existing > 0:
+            block_corr, _, block_pval = tiled_pairwise_pearson(
+                np_existing,
+                np_new,
+                n_workers=correlation_workers,
+                block_size=correlation_block_size,
+            )
+            corr[existing, new] = block_corr
+            corr[new, existing] = block_corr.T
+            pvalues[existing, new] = block_pval
+            pvalues[new, existing] = block_pval.T
+            del block_corr, block_pval
 
-    log_timing("inner", "update_summary_heatmap-nae_copy")
+        log_timing("inner", "update_summary_heatmap-nae_calc")
 
-    ########
-    # Create existing vs new DFs by transpose (apart from logs, whose transpose is nans)
-    ########
+        corr[new, new], _, pvalues[new, new] = tiled_pairwise_pearson(
+            np_new, n_workers=correlation_workers, block_size=correlation_block_size
+        )
 
-    existing_against_new_corr = new_against_existing_corr_df.transpose()
-    existing_against_new_pval = new_against_existing_pval_df.transpose()
-    existing_against_new_logs = pd.DataFrame(
-        data=np.nan, columns=overlap, index=required_new
-    )
+        log_timing("inner", "update_summary_heatmap-nan_calc")
 
-    log_timing("inner", "update_summary_heatmap-nae_transpose")
+        # Add the newly calculated pairs which were not already in the cache
+        cache.update(fingerprints[order], corr, pvalues, ~found[np.ix_(order, order)])
+        cache.save()
 
-    # ####### Create new vs new NumPy arrays, fill with calculated data. Then convert
-    # to DFs, and append those to existing vs new DF, to create all vs new DFs #######
+    log_timing("inner", "update_summary_heatmap-cache", restart=False)
 
-    new_against_new_corr = np.full(
-        shape=[len(required_new), len(required_new)], fill_value=np.nan
-    )
-    new_against_new_pval = np.full(
-        shape=[len(required_new), len(required_new)], fill_value=np.nan
-    )
-    new_against_new_logs = np.full(
-        shape=[len(required_new), len(required_new)], fill_value=np.nan
+    # Label the matrices, without copying them
+    corr = pd.DataFrame(corr, index=ordered_columns, columns=ordered_columns, copy=False)
+    pvalues = pd.DataFrame(
+        pvalues, index=ordered_columns, columns=ordered_columns, copy=False
     )
 
-    log_timing("inner", "update_summary_heatmap-nan_init")
-
-    for (v2_idx, v2) in enumerate(required_new):
-        for (v1_idx, v1) in enumerate(required_new):
-            if np.isnan(new_against_new_corr[v1_idx, v2_idx]):
-                # Mask out any pairs that contain nans (this is done pairwise rather
-                # than using .dropna on the full dataframe)
-                mask = ~np.isnan(np_req[:, v1_idx]) & ~np.isnan(np_req[:, v2_idx])
-                c, p = stats.pearsonr(np_req[mask, v1_idx], np_req[mask, v2_idx])
-                new_against_new_corr[v1_idx, v2_idx] = c
-                new_against_new_corr[v2_idx, v1_idx] = c
-                new_against_new_pval[v1_idx, v2_idx] = p
-                new_against_new_pval[v2_idx, v1_idx] = p
-                if v1 != v2:
-                    if required_new.index(v1) < required_new.index(v2):
-                        new_against_new_logs[v1_idx, v2_idx] = -np.log10(p)
-                    else:
-                        new_against_new_logs[v2_idx, v1_idx] = -np.log10(p)
-
-    log_timing("inner", "update_summary_heatmap-nan_calc")
-
-    existing_against_new_corr[required_new] = pd.DataFrame(
-        data=new_against_new_corr, columns=required_new, index=required_new
-    )
-    existing_against_new_pval[required_new] = pd.DataFrame(
-        data=new_against_new_pval, columns=required_new, index=required_new
-    )
-    existing_against_new_logs[required_new] = pd.DataFrame(
-        data=new_against_new_logs, columns=required_new, index=required_new
-    )
-
-    log_timing("inner", "update_summary_heatmap-nan_copy")
+    log_timing("recalculate_corr_etc", "update_summary_heatmap-corr", restart=False)
 
-    ########
-    # Append all vs new DFs to all vs existing DFs to give all vs all DFs.
-    ########
+    return corr, pvalues
 
-    corr = corr.append(existing_against_new_corr)
-    pvalues = pvalues.append(existing_against_new_pval)
-    logs = logs.append(existing_against_new_logs)
 
-    log_timing("inner", "update_summary_heatmap-ean_append", restart=False)
-    log_timing("recalculate_corr_etc", "update_summary_heatmap-corr", restart=False)
-
-    return corr, pvalues, logs
+# The heatmap is calculated in three stages, each triggered by the previous one via
+# a version token, so that each stage is only re-run when its own inputs change:
+#   1. update_heatmap_stats: correlations and linkage tree of the selected columns
+#   2. update_heatmap_clusters: cut the linkage tree into the requested clusters
+#   3. update_summary_heatmap: render the figure
 
 
 @app.callback(
-    [
-        Output("heatmap", "figure"),
-        Output("corr-loaded-div", "children"),
-        Output("pval-loaded-div", "children"),
-    ],
-    [Input("heatmap-dropdown", "value"), Input("heatmap-clustering-input", "value")],
-    [State("df-loaded-div", "children")],
+    Output("heatmap-stats-version", "data"),
+    [Input("heatmap-dropdown", "value")],
+    [State("df-loaded-div", "children"), State("session-id", "data")],
     prevent_initial_call=True,
 )
 @timing
-def update_summary_heatmap(dropdown_values, clusters, df_loaded):
-    logging.info(f"update_summary_heatmap {dropdown_values} {clusters}")
+def update_heatmap_stats(dropdown_values, df_loaded, session_id):
+    logging.info(f"update_heatmap_stats {dropdown_values}")
     # Guard against the first argument being an empty list, as happens at first
     # invocation, or df_loaded being False
-    if df_loaded is False or len(dropdown_values) <= 1:
-        fig = go.Figure()
-        return fig, False, False
+    if df_loaded is False or dropdown_values is None or len(dropdown_values) <= 1:
+        return None
 
-    # Load main dataframe
-    dff = load("filtered")
+    # Load the selected columns of the main dataframe
+    dff = load("filtered", session_id, columns=dropdown_values)
 
     # Guard against the dataframe being empty
     if dff.size == 0:
-        fig = go.Figure()
-        return fig, False, False
+        return None
 
-    # Load data from previous calculation
-    corr_dff = load("corr")
-    pval_dff = load("pval")
-    logs_dff = load("logs")
-
-    # Add the index back in as a column so we can see it in the table preview
-    dff.insert(loc=0, column="SUBJECTKEY(INDEX)", value=dff.index)
+    # Load the correlations from previous calculations
+    cache = CorrelationCache(correlation_cache_path, correlation_cache_max_pairs)
 
     # The columns we want to have calculated
     selected_columns = list(dropdown_values)
     logging.debug(f"selected_columns {selected_columns}")
 
-    corr, pvalues, logs = recalculate_corr_etc(
-        selected_columns, dff, corr_dff, pval_dff, logs_dff
+    corr, pvalues = recalculate_corr_etc(selected_columns, dff, cache)
+    start_timer("update_heatmap_stats")
+
+    # Keep just one copy of each pair of statistics
+    stats = CondensedStats.from_square(
+        corr.index, corr, pvalues, dtype=condensed_stats_dtype
     )
-    start_timer("update_summary_heatmap")
 
-    corr.fillna(0, inplace=True)
+    tree = linkage_tree(corr.fillna(0))
 
-    try:
-        cluster = AgglomerativeClustering(
-            n_clusters=min(clusters, len(selected_columns)),
-            affinity="euclidean",
-            linkage="ward",
-        )
-        cluster.fit_predict(corr)
-        clx = cluster.labels_
-    except ValueError:
-        clx = [0] * len(selected_columns)
+    log_timing("update_heatmap_stats", "update_heatmap_stats-linkage")
 
-    log_timing("update_summary_heatmap", "update_summary_heatmap-cluster")
+    # Send to feather files. The rows of the linkage tree refer to the columns in the
+    # order of stats.
+    store("stats", stats, session_id)
+    store(
+        "linkage",
+        pd.DataFrame(data=tree, columns=["left", "right", "distance", "size"]),
+        session_id,
+    )
 
-    # Save cluster number of each column to a DF and then to feather.
-    cluster_df = pd.DataFrame(data=clx, index=corr.index, columns=["column_names"])
-    logging.debug(f"{cluster_df}")
-    store("cluster", cluster_df)
+    log_timing("update_heatmap_stats", "update_heatmap_stats-save", restart=False)
 
-    # TODO: what would be good here would be to rename the clusters based on the
-    #  average variance (diags) within each cluster - that would reduce the
-    #  undesirable behaviour whereby currently the clusters can jump about when
-    #  re-calculating the clustering. Sort DFs' columns/rows into order based on
-    #  clustering
-    sorted_column_order = [x for _, x in sorted(zip(clx, corr.index))]
+    return uuid.uuid4().hex
+
+
+@app.callback(
+    Output("heatmap-cluster-version", "data"),
+    [
+        Input("heatmap-stats-version", "data"),
+        Input("heatmap-clustering-input", "value"),
+    ],
+    [State("session-id", "data")],
+    prevent_initial_call=True,
+)
+@timing
+def update_heatmap_clusters(stats_version, clusters, session_id):
+    logging.info(f"update_heatmap_clusters {stats_version} {clusters}")
+    if stats_version is None:
+        return None
 
-    sorted_corr = reorder_df(corr, sorted_column_order)
-    sorted_corr = sorted_corr[sorted_corr.columns].apply(pd.to_numeric, errors="coerce")
+    # Cut the stored linkage tree, rather than repeating the clustering
+    stats = load("stats", session_id)
+    clx = cut_clusters(load("linkage", session_id).to_numpy(), clusters, len(stats))
 
-    sorted_pval = reorder_df(pvalues, sorted_column_order)
-    sorted_pval = sorted_pval[sorted_pval.columns].apply(pd.to_numeric, errors="coerce")
+    # Save cluster number of each column to a DF and then to feather.
+    cluster_df = pd.DataFrame(data=clx, index=stats.columns, columns=["column_names"])
+    logging.debug(f"{cluster_df}")
+    store("cluster", cluster_df, session_id)
 
-    sorted_logs = reorder_df(logs, sorted_column_order)
-    sorted_logs = sorted_logs[sorted_logs.columns].apply(pd.to_numeric, errors="coerce")
+    return f"{stats_version}-{clusters}"
 
-    log_timing("update_summary_heatmap", "update_summary_heatmap-reorder")
 
-    # Send to feather files
-    store("corr", sorted_corr)
-    store("pval", sorted_pval)
-    store("logs", sorted_logs)
+def bin_matrix(z, rows_per_bin, cols_per_bin, reduce):
+    """
+    Reduce each block of rows_per_bin x cols_per_bin elements of z to one value. The
+    last row and column of blocks are padded with nan, so reduce should ignore nans.
+
+    :param z: 2D array
+    :param rows_per_bin: number of rows of z in each block
+    :param cols_per_bin: number of columns of z in each block
+    :param reduce: function taking an array and axis, such as np.nanmean
+    :return: 2D array with one element per block
+    """
+    n_rows = -(-z.shape[0] // rows_per_bin)
+    n_cols = -(-z.shape[1] // cols_per_bin)
+    padded = np.full((n_rows * rows_per_bin, n_cols * cols_per_bin), np.nan)
+    padded[: z.shape[0], : z.shape[1]] = z
+    blocks = padded.reshape(n_rows, rows_per_bin, n_cols, cols_per_bin)
+    # Blocks that are entirely nan (e.g. below the diagonal) give a warning
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", category=RuntimeWarning)
+        return reduce(blocks, axis=(1, 3))
+
+
+def upper_blocks(stats, order, names, y_window, x_window):
+    """
+    A block of the upper triangle of some of the statistics, without the diagonal,
+    with the columns sorted as given and then reversed, as heatmap_figure shows them.
+    Only the block is taken from the condensed vectors (see CondensedStats.blocks).
+
+    :param stats: CondensedStats of the correlations
+    :param order: position in stats of each sorted column
+    :param names: names of the statistics
+    :param y_window: [start, stop) of the rows
+    :param x_window: [start, stop) of the (reversed) columns
+    :return: list of a 2D array for each statistic, nan on and below the diagonal
+    """
+    rows = np.arange(*y_window)
+    columns = len(order) - 1 - np.arange(*x_window)
+    blocks = stats.blocks(names, order[rows], order[columns])
+    below = rows[:, None] >= columns[None, :]
+    for block in blocks:
+        block[below] = np.nan
+    return blocks
 
-    flattened_logs = flattened(logs)
-    store("flattened_logs", flattened_logs)
 
-    log_timing("update_summary_heatmap", "update_summary_heatmap-save")
+def binned_upper_blocks(stats, order, y_window, x_window, rows_per_bin, cols_per_bin):
+    """
+    The mean correlation and the minimum p-value of each bin of a block of the upper
+    triangle (see upper_blocks and bin_matrix). The block is taken one row of bins at
+    a time, so that only that much of it is held in memory.
 
-    # Remove the upper triangle and diagonal
-    triangular = sorted_corr.to_numpy()
-    triangular[np.tril_indices(triangular.shape[0], 0)] = np.nan
-    triangular_pval = sorted_pval.to_numpy()
-    triangular_pval[np.tril_indices(triangular_pval.shape[0], 0)] = np.nan
+    :return: tuple of 2D arrays of the mean correlation and minimum p-value, with
+      one element per bin
+    """
+    y_start, y_stop = y_window
+    corr_bins = []
+    logs_bins = []
+    for start in range(y_start, y_stop, rows_per_bin):
+        rows = [start, min(start + rows_per_bin, y_stop)]
+        corr, logs = upper_blocks(stats, order, ["corr", "logs"], rows, x_window)
+        corr_bins.append(bin_matrix(corr, rows_per_bin, cols_per_bin, np.nanmean))
+        # The minimum p-value has the maximum -log10 p-value
+        logs_bins.append(bin_matrix(logs, rows_per_bin, cols_per_bin, np.nanmax))
+    return np.vstack(corr_bins), np.power(10.0, -np.vstack(logs_bins))
+
+
+def zoomed_window(relayout_data, axis, window, offset, size):
+    """
+    Work out the rows or columns of the heatmap to show after a zoom or pan.
+
+    :param relayout_data: relayoutData of the heatmap graph
+    :param axis: 'xaxis' or 'yaxis'
+    :param window: [start, stop) positions currently shown on this axis
+    :param offset: position of the current figure's coordinate 0 on this axis
+    :param size: number of positions on this axis
+    :return: [start, stop) positions to show
+    """
+    if relayout_data.get(f"{axis}.autorange"):
+        return [0, size]
+    if f"{axis}.range[0]" in relayout_data:
+        low = relayout_data[f"{axis}.range[0]"]
+        high = relayout_data[f"{axis}.range[1]"]
+    elif f"{axis}.range" in relayout_data:
+        low, high = relayout_data[f"{axis}.range"]
+    else:
+        return window
+    low, high = sorted([low + offset, high + offset])
+    # Cell k covers positions k - 0.5 to k + 0.5
+    start = max(0, int(np.floor(low + 0.5)))
+    stop = min(size, int(np.floor(high + 0.5)) + 1)
+    if stop <= start:
+        return window
+    return [start, stop]
 
-    log_timing(
-        "update_summary_heatmap",
-        "update_summary_heatmap-triangular",
-        restart=False,
-    )
 
-    fig = go.Figure(
-        go.Heatmap(
-            z=np.fliplr(triangular),
-            x=sorted_corr.columns[-1::-1],
-            y=sorted_corr.columns[:-1],
-            zmin=-1,
-            zmax=1,
-            colorscale="RdBu",
-            customdata=np.fliplr(triangular_pval),
+def heatmap_figure(stats, clx, x_window=None, y_window=None):
+    """
+    Plot the upper triangle of the correlation matrix, with the columns sorted by
+    cluster, for the given region of the matrix. The columns are shown from right to
+    left, so that the triangle is in the bottom left, and the rows from the bottom up.
+
+    If the region has more than heatmap_max_columns rows or columns, each block of
+    cells is binned into one, showing the mean correlation and the minimum p-value of
+    the block, so that the figure sent to the browser stays small.
+
+    :param stats: CondensedStats of the correlations
+    :param clx: cluster number of each column of stats
+    :param x_window: [start, stop) of the x positions to show, or None for all
+    :param y_window: [start, stop) of the y positions to show, or None for all
+    :return: tuple of the figure and a dict describing the region shown, used to
+      interpret a subsequent zoom with zoomed_window
+    """
+    # TODO: what would be good here would be to rename the clusters based on the
+    #  average variance (diags) within each cluster - that would reduce the
+    #  undesirable behaviour whereby currently the clusters can jump about when
+    #  re-calculating the clustering. Sort DFs' columns/rows into order based on
+    #  clustering
+    sorted_columns = pd.Index([x for _, x in sorted(zip(clx, stats.columns))])
+    # Position in stats of each sorted column; the statistics are taken from stats
+    # for just the region shown, rather than sorting all of them
+    order = stats.columns.get_indexer(sorted_columns)
+    n = len(sorted_columns)
+
+    x_start, x_stop = x_window or [0, n]
+    y_start, y_stop = y_window or [0, n - 1]
+    x_slice = np.s_[x_start:x_stop]
+    y_slice = np.s_[y_start:y_stop]
+
+    # Show only the upper triangle, without the diagonal, with the columns reversed.
+    # The last row has nothing above the diagonal so is not shown.
+    binned = (
+        x_stop - x_start > heatmap_max_columns or y_stop - y_start > heatmap_max_columns
+    )
+    if binned:
+        # Use numeric axes in units of the full resolution positions, so that a zoom
+        # range can be read directly as positions
+        cols_per_bin = -(-(x_stop - x_start) // heatmap_bins)
+        rows_per_bin = -(-(y_stop - y_start) // heatmap_bins)
+        z, min_pval = binned_upper_blocks(
+            stats,
+            order,
+            [y_start, y_stop],
+            [x_start, x_stop],
+            rows_per_bin,
+            cols_per_bin,
+        )
+        x = x_start + (cols_per_bin - 1) / 2 + cols_per_bin * np.arange(z.shape[1])
+        y = y_start + (rows_per_bin - 1) / 2 + rows_per_bin * np.arange(z.shape[0])
+        trace = go.Heatmap(
+            z=z,
+            x=x,
+            y=y,
+            customdata=min_pval,
+            hovertemplate=(
+                f"{cols_per_bin} x {rows_per_bin} variables<br>"
+                "mean r: %{z:.2g}<br>"
+                " min pval: %{customdata:.2g}<br>"
+                "zoom in for individual variables<extra></extra>"
+            ),
+        )
+        offset = [0, 0]
+    else:
+        corr, pval = upper_blocks(
+            stats, order, ["corr", "pval"], [y_start, y_stop], [x_start, x_stop]
+        )
+        trace = go.Heatmap(
+            z=corr,
+            x=sorted_columns[::-1][x_slice],
+            y=sorted_columns[y_slice],
+            customdata=pval,
             hovertemplate=(
                 "%{x}<br>"
                 "vs.<br>"
@@ -346,10 +446,18 @@ def update_summary_heatmap(dropdown_values, clusters, df_loaded):
                 "      r: %{z:.2g}<br>"
                 " pval: %{customdata:.2g}<extra></extra>"
             ),
-            colorbar_title_text="r",
-            hoverongaps=False,
-        ),
+        )
+        # Categorical axes count from 0 at the first column/row shown
+        offset = [x_start, y_start]
+
+    trace.update(
+        zmin=-1,
+        zmax=1,
+        colorscale="RdBu",
+        colorbar_title_text="r",
+        hoverongaps=False,
     )
+    fig = go.Figure(trace)
 
     fig.update_layout(
         xaxis_showgrid=False, yaxis_showgrid=False, plot_bgcolor="rgba(0,0,0,0)"
@@ -359,21 +467,82 @@ def update_summary_heatmap(dropdown_values, clusters, df_loaded):
     # Use these indices to plot vertical lines on the heatmap to demarcate the different
     # categories visually
     category_edges = np.concatenate((np.array([0]), np.diff(sorted(clx))))
+    edge_positions = n - np.where(category_edges)[0] - 0.5
+    edge_positions = edge_positions[
+        (edge_positions > x_start - 0.5) & (edge_positions < x_stop - 0.5)
+    ]
     fig.update_layout(
         shapes=[
             dict(
                 type="line",
                 yref="y",
-                y0=-0.5,
-                y1=len(sorted_corr.columns) - 1.5,
+                y0=y_start - 0.5 - offset[1],
+                y1=y_stop - 0.5 - offset[1],
                 xref="x",
-                x0=len(sorted_corr.columns) - float(i) - 0.5,
-                x1=len(sorted_corr.columns) - float(i) - 0.5,
+                x0=edge - offset[0],
+                x1=edge - offset[0],
             )
-            for i in np.where(category_edges)[0]
+            for edge in edge_positions
         ]
     )
 
+    view = {
+        "x": [x_start, x_stop],
+        "y": [y_start, y_stop],
+        "offset": offset,
+        "size": [n, n - 1],
+    }
+    return fig, view
+
+
+@app.callback(
+    [Output("heatmap", "figure"), Output("heatmap-view", "data")],
+    [
+        Input("heatmap-cluster-version", "data"),
+        Input("heatmap", "relayoutData"),
+    ],
+    [State("heatmap-view", "data"), State("session-id", "data")],
+    prevent_initial_call=True,
+)
+@timing
+def update_summary_heatmap(cluster_version, relayout_data, view, session_id):
+    logging.info(f"update_summary_heatmap {cluster_version} {relayout_data}")
+    if cluster_version is None:
+        return go.Figure(), None
+
+    x_window, y_window = None, None
+    triggered = [t["prop_id"] for t in dash.callback_context.triggered]
+    if "heatmap.relayoutData" in triggered:
+        # Zooming only needs a new figure when the whole heatmap is too large to send
+        # at full resolution; otherwise the browser already has every cell.
+        if (
+            view is None
+            or relayout_data is None
+            or max(view["size"]) <= heatmap_max_columns
+        ):
+            raise PreventUpdate
+        x_window = zoomed_window(
+            relayout_data, "xaxis", view["x"], view["offset"][0], view["size"][0]
+        )
+        y_window = zoomed_window(
+            relayout_data, "yaxis", view["y"], view["offset"][1], view["size"][1]
+        )
+        if x_window == view["x"] and y_window == view["y"]:
+            raise PreventUpdate
+
+    start_timer("update_summary_heatmap")
+
+    stats = load("stats", session_id)
+    clx = load("cluster", session_id)["column_names"].reindex(stats.columns).to_numpy()
+
+    log_timing("update_summary_heatmap", "update_summary_heatmap-load")
+
+    fig, view = heatmap_figure(stats, clx, x_window, y_window)
+
+    log_timing(
+        "update_summary_heatmap", "update_summary_heatmap-figure", restart=False
+    )
+
     print_timings()
 
-    return fig, True, True
+    return fig, view
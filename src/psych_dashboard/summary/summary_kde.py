@@ -14,11 +14,11 @@ from psych_dashboard.timing import timing
 @app.callback(
     Output("kde-figure", "figure"),
     [Input("heatmap-dropdown", "value"), Input("kde-checkbox", "value")],
-    [State("df-loaded-div", "children")],
+    [State("df-loaded-div", "children"), State("session-id", "data")],
     prevent_initial_call=True,
 )
 @timing
-def update_summary_kde(dropdown_values, kde_active, df_loaded):
+def update_summary_kde(dropdown_values, kde_active, df_loaded, session_id):
     logging.info(f"update_summary_kde")
     if kde_active != ["kde-active"]:
         raise PreventUpdate
@@ -28,14 +28,14 @@ def update_summary_kde(dropdown_values, kde_active, df_loaded):
     if df_loaded is False:
         return go.Figure(go.Scatter())
 
-    dff = load("filtered")
-
     n_variables = len(dropdown_values) if dropdown_values is not None else 0
 
     # Return early if no variables are selected
     if n_variables == 0:
         return go.Figure(go.Scatter())
 
+    dff = load("filtered", session_id, columns=dropdown_values)
+
     # Use a maximum of 5 columns
     n_cols = min(5, math.ceil(math.sqrt(n_variables)))
     n_rows = math.ceil(n_variables / n_cols)
@@ -55,7 +55,9 @@ def update_summary_kde(dropdown_values, kde_active, df_loaded):
                 if data_range > 0:
 
                     # Generate KDE kernel
-                    kernel = stats.gaussian_kde(this_col.dropna())
+                    kernel = stats.gaussian_kde(
+                        this_col.dropna().to_numpy(dtype=np.float64)
+                    )
                     pad = 0.1
                     # Generate linspace
                     x = np.linspace(
@@ -1,7 +1,7 @@
 import logging
 import numpy as np
 from dash.exceptions import PreventUpdate
-from dash.dependencies import Input, Output
+from dash.dependencies import Input, Output, State
 import plotly.graph_objects as go
 from psych_dashboard.app import app
 from psych_dashboard.exploratory_graphs.manhattan_graph import (
@@ -11,10 +11,6 @@ from psych_dashboard.load_feather import load
 from psych_dashboard.timing import timing, start_timer, log_timing, print_timings
 
 
-# TODO: currently only allows int64 and float64
-valid_manhattan_dtypes = [np.int64, np.float64]
-
-
 def calculate_colorscale(n_values):
     """
     Split the colorscale into n_values + 1 values. The first is black for
@@ -59,13 +55,16 @@ def calculate_colorscale(n_values):
         Input("manhattan-pval-input", "value"),
         Input("manhattan-logscale-check", "value"),
         Input("df-filtered-loaded-div", "children"),
-        Input("pval-loaded-div", "children"),
+        Input("heatmap-cluster-version", "data"),
         Input("manhattan-active-check", "value"),
     ],
+    [State("session-id", "data")],
     prevent_initial_call=True,
 )
 @timing
-def plot_manhattan(pvalue, logscale, df_loaded, pval_loaded, manhattan_active):
+def plot_manhattan(
+    pvalue, logscale, df_loaded, cluster_version, manhattan_active, session_id
+):
     logging.info(f"plot_manhattan")
 
     start_timer("plot_manhattan")
@@ -74,64 +73,50 @@ def plot_manhattan(pvalue, logscale, df_loaded, pval_loaded, manhattan_active):
     if pvalue <= 0.0 or pvalue is None:
         raise PreventUpdate
 
-    dff = load("pval")
+    stats = load("stats", session_id)
 
-    log_timing("plot_manhattan", "plot_manhattan-load_pval")
-
-    manhattan_variable = [
-        col for col in dff.columns if dff[col].dtype in valid_manhattan_dtypes
-    ]
+    log_timing("plot_manhattan", "plot_manhattan-load_stats")
 
-    if not pval_loaded or manhattan_variable is None or manhattan_variable == []:
+    if not cluster_version or len(stats) == 0:
         return go.Figure()
 
-    # Load logs and flattened logs from feather file.
-    logs = load("logs")
-    flattened_logs = load("flattened_logs")
-
-    log_timing("plot_manhattan", "plot_manhattan-load_both_logs")
-
     transformed_corrected_ref_pval = calculate_transformed_corrected_pval(
-        float(pvalue), logs
+        float(pvalue), stats.logs
     )
 
     log_timing("plot_manhattan", "plot_manhattan-tranform")
 
+    # The pairs are plotted in reverse order
+    first, second = [positions[::-1] for positions in stats.pairs()]
+    logs = stats.logs[::-1].astype(np.float64)
+
     inf_replacement = 0
-    if np.inf in flattened_logs.values:
+    if np.isinf(logs).any():
         logging.debug(f"Replacing np.inf in flattened logs")
-        temp_vals = flattened_logs.replace([np.inf, -np.inf], np.nan).dropna()
-        inf_replacement = 1.2 * np.max(np.flip(temp_vals.values))
-        flattened_logs = flattened_logs.replace([np.inf, -np.inf], inf_replacement)
+        inf_replacement = 1.2 * np.nanmax(np.where(np.isinf(logs), np.nan, logs))
+        logs[np.isinf(logs)] = inf_replacement
 
     log_timing("plot_manhattan", "plot_manhattan-load_cutoff")
 
     # Load cluster numbers to use for colouring
-    cluster_df = load("cluster")
+    cluster_df = load("cluster", session_id)
 
     log_timing("plot_manhattan", "plot_manhattan-load_cluster")
 
     # Convert to colour array - set to the cluster number if the two variables are in
     # the same cluster, and set any other pairings to -1 (which will be coloured black)
-    colors = [
-        cluster_df["column_names"][item[0]]
-        if cluster_df["column_names"][item[0]] == cluster_df["column_names"][item[1]]
-        else -1
-        for item in flattened_logs.index[::-1]
-    ]
+    clusters = cluster_df["column_names"].reindex(stats.columns).to_numpy()
+    colors = np.where(clusters[first] == clusters[second], clusters[first], -1)
 
     log_timing("plot_manhattan", "plot_manhattan-calc_colors")
 
     max_cluster = max(cluster_df["column_names"])
     # Create graph, unless there's no data, in which case create a blank graph
-    if len(flattened_logs) > 0:
+    if stats.n_pairs > 0:
         fig = go.Figure(
             go.Scatter(
-                x=[
-                    [item[i] for item in flattened_logs.index[::-1]]
-                    for i in range(0, 2)
-                ],
-                y=np.flip(flattened_logs.values),
+                x=[stats.columns[first], stats.columns[second]],
+                y=logs,
                 mode="markers",
                 marker=dict(
                     color=colors,
@@ -163,7 +148,7 @@ def plot_manhattan(pvalue, logscale, df_loaded, pval_loaded, manhattan_active):
                     y1=transformed_corrected_ref_pval,
                     xref="x",
                     x0=0,
-                    x1=len(flattened_logs) - 1,
+                    x1=stats.n_pairs - 1,
                 )
             ],
             annotations=[
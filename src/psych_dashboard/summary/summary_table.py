@@ -2,7 +2,7 @@ import logging
 import dash_html_components as html
 import dash_table
 import numpy as np
-from dash.dependencies import Input, Output
+from dash.dependencies import Input, Output, State
 from psych_dashboard.app import app, indices
 from psych_dashboard.load_feather import load, store
 from psych_dashboard.timing import timing
@@ -15,12 +15,13 @@ from psych_dashboard.timing import timing
         Output("df-filtered-loaded-div", "children"),
     ],
     [Input("df-loaded-div", "children"), Input("missing-values-input", "value")],
+    [State("session-id", "data")],
     prevent_initial_call=True,
 )
 @timing
-def update_summary_table(df_loaded, missing_value_cutoff):
+def update_summary_table(df_loaded, missing_value_cutoff, session_id):
     logging.info(f"update_summary_table")
-    dff = load("df")
+    dff = load("df", session_id)
 
     # If empty, return an empty Div
     if dff.size == 0:
@@ -56,7 +57,7 @@ def update_summary_table(df_loaded, missing_value_cutoff):
 
     # Save the filtered dff to feather file. This is the file that will be used for
     # all further processing.
-    store("filtered", dff_filtered)
+    store("filtered", dff_filtered, session_id)
 
     # Add the index back in as a column so we can see it in the table preview
     description_df.insert(loc=0, column="column name", value=description_df.index)
@@ -0,0 +1,75 @@
+import pytest
+from psych_dashboard import chunked_upload
+from psych_dashboard.app import server
+# Sets the layout, without which Dash refuses all requests
+from psych_dashboard import index  # noqa: F401
+from psych_dashboard.load_feather import new_session_id
+from psych_dashboard.parsing import read_data_file
+
+data = b"SUBJECTKEY,EVENTNAME,AGE\n" + b"".join(
+    f"NDAR_{i},baseline,{i}\n".encode() for i in range(1000)
+)
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.setattr(chunked_upload, "upload_directory", str(tmp_path))
+    monkeypatch.setattr(chunked_upload, "copy_block_bytes", 100)
+    return server.test_client()
+
+
+def put(client, url, offset, chunk):
+    return client.put(f"{url}&offset={offset}", data=chunk)
+
+
+def test_chunked_upload(client):
+    session_id = new_session_id()
+    url = f"/upload/{session_id}?filename=data.csv&size={len(data)}"
+    assert client.get(url).get_json() == {"received": 0}
+
+    assert put(client, url, 0, data[:5000]).get_json() == {"received": 5000}
+    # A chunk that does not follow on from those received is refused, with the
+    # offset to resume from
+    response = put(client, url, 7000, data[7000:])
+    assert response.status_code == 409
+    assert response.get_json() == {"received": 5000}
+    assert client.get(url).get_json() == {"received": 5000}
+    with pytest.raises(FileNotFoundError):
+        chunked_upload.completed_upload(session_id)
+
+    assert put(client, url, 5000, data[5000:]).get_json() == {"received": len(data)}
+    spool_path, filename = chunked_upload.completed_upload(session_id)
+    assert filename == "data.csv"
+    assert read_data_file(spool_path, filename).equals(read_data_file(data, filename))
+
+    # Another file starts again
+    other_url = f"/upload/{session_id}?filename=other.csv&size={len(data)}"
+    assert client.get(other_url).get_json() == {"received": 0}
+    chunked_upload.discard_upload(session_id)
+    assert chunked_upload.upload_status(session_id) is None
+
+
+@pytest.mark.parametrize("first_chunk", [0, 3])
+def test_chunk_past_end(client, first_chunk):
+    session_id = new_session_id()
+    url = f"/upload/{session_id}?filename=data.csv&size=10"
+    if first_chunk:
+        assert put(client, url, 0, data[:first_chunk]).status_code == 200
+    assert put(client, url, first_chunk, data[first_chunk:25]).status_code == 409
+    # Only the bytes up to the declared size are kept, with nothing added
+    assert client.get(url).get_json() == {"received": 10}
+    spool_path, _ = chunked_upload.completed_upload(session_id)
+    with open(spool_path, "rb") as f:
+        assert f.read() == data[:10]
+
+
+@pytest.mark.parametrize(
+    "url, status",
+    [
+        ("/upload/not-a-session?filename=data.csv&size=1", 404),
+        ("/upload/{}?filename=data.json&size=1", 415),
+        ("/upload/{}?filename=data.csv", 400),
+    ],
+)
+def test_invalid_requests(client, url, status):
+    assert client.get(url.format(new_session_id())).status_code == status
@@ -0,0 +1,93 @@
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pytest
+from psych_dashboard.condensed_stats import CondensedStats
+
+
+@pytest.fixture
+def stats():
+    names = ["c", "a", "b", "d"]
+    rng = np.random.default_rng(0)
+    corr = rng.uniform(-1, 1, size=(4, 4))
+    corr = (corr + corr.T) / 2
+    pval = rng.uniform(0, 1, size=(4, 4))
+    pval = (pval + pval.T) / 2
+    pval[1, 2] = pval[2, 1] = np.nan
+    return names, corr, pval, CondensedStats.from_square(names, corr, pval, "float64")
+
+
+def test_square_round_trip(stats):
+    names, corr, pval, s = stats
+
+    assert s.n_pairs == 6
+    upper = np.triu_indices(4, 1)
+    np.testing.assert_allclose(s.square("corr")[upper], corr[upper])
+    np.testing.assert_allclose(s.square("corr").T[upper], corr[upper])
+    np.testing.assert_allclose(s.square("pval", lower=False)[upper], pval[upper])
+    assert np.isnan(s.square("pval", lower=False)[np.tril_indices(4)]).all()
+
+
+def test_blocks_match_square(stats):
+    names, corr, pval, s = stats
+
+    rows, columns = [3, 0, 2], [1, 2]
+    block_corr, block_pval = s.blocks(["corr", "pval"], rows, columns)
+    np.testing.assert_allclose(block_corr, s.square("corr")[np.ix_(rows, columns)])
+    np.testing.assert_allclose(block_pval, s.square("pval")[np.ix_(rows, columns)])
+    # The diagonal is nan
+    assert np.isnan(block_corr[2, 1])
+
+
+def test_flattened_logs_takes_upper_triangle_in_row_major_order(stats):
+    names, corr, pval, s = stats
+
+    flattened = s.flattened_logs()
+
+    assert flattened.name == "value"
+    assert flattened.index.names == ["first", "second"]
+    assert list(flattened.index) == [
+        ("c", "a"),
+        ("c", "b"),
+        ("c", "d"),
+        ("a", "b"),
+        ("a", "d"),
+        ("b", "d"),
+    ]
+    np.testing.assert_allclose(
+        flattened.values, -np.log10(pval[np.triu_indices(4, 1)])
+    )
+
+
+def test_subset_and_logs_against(stats):
+    names, corr, pval, s = stats
+
+    subset = s.subset(["d", "a", "c"])
+    np.testing.assert_allclose(
+        subset.square("corr", diagonal=1.0),
+        pd.DataFrame(corr, index=names, columns=names)
+        .loc[["d", "a", "c"], ["d", "a", "c"]]
+        .to_numpy()
+        * (1 - np.eye(3))
+        + np.eye(3),
+    )
+
+    against = s.logs_against("a")
+    assert list(against.index) == ["c", "d"]
+    np.testing.assert_allclose(against.values, -np.log10([pval[1, 0], pval[1, 3]]))
+    assert s.logs_against("missing").empty
+
+    with pytest.raises(KeyError):
+        s.subset(["a", "missing"])
+
+
+def test_table_round_trip(stats):
+    names, corr, pval, s = stats
+
+    table = pa.Table.from_batches(s.to_table().to_batches(), s.to_table().schema)
+    loaded = CondensedStats.from_table(table)
+
+    assert list(loaded.columns) == names
+    np.testing.assert_array_equal(loaded.corr, s.corr)
+    np.testing.assert_array_equal(loaded.logs, s.logs)
+    assert len(CondensedStats.from_table(CondensedStats.empty().to_table())) == 0
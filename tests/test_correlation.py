@@ -0,0 +1,96 @@
+import numpy as np
+import pytest
+import scipy.stats as stats
+from psych_dashboard.correlation import pairwise_pearson, tiled_pairwise_pearson
+
+
+def make_data(n_rows=200, n_cols=6, missing_fraction=0.2, seed=0):
+    rng = np.random.default_rng(seed)
+    data = rng.normal(size=(n_rows, n_cols))
+    # Introduce some correlation between the columns, and an offset to check the
+    # numerical stability of the sums.
+    data[:, 1] += data[:, 0]
+    data[:, 2] = 1000.0 + 0.5 * data[:, 1] + data[:, 2]
+    data[rng.random(size=data.shape) < missing_fraction] = np.nan
+    return data
+
+
+def pearsonr_reference(x, y):
+    corr = np.full((x.shape[1], y.shape[1]), np.nan)
+    pval = np.full((x.shape[1], y.shape[1]), np.nan)
+    for i in range(x.shape[1]):
+        for j in range(y.shape[1]):
+            mask = ~np.isnan(x[:, i]) & ~np.isnan(y[:, j])
+            corr[i, j], pval[i, j] = stats.pearsonr(x[mask, i], y[mask, j])
+    return corr, pval
+
+
+@pytest.mark.parametrize("missing_fraction", [0.0, 0.3])
+def test_pairwise_pearson_matches_pearsonr(missing_fraction):
+    data = make_data(missing_fraction=missing_fraction)
+    x, y = data[:, :4], data[:, 2:]
+
+    corr, n, pval = pairwise_pearson(x, y)
+    expected_corr, expected_pval = pearsonr_reference(x, y)
+
+    np.testing.assert_allclose(corr, expected_corr, rtol=1e-10, atol=1e-12)
+    np.testing.assert_allclose(pval, expected_pval, rtol=1e-8, atol=1e-300)
+    expected_n = (~np.isnan(x)).astype(int).T @ (~np.isnan(y)).astype(int)
+    np.testing.assert_array_equal(n, expected_n)
+
+
+def test_pairwise_pearson_mixed_complete_and_gappy_columns():
+    data = make_data(n_cols=8, missing_fraction=0.0)
+    data[::7, 1] = np.nan
+    data[::5, 4] = np.nan
+    data[::3, 6] = np.nan
+
+    corr, n, pval = pairwise_pearson(data)
+    expected_corr, expected_pval = pearsonr_reference(data, data)
+    np.testing.assert_allclose(corr, expected_corr, rtol=1e-10, atol=1e-12)
+    np.testing.assert_allclose(pval, expected_pval, rtol=1e-8, atol=1e-300)
+
+    x, y = data[:, :5], data[:, 3:]
+    corr, n, pval = pairwise_pearson(x, y)
+    expected_corr, expected_pval = pearsonr_reference(x, y)
+    np.testing.assert_allclose(corr, expected_corr, rtol=1e-10, atol=1e-12)
+    np.testing.assert_allclose(pval, expected_pval, rtol=1e-8, atol=1e-300)
+
+
+def test_pairwise_pearson_self_is_symmetric():
+    data = make_data()
+
+    corr, n, pval = pairwise_pearson(data)
+
+    np.testing.assert_allclose(corr, corr.T)
+    np.testing.assert_allclose(pval, pval.T)
+    np.testing.assert_allclose(np.diag(corr), 1.0)
+
+
+def test_pairwise_pearson_degenerate_columns():
+    data = make_data(n_rows=10, n_cols=3, missing_fraction=0.0)
+    # A constant column, and a column with only two values overlapping column 0
+    data[:, 1] = 3.0
+    data[2:, 2] = np.nan
+
+    corr, n, pval = pairwise_pearson(data)
+
+    assert np.all(np.isnan(corr[1]))
+    assert np.all(np.isnan(pval[1]))
+    assert n[0, 2] == 2
+    assert abs(corr[0, 2]) == pytest.approx(1.0)
+    assert pval[0, 2] == 1.0
+
+
+def test_tiled_pairwise_pearson_matches_single_process():
+    data = make_data(n_rows=50, n_cols=11)
+
+    expected = pairwise_pearson(data)
+    tiled = tiled_pairwise_pearson(data, n_workers=2, block_size=4)
+    for a, b in zip(tiled, expected):
+        np.testing.assert_allclose(a, b, rtol=1e-12, atol=1e-300)
+
+    expected = pairwise_pearson(data[:, :3], data[:, 3:])
+    tiled = tiled_pairwise_pearson(data[:, :3], data[:, 3:], n_workers=2, block_size=2)
+    for a, b in zip(tiled, expected):
+        np.testing.assert_allclose(a, b, rtol=1e-12, atol=1e-300)
@@ -0,0 +1,89 @@
+import numpy as np
+import pandas as pd
+from psych_dashboard.correlation_cache import CorrelationCache, fingerprint_columns
+
+
+def make_df():
+    rng = np.random.default_rng(0)
+    return pd.DataFrame(rng.normal(size=(20, 4)), columns=list("abcd"))
+
+
+def test_fingerprints_depend_on_values_and_index_but_not_name():
+    df = make_df()
+    fingerprints = fingerprint_columns(df)
+
+    assert len(set(fingerprints)) == 4
+    renamed = df.rename(columns={"a": "z"})
+    assert fingerprint_columns(renamed)[0] == fingerprints[0]
+
+    changed = df.copy()
+    changed.iloc[3, 1] += 1
+    assert list(fingerprint_columns(changed) == fingerprints) == [
+        True,
+        False,
+        True,
+        True,
+    ]
+
+    reindexed = df.set_index(df.index + 1)
+    assert not (fingerprint_columns(reindexed) == fingerprints).any()
+
+
+def test_index_is_hashed_once(monkeypatch):
+    df = make_df()
+    df.index = pd.MultiIndex.from_product(
+        [[f"NDAR_{i}" for i in range(10)], ["baseline", "followup"]],
+        names=["SUBJECTKEY", "EVENTNAME"],
+    )
+    expected = fingerprint_columns(df)
+
+    hashed = []
+    hash_pandas_object = pd.util.hash_pandas_object
+
+    def record(obj, index=True):
+        hashed.append((type(obj), index))
+        return hash_pandas_object(obj, index=index)
+
+    monkeypatch.setattr(pd.util, "hash_pandas_object", record)
+    assert (fingerprint_columns(df) == expected).all()
+    assert hashed == [(pd.MultiIndex, False)] + [(pd.Series, False)] * 4
+
+
+def test_cache_round_trip_and_lru_eviction(tmp_path):
+    path = str(tmp_path / "cache.feather")
+    fingerprints = fingerprint_columns(make_df())
+    corr = np.arange(16, dtype=float).reshape(4, 4)
+    corr = corr + corr.T
+    pval = corr / 100
+
+    cache = CorrelationCache(path, max_pairs=10)
+    cache.update(fingerprints[:3], corr[:3, :3], pval[:3, :3], np.ones((3, 3), bool))
+    cache.save()
+
+    cache = CorrelationCache(path, max_pairs=4)
+    assert len(cache) == 3
+    # Look up a different order to check the pairs are matched by fingerprint
+    order = [2, 0, 1]
+    found_corr, found_pval, found = cache.lookup(fingerprints[order])
+    assert found.all()
+    off_diagonal = ~np.eye(3, dtype=bool)
+    np.testing.assert_array_equal(
+        found_corr[off_diagonal], corr[np.ix_(order, order)][off_diagonal]
+    )
+    np.testing.assert_array_equal(
+        found_pval[off_diagonal], pval[np.ix_(order, order)][off_diagonal]
+    )
+
+    # Add the three pairs with column 3, which evicts the two least recently used
+    # pairs, one of which was refreshed by a lookup
+    cache.lookup(fingerprints[[0, 1]])
+    mask = np.zeros((4, 4), dtype=bool)
+    mask[3, :] = mask[:, 3] = True
+    cache.update(fingerprints, corr, pval, mask)
+    cache.save()
+
+    cache = CorrelationCache(path, max_pairs=4)
+    _, _, found = cache.lookup(fingerprints)
+    assert len(cache) == 4
+    assert found[0, 1] and found[0, 3] and found[1, 3] and found[2, 3]
+    assert not found[0, 2] and not found[1, 2]
@@ -0,0 +1,75 @@
+import numpy as np
+import pandas as pd
+import pytest
+from psych_dashboard.correlation import pairwise_pearson
+from psych_dashboard.dtypes import compact_dtypes, is_numeric_column
+from psych_dashboard.storage import backends
+
+
+@pytest.fixture
+def df():
+    n = 100
+    index = pd.MultiIndex.from_arrays(
+        [[f"NDAR_{i:03d}" for i in range(n)], ["baseline"] * n],
+        names=["SUBJECTKEY", "EVENTNAME"],
+    )
+    rng = np.random.default_rng(0)
+    age = rng.integers(100, 150, n).astype(float)
+    age[::7] = np.nan
+    return pd.DataFrame(
+        {
+            "AGE": age,
+            "HALVES": np.arange(n) / 2,
+            "SCORE": rng.normal(size=n),
+            "COUNT": np.arange(n) * 1000,
+            "SEX": rng.choice(["M", "F"], n).astype(object),
+            "NOTE": [f"note {i}" for i in range(n)],
+        },
+        index=index,
+    )
+
+
+def test_compact_dtypes(df):
+    compacted = compact_dtypes(df)
+    assert compacted.dtypes.to_dict() == {
+        "AGE": pd.Int16Dtype(),
+        "HALVES": np.float32,
+        "SCORE": np.float64,
+        "COUNT": np.int32,
+        "SEX": "category",
+        "NOTE": object,
+    }
+    pd.testing.assert_index_equal(compacted.index, df.index)
+    pd.testing.assert_frame_equal(
+        compacted.astype(df.dtypes.to_dict()), df, check_exact=True
+    )
+    assert (
+        compacted.memory_usage(deep=True).sum() < df.memory_usage(deep=True).sum()
+    )
+
+
+def test_compact_dtypes_float_tolerance(df):
+    assert compact_dtypes(df, float_tolerance=1e-6)["SCORE"].dtype == np.float32
+    assert compact_dtypes(df, float_tolerance=1e-12)["SCORE"].dtype == np.float64
+
+
+def test_compact_dtypes_stay_numeric(df):
+    compacted = compact_dtypes(df)
+    assert [col for col in df.columns if is_numeric_column(df[col].dtype)] == [
+        col for col in compacted.columns if is_numeric_column(compacted[col].dtype)
+    ]
+    assert not is_numeric_column(np.bool_)
+
+    # Nullable integers give the same correlations as the floats they came from
+    np.testing.assert_allclose(
+        pairwise_pearson(compacted[["AGE", "COUNT"]])[0],
+        pairwise_pearson(df[["AGE", "COUNT"]])[0],
+    )
+
+
+@pytest.mark.parametrize("storage_backend", ["feather", "arrow_mmap"])
+def test_compact_dtypes_are_stored(df, tmp_path, storage_backend):
+    backend = backends[storage_backend](str(tmp_path))
+    compacted = compact_dtypes(df)
+    backend.put("df", compacted)
+    pd.testing.assert_frame_equal(backend.get("df"), compacted)
@@ -0,0 +1,232 @@
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+import pyarrow.feather as feather
+import pytest
+from psych_dashboard import load_feather
+from psych_dashboard.load_feather import (
+    load,
+    store,
+    loaded_cache,
+    clear_loaded_cache,
+    session_backends,
+    new_session_id,
+    parse_cache_key,
+    load_cached_parse,
+    store_cached_parse,
+)
+from psych_dashboard.storage import frame_to_table
+
+
+@pytest.fixture
+def store_dir(tmp_path, monkeypatch):
+    # Run in the directory of the default session
+    monkeypatch.setattr(load_feather, "storage_directory", str(tmp_path))
+    monkeypatch.setattr(load_feather, "storage_backend", "feather")
+    monkeypatch.setattr(load_feather, "parse_cache_directory", str(tmp_path / "cache"))
+    session_backends.clear()
+    clear_loaded_cache()
+    directory = tmp_path / load_feather.default_session
+    directory.mkdir()
+    monkeypatch.chdir(directory)
+    yield directory
+    session_backends.clear()
+    clear_loaded_cache()
+
+
+@pytest.fixture
+def df():
+    index = pd.MultiIndex.from_product(
+        [["NDAR_A", "NDAR_B"], ["baseline", "followup"]],
+        names=["SUBJECTKEY", "EVENTNAME"],
+    )
+    return pd.DataFrame(
+        {"x": [1.0, 2.0, np.nan, 4.0], "y": [5, 6, 7, 8], "s": list("abcd")},
+        index=index,
+    )
+
+
+def test_load_reuses_unchanged_file(store_dir, df, monkeypatch):
+    store("filtered", df)
+    pd.testing.assert_frame_equal(load("filtered"), df)
+
+    def fail(name):
+        raise AssertionError(f"{name} read again")
+
+    monkeypatch.setattr(load_feather.get_backend(), "get", fail)
+    pd.testing.assert_frame_equal(load("filtered"), df)
+
+
+def test_load_rereads_rewritten_file(store_dir, df):
+    store("filtered", df)
+    load("filtered")
+
+    # A write from another process is only visible through the file signature
+    feather.write_feather(
+        frame_to_table(df.drop(columns="s")), "df_filtered.feather"
+    )
+    stat = os.stat("df_filtered.feather")
+    os.utime("df_filtered.feather", ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000))
+    assert list(load("filtered").columns) == ["x", "y"]
+
+
+def test_changes_to_loaded_frames_do_not_reach_cache(store_dir, df):
+    store("filtered", df)
+    dff = load("filtered")
+    dff.insert(0, "z", 0)
+    dff["x"] = dff["x"] * 10
+    dff.dropna(inplace=True)
+    dff.drop("y", axis=1, inplace=True)
+    dff.reset_index(inplace=True)
+
+    pd.testing.assert_frame_equal(load("filtered"), df)
+
+
+def test_cache_respects_byte_budget(store_dir, df, monkeypatch):
+    monkeypatch.setattr(load_feather, "load_cache_max_bytes", 1)
+    store("filtered", df)
+    pd.testing.assert_frame_equal(load("filtered"), df)
+    assert ("default", "filtered") not in loaded_cache
+
+
+def test_cache_evicts_least_recently_used(store_dir, df, monkeypatch):
+    for name in ["df", "filtered", "parsed"]:
+        store(name, df)
+        load(name)
+    sizes = {key[1]: entry[2] for key, entry in loaded_cache.items()}
+    monkeypatch.setattr(
+        load_feather, "load_cache_max_bytes", sizes["df"] + sizes["parsed"]
+    )
+    clear_loaded_cache()
+
+    load("df")
+    load("filtered")
+    load("df")
+    load("parsed")
+    assert list(loaded_cache) == [("default", "df"), ("default", "parsed")]
+
+
+@pytest.fixture
+def switch_often():
+    # Switch threads as often as possible, to interleave their changes to the cache
+    switch_interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    yield
+    sys.setswitchinterval(switch_interval)
+
+
+def run_threads(target, args):
+    with ThreadPoolExecutor(max_workers=len(args)) as executor:
+        for future in [executor.submit(target, arg) for arg in args]:
+            future.result()
+
+
+def check_cache_bytes():
+    sizes = [entry[2] for entry in loaded_cache.values()]
+    assert load_feather.loaded_cache_bytes == sum(sizes)
+    assert sum(sizes) <= load_feather.load_cache_max_bytes
+
+
+def test_concurrent_loads_and_stores(store_dir, df, monkeypatch, switch_often):
+    # Room for a few of the artifacts, so that the threads evict each other's
+    store("df", df)
+    load("df")
+    monkeypatch.setattr(
+        load_feather, "load_cache_max_bytes", 10 * loaded_cache[("default", "df")][2]
+    )
+
+    def load_and_store(session_id):
+        for i in range(8):
+            for name in ["df", "filtered", "parsed", "cluster"]:
+                store(name, df.head(i % 4 + 1), session_id)
+                assert len(load(name, session_id)) == i % 4 + 1
+
+    run_threads(load_and_store, [new_session_id() for _ in range(8)])
+    check_cache_bytes()
+
+
+def test_concurrent_cache_updates(store_dir, df, monkeypatch, switch_often):
+    nbytes = int(df.memory_usage(index=True, deep=True).sum())
+    monkeypatch.setattr(load_feather, "load_cache_max_bytes", 50 * nbytes)
+
+    def update(thread):
+        for i in range(300):
+            load_feather.cache_loaded((str(thread), str(i % 100)), "signature", df)
+
+    run_threads(update, range(8))
+    check_cache_bytes()
+
+
+def test_projected_load_from_disk_matches_cache(store_dir, df):
+    store("filtered", df)
+    from_disk = load("filtered", columns=["s", "missing", "x"])
+    assert ("default", "filtered") not in loaded_cache
+    pd.testing.assert_frame_equal(from_disk, df[["s", "x"]])
+
+    load("filtered")
+    pd.testing.assert_frame_equal(
+        load("filtered", columns=["s", "missing", "x"]), from_disk
+    )
+
+
+def test_head_load(store_dir, df):
+    # Several record batches, of which only the first is needed
+    table = frame_to_table(df)
+    feather.write_feather(table, "df_filtered.feather", chunksize=1)
+    pd.testing.assert_frame_equal(load("filtered", head=2), df.head(2))
+
+    schema_only = load("filtered", head=0)
+    assert list(schema_only.columns) == list(df.columns)
+    assert list(schema_only.index.names) == list(df.index.names)
+    pd.testing.assert_series_equal(schema_only.dtypes, df.dtypes)
+
+
+def test_sessions_are_separate(store_dir, df):
+    first, second = new_session_id(), new_session_id()
+    store("filtered", df, first)
+    store("filtered", df.head(1), second)
+    pd.testing.assert_frame_equal(load("filtered", first), df)
+    pd.testing.assert_frame_equal(load("filtered", second), df.head(1))
+    assert load("filtered").empty
+
+
+def test_session_id_is_validated(store_dir, df):
+    for session_id in ["../default", "", 1]:
+        with pytest.raises(ValueError):
+            store("filtered", df, session_id)
+
+
+def test_parse_cache(store_dir, df, monkeypatch):
+    key = parse_cache_key("0123", "data.csv", "arrow")
+    assert key != parse_cache_key("0123", "data.tsv", "arrow")
+    assert key != parse_cache_key("0123", "data.csv", "arrow", ["x"])
+    assert parse_cache_key("0123", "a.csv", "arrow", ["x", "y"]) == parse_cache_key(
+        "0123", "b.csv", "arrow", ["y", "x", "x"]
+    )
+
+    first, second = new_session_id(), new_session_id()
+    names = ["parsed", "header"]
+    assert not load_cached_parse(key, names, second)
+    store("parsed", df, first)
+    store("header", pd.DataFrame(list(df.columns), columns=["names"]), first)
+    store_cached_parse(key, names, first)
+
+    assert load_cached_parse(key, names, second)
+    pd.testing.assert_frame_equal(load("parsed", second), df)
+    store("parsed", df.head(1), first)
+    pd.testing.assert_frame_equal(load("parsed", second), df)
+
+    # A cached parse replaces the session's loaded copy, and its size
+    assert (second, "parsed") in loaded_cache
+    assert load_cached_parse(key, names, second)
+    assert (second, "parsed") not in loaded_cache
+    check_cache_bytes()
+
+    # The least recently used files are evicted beyond the quota
+    monkeypatch.setattr(load_feather, "parse_cache_max_bytes", 0)
+    other_key = parse_cache_key("4567", "data.csv", "arrow")
+    store_cached_parse(other_key, names, first)
+    assert not load_cached_parse(key, names, second)
+    assert load_cached_parse(other_key, names, second)
@@ -0,0 +1,122 @@
+import numpy as np
+import pandas as pd
+import pytest
+from psych_dashboard.merge import outer_join, read_data_files, skip_unindexed_files
+from psych_dashboard.parsing import read_data_file
+
+indices = ["SUBJECTKEY", "EVENTNAME"]
+
+# Instruments of a longitudinal release, each with the interview age, and with subject
+# keys written both ways
+instruments = {
+    "abcd_a.txt": (
+        "SUBJECTKEY\tEVENTNAME\tINTERVIEW_AGE\tA1\tA2\n"
+        "NDARINVB\tbaseline\t120\t1\tx\n"
+        "NDAR_INVA\tbaseline\t118\t2\ty\n"
+        "NDAR_INVA\tfollowup\t130\t3\tz\n"
+    ),
+    "abcd_b.csv": (
+        "SUBJECTKEY,EVENTNAME,INTERVIEW_AGE,B1\n"
+        "NDAR_INVC,baseline,121,0.5\n"
+        "NDARINVA,baseline,,1.5\n"
+    ),
+    "abcd_c.csv": (
+        "SUBJECTKEY,EVENTNAME,C1\n"
+        "NDAR_INVA,followup,True\n"
+        "NDAR_INVB,baseline,False\n"
+        "NDAR_INVA,baseline,True\n"
+    ),
+}
+
+
+def expected_join(columns=None):
+    """
+    The instruments joined with pd.concat, with the interview age taken from the
+    first instrument holding it.
+    """
+    frames = []
+    for filename, text in instruments.items():
+        df = read_data_file(text.encode(), filename, engine="pandas")
+        df["SUBJECTKEY"] = df["SUBJECTKEY"].str.replace(
+            "NDARINV", "NDAR_INV", regex=False
+        )
+        frames.append(df.set_index(indices))
+    age = pd.concat([df["INTERVIEW_AGE"] for df in frames[:2]], axis=1)
+    joined = pd.concat(
+        [df.drop(columns="INTERVIEW_AGE", errors="ignore") for df in frames], axis=1
+    ).sort_index()
+    joined.insert(0, "INTERVIEW_AGE", age.bfill(axis=1).iloc[:, 0])
+    if columns is not None:
+        joined = joined[[name for name in joined.columns if name in columns]]
+    return joined
+
+
+@pytest.mark.parametrize("engine", ["arrow", "pandas"])
+@pytest.mark.parametrize("columns", [None, ["SUBJECTKEY", "EVENTNAME", "A2", "B1"]])
+def test_read_data_files_matches_concat(engine, columns):
+    calls = []
+    joined, header, seconds = read_data_files(
+        [text.encode() for text in instruments.values()],
+        list(instruments),
+        indices,
+        engine,
+        columns=columns,
+        workers=2,
+        progress=lambda *args: calls.append(args),
+    )
+
+    assert [name for name in joined.columns[:2]] == indices
+    assert all(joined[name].dtype == "category" for name in indices)
+    pd.testing.assert_frame_equal(
+        joined.astype({name: object for name in indices}).set_index(indices),
+        expected_join(columns),
+        check_dtype=False,
+    )
+    assert header == indices + ["INTERVIEW_AGE", "A1", "A2", "B1", "C1"]
+    assert len(seconds) == 3
+    assert sorted(call[0] for call in calls) == sorted(instruments)
+    assert sorted(call[2] for call in calls) == [1, 2, 3]
+
+
+def test_sources_are_called_as_parsed():
+    joined, _, _ = read_data_files(
+        [lambda text=text: text.encode() for text in instruments.values()],
+        list(instruments),
+        indices,
+    )
+    assert len(joined) == 4
+
+
+def test_outer_join_empties_frames():
+    frames = [
+        pd.DataFrame({"X": [1, 2]}, index=pd.Index(["b", "a"], name="SUBJECTKEY")),
+        pd.DataFrame({"Y": [1.5]}, index=pd.Index([np.nan], name="SUBJECTKEY")),
+    ]
+    joined = outer_join(frames, ["SUBJECTKEY"])
+    assert frames == []
+    assert joined["SUBJECTKEY"].tolist()[:2] == ["a", "b"]
+    assert pd.isna(joined["SUBJECTKEY"].iloc[2])
+    assert joined["X"].tolist()[:2] == [2, 1]
+    assert joined["Y"].tolist()[2] == 1.5
+
+
+def test_missing_index_column():
+    with pytest.raises(ValueError, match="abcd_d.csv"):
+        read_data_files([b"SUBJECTKEY,D1\nNDAR_INVA,1\n"], ["abcd_d.csv"], indices)
+
+
+def test_skip_unindexed_files(tmp_path):
+    paths = []
+    for filename, text in [
+        ("abcd_a.txt", instruments["abcd_a.txt"]),
+        ("filter.txt", "A1\nB1\n"),
+        ("md5.txt", "0123abcd  abcd_a.txt\n"),
+    ]:
+        (tmp_path / filename).write_text(text)
+        paths.append(str(tmp_path / filename))
+
+    # Only the files found in a directory are left out
+    kept, skipped = skip_unindexed_files(paths, set(paths[:2]), indices)
+    assert kept == [paths[0], paths[2]] and skipped == [paths[1]]
+    with pytest.raises(ValueError, match="md5.txt"):
+        read_data_files(kept, kept, indices)
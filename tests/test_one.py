@@ -12,7 +12,7 @@ def test_basic_start(dash_duo):
 
     # 4. host the app locally in a thread, all dash server configs could be
     # passed after the first app argument
-    for name in ['cluster', 'parsed', 'columns', 'df', 'filtered', 'corr', 'pval', 'logs', 'flattened_logs']:
+    for name in ['cluster', 'linkage', 'parsed', 'columns', 'df', 'filtered', 'stats']:
         store(name, None)
     dash_duo.start_server(app)
 
@@ -0,0 +1,75 @@
+import numpy as np
+import pandas as pd
+import pytest
+from psych_dashboard.parsing import read_data_file, read_data_file_header
+
+csv_text = (
+    "SUBJECTKEY,EVENTNAME,AGE,SCORE,SEX,VISIT,EMPTY,FLAG,AGE\n"
+    "NDAR_A,baseline,120,1.5,M,2019-01-02,,True,1\n"
+    "NDAR_B,baseline,,NA,F,2019-02-03 10:00,,False,2\n"
+    "NDAR_C,baseline,118,2,,,,True,3\n"
+)
+
+
+@pytest.mark.parametrize(
+    "filename, text",
+    [
+        ("data.csv", csv_text),
+        ("data.tsv", csv_text.replace(",", "\t")),
+        ("data.txt", csv_text.replace(",", "\t")),
+    ],
+)
+def test_arrow_engine_matches_pandas(filename, text):
+    decoded = text.encode()
+    expected = read_data_file(decoded, filename, engine="pandas")
+    parsed = read_data_file(decoded, filename, engine="arrow", block_size=64)
+    pd.testing.assert_frame_equal(parsed, expected)
+    assert list(parsed.columns)[-1] == "AGE.1"
+    assert parsed["AGE"].dtype == np.float64
+    assert parsed["VISIT"].tolist()[:2] == ["2019-01-02", "2019-02-03 10:00"]
+
+
+def test_whitespace_delimited_text():
+    decoded = b"SUBJECTKEY  EVENTNAME AGE\nNDAR_A baseline   120\n"
+    parsed = read_data_file(decoded, "data.txt", engine="arrow")
+    assert parsed.to_dict("list") == {
+        "SUBJECTKEY": ["NDAR_A"],
+        "EVENTNAME": ["baseline"],
+        "AGE": [120],
+    }
+
+
+def test_unsupported_file():
+    with pytest.raises(NotImplementedError):
+        read_data_file(b"", "data.json")
+
+
+@pytest.mark.parametrize("engine", ["arrow", "pandas"])
+@pytest.mark.parametrize("text", [csv_text, csv_text.replace("FLAG,AGE", "FLAG,ID")])
+def test_parse_selected_columns(engine, text):
+    decoded = text.encode()
+    parsed = read_data_file(
+        decoded, "data.csv", engine, columns=["SCORE", "SUBJECTKEY", "MISSING"]
+    )
+    expected = read_data_file(decoded, "data.csv", "pandas")[["SUBJECTKEY", "SCORE"]]
+    pd.testing.assert_frame_equal(parsed, expected)
+
+
+def test_read_header():
+    header = read_data_file_header(csv_text.encode(), "data.csv")
+    assert header == list(read_data_file(csv_text.encode(), "data.csv").columns)
+    assert header[-1] == "AGE.1"
+
+
+@pytest.mark.parametrize("engine", ["arrow", "pandas"])
+def test_parse_categories(engine):
+    decoded = csv_text.encode()
+    parsed = read_data_file(
+        decoded, "data.csv", engine, categories=["SUBJECTKEY", "SEX", "MISSING"]
+    )
+    assert parsed["SUBJECTKEY"].dtype == "category"
+    assert parsed["SEX"].dtype == "category"
+    expected = read_data_file(decoded, "data.csv", "pandas")
+    pd.testing.assert_frame_equal(
+        parsed.astype({"SUBJECTKEY": object, "SEX": object}), expected
+    )
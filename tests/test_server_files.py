@@ -0,0 +1,63 @@
+import os
+import pytest
+from psych_dashboard.server_files import (
+    list_data_files,
+    list_data_directories,
+    resolve_data_file,
+    resolve_data_files,
+)
+
+
+@pytest.fixture
+def data_dir(tmp_path):
+    data_dir = tmp_path / "data"
+    (data_dir / "release" / ".hidden").mkdir(parents=True)
+    for name in ["a.csv", "release/b.txt", "release/notes.pdf", "release/.hidden/c.csv"]:
+        (data_dir / name).write_text("SUBJECTKEY,EVENTNAME\n")
+    (tmp_path / "secret.csv").write_text("")
+    return data_dir
+
+
+def test_list_data_files(data_dir):
+    assert list_data_files(str(data_dir)) == ["a.csv", os.path.join("release", "b.txt")]
+    assert list_data_files(None) == []
+
+
+def test_resolve_data_file(data_dir, tmp_path):
+    directory = str(data_dir)
+    assert resolve_data_file("a.csv", directory) == os.path.realpath(data_dir / "a.csv")
+    assert resolve_data_file("release/b.txt", directory) == os.path.realpath(
+        data_dir / "release" / "b.txt"
+    )
+
+    secret = str(tmp_path / "secret.csv")
+    (data_dir / "link.csv").symlink_to(secret)
+    for path in ["../secret.csv", secret, "link.csv", "missing.csv"]:
+        with pytest.raises(PermissionError):
+            resolve_data_file(path, directory)
+    with pytest.raises(PermissionError):
+        resolve_data_file("a.csv", None)
+
+    # Files given on the command line are allowed wherever they are
+    assert resolve_data_file(secret, None, [secret]) == os.path.realpath(secret)
+
+
+def test_resolve_data_files(data_dir, tmp_path):
+    directory = str(data_dir)
+    assert list_data_directories(directory) == ["release"]
+    a, b = (
+        os.path.realpath(data_dir / "a.csv"),
+        os.path.realpath(data_dir / "release" / "b.txt"),
+    )
+    # Only the files found by listing a directory are returned as listed
+    assert resolve_data_files(["release", "a.csv"], directory) == ([b, a], {b})
+    assert resolve_data_files([".", "a.csv"], directory) == ([a, b], {b})
+
+    # Files linked to from outside a directory are left out
+    (data_dir / "release" / "link.csv").symlink_to(tmp_path / "secret.csv")
+    assert resolve_data_files(["release"], directory) == ([b], {b})
+    with pytest.raises(PermissionError):
+        resolve_data_files([str(tmp_path)], directory)
+
+    # Directories given on the command line are allowed wherever they are
+    assert resolve_data_files([directory], None, [directory]) == ([a, b], {a, b})
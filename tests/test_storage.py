@@ -0,0 +1,243 @@
+import os
+import time
+import fakeredis
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pytest
+from psych_dashboard.condensed_stats import CondensedStats
+from psych_dashboard.storage import (
+    backends,
+    RedisBackend,
+    MemoryMappedArrowBackend,
+    feather_filenames_dict,
+    frame_to_table,
+    collect_sessions,
+    ipc_compression,
+)
+
+
+@pytest.fixture(params=sorted(backends) + ["redis_uncompressed"])
+def backend(request, tmp_path):
+    if request.param == "redis_uncompressed":
+        # As set by REDIS_COMPRESSION=none
+        return RedisBackend(
+            fakeredis.FakeRedis(server=fakeredis.FakeServer()), compression="none"
+        )
+    if backends[request.param] is RedisBackend:
+        return RedisBackend(fakeredis.FakeRedis(server=fakeredis.FakeServer()))
+    return backends[request.param](str(tmp_path))
+
+
+def artifacts():
+    rng = np.random.default_rng(0)
+    names = [f"var{i}" for i in range(5)]
+    parsed = pd.DataFrame(
+        {
+            "SUBJECTKEY": ["NDAR_A", "NDAR_A", "NDAR_B", "NDAR_C"],
+            "EVENTNAME": ["baseline", "followup", "baseline", "baseline"],
+            "AGE": [120, 132, 118, 125],
+            "SEX": ["M", "M", "F", None],
+            "SCORE": [1.5, np.nan, 2.5, 3.0],
+        }
+    )
+    df = parsed.set_index(["SUBJECTKEY", "EVENTNAME"])
+    corr = np.array([[1, 0.5, -0.2], [0.5, 1, 0.1], [-0.2, 0.1, 1]])
+    return {
+        "cluster": pd.DataFrame(
+            data=[0, 1, 1, 0, 2], index=pd.Index(names), columns=["column_names"]
+        ),
+        "linkage": pd.DataFrame(
+            data=rng.uniform(size=(4, 4)),
+            columns=["left", "right", "distance", "size"],
+        ),
+        "parsed": parsed,
+        "header": pd.DataFrame(list(parsed.columns), columns=["names"]),
+        "columns": pd.DataFrame(["AGE", "SUBJECTKEY", "EVENTNAME"], columns=["names"]),
+        "df": df,
+        "filtered": df[["AGE", "SCORE"]],
+        "stats": CondensedStats.from_square(["a", "b", "c"], corr, 1 - np.abs(corr)),
+    }
+
+
+def assert_artifact_equal(loaded, expected):
+    if isinstance(expected, CondensedStats):
+        assert list(loaded.columns) == list(expected.columns)
+        np.testing.assert_array_equal(loaded.corr, expected.corr)
+        np.testing.assert_array_equal(loaded.logs, expected.logs)
+    else:
+        pd.testing.assert_frame_equal(loaded, expected)
+
+
+@pytest.mark.parametrize("name", sorted(feather_filenames_dict))
+def test_every_artifact_round_trips(backend, name):
+    artifact = artifacts()[name]
+    backend.put(name, artifact)
+    assert_artifact_equal(backend.get(name), artifact)
+
+
+def test_missing_artifact(backend):
+    assert not backend.exists("df")
+    assert backend.size("df") == 0
+    assert backend.signature("df") is None
+    assert backend.get("df").empty
+    assert len(backend.get("stats")) == 0
+
+
+def test_put_replaces_and_invalidate_removes(backend):
+    df = artifacts()["df"]
+    backend.put("df", df)
+    assert backend.exists("df")
+    assert backend.size("df") > 0
+    signature = backend.signature("df")
+
+    backend.put("df", df.head(2))
+    assert_artifact_equal(backend.get("df"), df.head(2))
+    if signature is not None:
+        assert backend.signature("df") != signature
+
+    backend.invalidate("df")
+    assert not backend.exists("df")
+    assert backend.get("df").empty
+    backend.invalidate("df")
+
+
+def test_link(backend, tmp_path):
+    if isinstance(backend, RedisBackend):
+        source = RedisBackend(backend.client, prefix="source:")
+    else:
+        source = type(backend)(str(tmp_path / "source"))
+    with pytest.raises(FileNotFoundError):
+        backend.link(source, "parsed")
+
+    parsed = artifacts()["parsed"]
+    source.put("parsed", parsed)
+    backend.link(source, "parsed")
+    assert_artifact_equal(backend.get("parsed"), parsed)
+    if not isinstance(backend, RedisBackend):
+        assert os.path.samefile(backend.path("parsed"), source.path("parsed"))
+
+    # Storing the artifact again in either backend leaves the other unchanged
+    source.put("parsed", parsed.head(1))
+    assert_artifact_equal(backend.get("parsed"), parsed)
+
+
+def test_projection(backend):
+    df = artifacts()["df"]
+    backend.put("df", df)
+    assert_artifact_equal(
+        backend.get("df", columns=["SCORE", "missing", "AGE"]), df[["SCORE", "AGE"]]
+    )
+    assert_artifact_equal(backend.get("df", head=2), df.head(2))
+    schema_only = backend.get("df", columns=["SEX"], head=0)
+    assert len(schema_only) == 0
+    assert list(schema_only.index.names) == list(df.index.names)
+    pd.testing.assert_series_equal(schema_only.dtypes, df[["SEX"]].dtypes)
+
+
+def test_memory_mapped_loads_without_copy(tmp_path):
+    backend = MemoryMappedArrowBackend(str(tmp_path))
+    df = artifacts()["filtered"]
+    backend.put("filtered", df)
+    dff = backend.get("filtered")
+    pd.testing.assert_frame_equal(dff, df)
+    # Numeric columns refer to the memory-mapped file rather than a copy
+    assert not dff["SCORE"].to_numpy().flags.writeable
+
+    # Replacing the file leaves the previously loaded DF valid
+    backend.put("filtered", df.drop(columns="SCORE"))
+    pd.testing.assert_frame_equal(dff, df)
+    assert list(backend.get("filtered").columns) == ["AGE"]
+
+
+def test_multiindex_is_rebuilt_from_codes(tmp_path):
+    index = pd.MultiIndex.from_arrays(
+        [["NDAR_B", "NDAR_A", "NDAR_B"], ["baseline", np.nan, "followup"]],
+        names=["SUBJECTKEY", "EVENTNAME"],
+    )
+    df = pd.DataFrame({"x": [1.0, 2.0, 3.0]}, index=index)
+    table = frame_to_table(df)
+    assert pa.types.is_dictionary(table.schema.field("SUBJECTKEY").type)
+
+    backend = backends["feather"](str(tmp_path))
+    backend.put("df", df)
+    loaded = backend.get("df")
+    pd.testing.assert_frame_equal(loaded, df)
+    assert loaded.index.is_unique
+    assert loaded.loc[("NDAR_B", "followup"), "x"] == 3.0
+
+
+def test_redis_chunks_by_column_group():
+    client = fakeredis.FakeRedis(server=fakeredis.FakeServer())
+    # Small enough that each of the 10 columns is in a group of its own
+    backend = RedisBackend(client, compression="zstd", chunk_bytes=100)
+    index = pd.MultiIndex.from_product(
+        [[f"NDAR_{i}" for i in range(10)], ["baseline", "followup"]],
+        names=["SUBJECTKEY", "EVENTNAME"],
+    )
+    df = pd.DataFrame(
+        np.arange(200, dtype=float).reshape(20, 10),
+        index=index,
+        columns=[f"var{i}" for i in range(10)],
+    )
+    backend.put("df", df)
+    assert len(client.keys("psych_dashboard:df:*")) == 1 + 1 + 10
+    pd.testing.assert_frame_equal(backend.get("df"), df)
+
+    # Only the index and the groups of the requested columns are fetched
+    fetched = []
+    mget = client.mget
+    client.mget = lambda keys: fetched.extend(keys) or mget(keys)
+    pd.testing.assert_frame_equal(
+        backend.get("df", columns=["var7", "var2"]), df[["var7", "var2"]]
+    )
+    assert len(fetched) == 3
+
+    # A load of no rows only fetches the index, and makes the columns from the schema
+    fetched.clear()
+    empty = backend.get("df", head=0)
+    pd.testing.assert_frame_equal(empty, df.head(0))
+    assert len(fetched) == 1
+    fetched.clear()
+    empty = backend.get("df", columns=["var7", "var2"], head=0)
+    pd.testing.assert_frame_equal(empty, df[["var7", "var2"]].head(0))
+    assert len(fetched) == 1
+
+    # Storing again replaces the chunks of the previous generation
+    generation = backend.signature("df")
+    backend.put("df", df.head(4))
+    assert not client.keys(f"psych_dashboard:df:{generation}:*")
+    pd.testing.assert_frame_equal(backend.get("df"), df.head(4))
+    backend.invalidate("df")
+    assert client.keys("psych_dashboard:df:*") == []
+
+
+def test_ipc_compression():
+    assert ipc_compression("LZ4") == "lz4"
+    assert ipc_compression("zstd") == "zstd"
+    for name in [None, "", "none", "None"]:
+        assert ipc_compression(name) is None
+    for name in ["snappy", "gzip2"]:
+        with pytest.raises(ValueError, match="Unsupported compression"):
+            ipc_compression(name)
+
+
+def test_collect_sessions_by_age_and_quota(tmp_path):
+    df = artifacts()["df"]
+    now = time.time()
+    for i, session_id in enumerate(["old", "lru", "recent", "current"]):
+        backend = backends["feather"](str(tmp_path / session_id))
+        backend.put("df", df)
+        # old is past the TTL; the others are used in turn
+        last_used = now - 1000 if session_id == "old" else now - 30 + i
+        os.utime(backend.directory, (last_used, last_used))
+    size = backends["feather"](str(tmp_path / "recent")).size("df")
+
+    assert collect_sessions(str(tmp_path), 100, 10 * size) == ["old"]
+    # The current session is kept even though it is over the quota
+    assert collect_sessions(str(tmp_path), 100, size, keep=["current"]) == [
+        "lru",
+        "recent",
+    ]
+    assert sorted(os.listdir(tmp_path)) == ["current"]
+    assert collect_sessions(str(tmp_path / "missing"), 100, size) == []
@@ -0,0 +1,53 @@
+import numpy as np
+import pandas as pd
+import pytest
+from psych_dashboard.subject_index import set_subject_index, standardise_subjectkeys
+
+indices = ["SUBJECTKEY", "EVENTNAME"]
+
+
+def test_standardise_subjectkeys():
+    keys = pd.Index(["NDAR_INVA", "NDARINVB", "NDAR", "ÉÉÉÉX"], name="SUBJECTKEY")
+    pd.testing.assert_index_equal(
+        standardise_subjectkeys(keys),
+        pd.Index(["NDAR_INVA", "NDAR_INVB", "NDAR", "ÉÉÉÉ_X"], name="SUBJECTKEY"),
+    )
+    standard = keys[:1]
+    assert standardise_subjectkeys(standard) is standard
+
+
+@pytest.mark.parametrize("dtype", [object, "category"])
+def test_set_subject_index_matches_set_index(dtype):
+    df = pd.DataFrame(
+        {
+            "AGE": [120, 132, 118, 125, 130],
+            "SUBJECTKEY": ["NDARINVB", "NDAR_INVB", "NDAR_INVA", "NDARINVC", None],
+            "EVENTNAME": ["baseline", "followup", "baseline", "baseline", "followup"],
+        }
+    ).astype({"SUBJECTKEY": dtype, "EVENTNAME": dtype})
+    expected = df.astype({"SUBJECTKEY": object, "EVENTNAME": object})
+    expected["SUBJECTKEY"] = ["NDAR_INVB", "NDAR_INVB", "NDAR_INVA", "NDAR_INVC", None]
+    expected.set_index(indices, inplace=True, verify_integrity=True)
+
+    set_subject_index(df, indices)
+    pd.testing.assert_frame_equal(df, expected)
+    pd.testing.assert_index_equal(df.index.levels[0], expected.index.levels[0])
+
+
+def test_duplicates_after_standardising():
+    df = pd.DataFrame(
+        {
+            "SUBJECTKEY": ["NDARINVA", "NDAR_INVA", "NDAR_INVB"],
+            "EVENTNAME": ["baseline", "baseline", "baseline"],
+            "AGE": [1, 2, 3],
+        }
+    )
+    with pytest.raises(ValueError, match="NDAR_INVA"):
+        set_subject_index(df, indices)
+
+
+def test_single_index_column():
+    df = pd.DataFrame({"SUBJECTKEY": ["NDARINVB", np.nan], "AGE": [1, 2]})
+    set_subject_index(df, ["SUBJECTKEY"])
+    assert df.index.tolist()[0] == "NDAR_INVB"
+    assert pd.isna(df.index[1])
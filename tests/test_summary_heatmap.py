@@ -0,0 +1,124 @@
+import numpy as np
+import pandas as pd
+from sklearn.cluster import AgglomerativeClustering
+from psych_dashboard.correlation import pairwise_pearson
+from psych_dashboard.correlation_cache import CorrelationCache
+from psych_dashboard.condensed_stats import CondensedStats
+from psych_dashboard.summary.summary_heatmap import (
+    bin_matrix,
+    heatmap_figure,
+    zoomed_window,
+    linkage_tree,
+    cut_clusters,
+    recalculate_corr_etc,
+)
+
+
+def same_partition(a, b):
+    # Cluster numbering is arbitrary, so compare which columns are grouped together
+    return np.array_equal(
+        np.equal.outer(a, a),
+        np.equal.outer(b, b),
+    )
+
+
+def test_cut_linkage_tree_matches_agglomerative_clustering():
+    rng = np.random.default_rng(0)
+    data = rng.normal(size=(50, 12))
+    data[:, 1:4] += data[:, [0]]
+    data[:, 6:9] += 2 * data[:, [5]]
+    corr = np.corrcoef(data, rowvar=False)
+
+    tree = linkage_tree(corr)
+    for n_clusters in range(1, 13):
+        expected = AgglomerativeClustering(
+            n_clusters=n_clusters, linkage="ward"
+        ).fit_predict(corr)
+        assert same_partition(cut_clusters(tree, n_clusters, 12), expected)
+
+    # More clusters than columns gives one cluster per column
+    assert len(set(cut_clusters(tree, 20, 12))) == 12
+
+
+def test_recalculate_corr_etc_reuses_cached_columns(tmp_path):
+    rng = np.random.default_rng(0)
+    dff = pd.DataFrame(rng.normal(size=(60, 6)), columns=list("abcdef"))
+    dff.iloc[::4, 2] = np.nan
+    path = str(tmp_path / "cache.feather")
+
+    recalculate_corr_etc(list("abcd"), dff, CorrelationCache(path, 100))
+    corr, pvalues = recalculate_corr_etc(
+        list("fbed"), dff, CorrelationCache(path, 100)
+    )
+
+    # The cached columns come first
+    assert list(corr.index) == ["b", "d", "f", "e"]
+    assert list(corr.columns) == list(corr.index)
+    expected_corr, _, expected_pval = pairwise_pearson(dff[list(corr.index)])
+    np.testing.assert_allclose(corr.to_numpy(), expected_corr, atol=1e-12)
+    np.testing.assert_allclose(pvalues.to_numpy(), expected_pval, rtol=1e-8)
+    assert len(CorrelationCache(path, 100)) == 6 + 5
+
+
+def test_bin_matrix_pads_partial_blocks():
+    z = np.arange(20, dtype=float).reshape(4, 5)
+    z[0, 0] = np.nan
+    binned = bin_matrix(z, 2, 2, np.nanmean)
+    assert binned.shape == (2, 3)
+    np.testing.assert_allclose(binned[0, 0], np.mean([1, 5, 6]))
+    np.testing.assert_allclose(binned[:, 2], [np.mean([4, 9]), np.mean([14, 19])])
+
+
+def test_zoomed_window():
+    # Categorical axes count from the first position shown
+    zoom = {"xaxis.range[0]": 1.6, "xaxis.range[1]": 4.2}
+    assert zoomed_window(zoom, "xaxis", [100, 300], 100, 1000) == [102, 105]
+    reset = {"xaxis.autorange": True}
+    assert zoomed_window(reset, "xaxis", [100, 300], 100, 1000) == [0, 1000]
+    # The other axis is unchanged, and ranges are clipped to the matrix
+    zoom = {"yaxis.range": [-50, 20]}
+    assert zoomed_window(zoom, "xaxis", [100, 300], 100, 1000) == [100, 300]
+    assert zoomed_window(zoom, "yaxis", [0, 999], 0, 999) == [0, 21]
+
+
+def test_heatmap_figure_bins_large_matrices(monkeypatch):
+    monkeypatch.setattr(
+        "psych_dashboard.summary.summary_heatmap.heatmap_max_columns", 10
+    )
+    monkeypatch.setattr("psych_dashboard.summary.summary_heatmap.heatmap_bins", 5)
+    rng = np.random.default_rng(0)
+    n = 30
+    corr = np.corrcoef(rng.normal(size=(50, n)), rowvar=False)
+    columns = [f"c{i:02d}" for i in range(n)]
+    stats = CondensedStats.from_square(columns, corr, np.full((n, n), 0.5))
+    clx = np.zeros(n, dtype=int)
+
+    # Only the region shown is taken from the condensed statistics
+    monkeypatch.setattr(CondensedStats, "square", None)
+    monkeypatch.setattr(CondensedStats, "subset", None)
+
+    fig, view = heatmap_figure(stats, clx)
+    assert np.shape(fig.data[0].z) == (5, 5)
+    upper = np.where(np.triu(np.ones((n, n), bool), 1), corr, np.nan)
+    np.testing.assert_allclose(
+        np.array(fig.data[0].z, dtype=float),
+        bin_matrix(np.fliplr(upper)[: n - 1], 6, 6, np.nanmean),
+        rtol=1e-5,
+    )
+    min_pval = np.array(fig.data[0].customdata, dtype=float)
+    # Bins entirely below the diagonal are empty
+    assert (np.isnan(min_pval) == np.isnan(fig.data[0].z)).all()
+    np.testing.assert_allclose(min_pval[~np.isnan(min_pval)], 0.5)
+    assert view["x"] == [0, n] and view["y"] == [0, n - 1]
+    assert view["offset"] == [0, 0]
+
+    # A zoomed region small enough is shown at full resolution
+    fig, view = heatmap_figure(stats, clx, [20, 30], [0, 8])
+    assert np.shape(fig.data[0].z) == (8, 10)
+    assert list(fig.data[0].y) == columns[:8]
+    assert list(fig.data[0].x) == columns[::-1][20:30]
+    # x position 25 is column 4; row 3 against column 0 is below the diagonal
+    np.testing.assert_allclose(fig.data[0].z[0][5], corr[0, 4], rtol=1e-6)
+    np.testing.assert_allclose(fig.data[0].customdata[0][5], 0.5, rtol=1e-6)
+    assert np.isnan(fig.data[0].z[3][9])
+    assert view["offset"] == [20, 0]